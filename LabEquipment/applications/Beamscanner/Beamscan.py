@@ -19,6 +19,8 @@ bs.readUSE()
 bs.verbose = False
 bs.plotCenter = True
 bs.centerBeforeScan = False
+# Show the map as it is scanned in a separate viewer process
+bs.liveView = False
 
 # Establishes instrument communication
 rm = bs.initGPIB(backend="@ni")
@@ -35,6 +37,10 @@ if len(sys.argv) > 1:
 else:
     cmd = None
 
+# The map is kept on disk here as it is scanned, so that an interrupted scan
+# can be continued with the Resume command
+mapFile = os.path.splitext(bs.save_name)[0] + ".map"
+
 if cmd == "Move":
     x = float(sys.argv[2])*bs.conv_factor
     y = float(sys.argv[3])*bs.conv_factor
@@ -59,16 +65,23 @@ else: # cmd == None or Center
 
     if cmd == "Center":
         bs.findCenterMM()
+        bs.endLive()
         bs.moveToCenter()
     else:
-        print("Preparing for scan ...")
-
-        bs.initScan(bs.Range)
-        # Scanning
-        print("\nCollecting data...")
-        bs.scan()
+        if cmd == "Resume":
+            print("Resuming scan from {:s} ...".format(mapFile))
+            print("\nCollecting data...")
+            bs.resumeScan(mapFile)
+        else:
+            print("Preparing for scan ...")
+
+            bs.initScan(bs.Range, mapFile=mapFile)
+            # Scanning
+            print("\nCollecting data...")
+            bs.scan()
         # Finished scanning
         print("\nExecution time: " + str(time.time() - bs.start_time))
+        bs.endLive()
 
         bs.moveToCenter()
 
@@ -12,13 +12,18 @@ import sys
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
-from scipy.interpolate import griddata
 import numpy.polynomial.polynomial as poly
 
 import LabEquipment.drivers.Instrument.HP8508A as HP8508A
 import LabEquipment.drivers.Instrument.HP83630A as HP83630A
 import LabEquipment.drivers.Instrument.HMCT2240 as HMCT2240
 import LabEquipment.drivers.Instrument.MSL as MSL
+import LabEquipment.drivers.Instrument.Instrument as Instrument
+import LabEquipment.drivers.Instrument.BusScheduler as BusScheduler
+from LabEquipment.lib import dataFile
+from LabEquipment.lib import mapStore
+from LabEquipment.lib import beamMap
+from LabEquipment.lib import liveView
 
 class Beamscanner:
     def __init__(self):
@@ -33,10 +38,37 @@ class Beamscanner:
         self.verbose = False
         self.plotCenter = True
         self.scan_type = "raster"
+        # Read the VVM and the MSL positions concurrently where they are on different buses
+        self.concurrentIO = True
+        self.scheduler = None
+        # Fly scan settings - VVM readings per grid step and between position reads
+        self.flyOversample = 2
+        self.flyPosInterval = 5
+        # Time from the middle of the VVM's averaging window for a free run reading to the query for it
+        self.flySampleDelay = 0.0
+        # Output file format - "csv", "npz" or "hdf5", or None to select it from the save_name extension
+        self.saveFormat = None
+        self.saveCompress = True
+        # MapStore holding the map being scanned on disk, if initScan was given a mapFile
+        self.store = None
+        # Fields of the map, in the order of the MapStore fields
+        self.mapFields = [("x", float), ("y", float), ("trans", complex), ("cal", complex), ("time", float)]
+        # beamMap.MapGrid of the map positions for contour plots, made again when they change
+        self.mapGrid = None
+        # Show the map as it is scanned, in a viewer running in a separate process
+        self.liveView = False
+        self.liveFps = 10
+        self.live = None
+        self._liveKey = None
 
     def initTime(self):
-        # Assigns start time
-        self.start_time = time.time()
+        # Assigns start time, keeping that of a resumed scan
+        if self.store != None and "start_time" in self.store.attrs:
+            self.start_time = self.store.attrs["start_time"]
+        else:
+            self.start_time = time.time()
+            if self.store != None:
+                self.store.setAttr("start_time", self.start_time)
         print("Starting...\n")
 
     def readUSE(self, useFile=None):
@@ -75,6 +107,10 @@ class Beamscanner:
         self.accel = float(lines[18].split("!")[0])
         self.pos_x_center = self.searchCenter[0]
         self.pos_y_center = self.searchCenter[1]
+        try:
+            self.scan_type = lines[19].split("!")[0].strip()
+        except IndexError:
+            pass
 
         self.setStep(self.Res)
         self.calcFreqs()
@@ -116,9 +152,11 @@ class Beamscanner:
 
         see http://askubuntu.com/questions/705409/udev-rule-to-run-gpib-config and
         https://github.com/pyvisa/pyvisa/issues/212
+
+        backend "@sim" uses the simulated instruments in drivers/Instrument/VisaSim.py
         """
         # Lists available resources
-        rm = visa.ResourceManager(backend)
+        rm = Instrument.ResourceManager(backend)
         try:
             lr = rm.list_resources()
         except ValueError:
@@ -234,12 +272,17 @@ class Beamscanner:
         # Moves MSL's to center position and sets new home position
         self.msl_x.moveAbs(int(self.pos_x_center))
         self.msl_y.moveAbs(int(self.pos_y_center))
-        self.msl_x.hold()
-        self.msl_y.hold()
+        MSL.holdAll(self.msl_x, self.msl_y)
         #self.msl_x.zero()
         #self.msl_y.zero()
 
-    def initScan(self, Range=None):
+    def initScan(self, Range=None, mapFile=None):
+        """Set up the raster scan grid over Range, and move to its start.
+
+        If mapFile is given, the map is kept in a MapStore in the directory
+        mapFile as it is scanned, rather than in memory, so that maps of any
+        size can be scanned, and an interrupted scan can be continued with
+        resumeScan()"""
         if Range==None:
             Range = self.Range
 
@@ -253,26 +296,111 @@ class Beamscanner:
         # Moves to minimum position in range to begin scan
         self.msl_x.moveAbs(self.pos_x_min)
         self.msl_y.moveAbs(self.pos_y_min)
-        self.msl_x.hold()
-        self.msl_y.hold()
+        MSL.holdAll(self.msl_x, self.msl_y)
 
         # Create numpy arrays to store the data
         x = np.arange(self.pos_x_min, self.pos_x_max+self.Step, self.Step, dtype=float)
         y = np.arange(self.pos_y_min, self.pos_y_max+self.Step, self.Step, dtype=float)
-        self.xVals, self.yVals = np.meshgrid(x, y)
-
+        shape = (len(y), len(x))
+
+        self.closeStore()
+        if mapFile != None:
+            # Stop any viewer of the last map before its files can be replaced
+            self.endLive()
+            self.store = mapStore.MapStore.create(mapFile, shape, self.mapFields, self.getAttributes())
+            self.attachStore()
+        else:
+            self.xVals = np.empty(shape)
+            self.yVals = np.empty(shape)
+            self.trans = np.zeros(shape, dtype=complex)
+            self.calVals = np.zeros(shape, dtype=complex)
+            self.time = np.zeros(shape)
+        self.xVals[:] = x[np.newaxis,:]
+        self.yVals[:] = y[:,np.newaxis]
 
         # reverse every other line in self.xVals
         self.xVals[1::2,:] = self.xVals[1::2,::-1]
 
-        self.time = np.zeros_like(self.xVals, dtype=float)
-        self.trans = np.zeros_like(self.xVals, dtype=complex)
-        self.calVals = np.zeros_like(self.trans, dtype=complex)
+        self.startLive(mapFile)
 
         # VVM ready to begin collecting data
         self.vvm.trigger()
 
 
+    def startLive(self, mapFile=None):
+        """Show the map in a live viewer running in a separate process, if
+        liveView is set.  The viewer reads the MapStore in mapFile if it is given.
+        Otherwise the map positions and transmissions are moved into shared
+        memory that the viewer reads as they are filled.
+
+        The viewer of a map in memory is kept for later scans of the same shape,
+        such as those of findCenter().  See lib/liveView.py"""
+        if not self.liveView:
+            return
+        key = (mapFile, self.xVals.shape)
+        if self.live != None and mapFile == None and key == self._liveKey:
+            self.live["x"][:] = self.xVals
+            self.live["y"][:] = self.yVals
+            self.live["trans"][:] = self.trans
+        else:
+            self.endLive()
+            title = "Beamscanner {:s}".format(self.save_name)
+            if mapFile != None:
+                self.live = liveView.LiveView("map", store=mapFile, fps=self.liveFps, title=title,
+                                              scale=1.0/self.conv_factor)
+            else:
+                self.live = liveView.LiveView("map", [("x", self.xVals), ("y", self.yVals), ("trans", self.trans)],
+                                              fps=self.liveFps, title=title, scale=1.0/self.conv_factor)
+            self._liveKey = key
+        if mapFile == None:
+            self.xVals, self.yVals, self.trans = self.live["x"], self.live["y"], self.live["trans"]
+
+    def endLive(self):
+        """Ends the live view, if there is one, moving the map out of shared
+        memory.  The viewer keeps showing the map until it is closed"""
+        if self.live == None:
+            return
+        for attr, name in (("xVals", "x"), ("yVals", "y"), ("trans", "trans")):
+            if name in self.live.names and getattr(self, attr) is self.live[name]:
+                setattr(self, attr, np.array(getattr(self, attr)))
+        self.live.close()
+        self.live = None
+        self._liveKey = None
+
+    def attachStore(self):
+        """Use the fields of the MapStore in self.store as the map arrays"""
+        self.xVals, self.yVals, self.trans, self.calVals, self.time = [self.store[name] for name, dtype in self.mapFields]
+
+    def closeStore(self):
+        """Flush the MapStore to disk and stop using it for new scans, if there
+        is one.  The map arrays still refer to the stored map"""
+        if self.store == None:
+            return
+        self.store.flush()
+        self.store = None
+
+    def resumeScan(self, mapFile, calibrate=True):
+        """Continue the scan stored in the MapStore in the directory mapFile,
+        measuring only the points that weren't measured before it stopped.
+
+        The scan centre, range and type are restored from the store, but the
+        instruments must be set up as for the original scan"""
+        self.closeStore()
+        self.endLive()
+        self.store = mapStore.MapStore.open(mapFile)
+        self.attachStore()
+        self.startLive(mapFile)
+
+        settings = self.store.attrs.get("config", {})
+        for name in ("pos_x_center", "pos_y_center", "Range", "scan_type"):
+            if settings.get(name) != None:
+                setattr(self, name, settings[name])
+        self.setRange(self.Range)
+
+        print("Resuming scan with {:d} of {:d} points to measure".format(len(self.store.missing()), self.xVals.size))
+        self.vvm.trigger()
+        return self.scan(calibrate)
+
     def getTransmission(self):
         """Get the transmission from the VVM.  Loop if necessary to avoid
         one-off time out errors"""
@@ -295,6 +423,17 @@ class Beamscanner:
         return trans
 
 
+    def getPointData(self):
+        """Return the X and Y positions and the transmission at the current point.
+
+        If there is a scheduler, the VVM and the MSLs are read concurrently"""
+        if self.scheduler == None:
+            return self.msl_x.getPos(), self.msl_y.getPos(), self.getTransmission()
+        trans = self.scheduler.submit(self.vvm, self.getTransmission)
+        x = self.scheduler.submit(self.msl_x, self.msl_x.getPos)
+        y = self.scheduler.submit(self.msl_y, self.msl_y.getPos)
+        return BusScheduler.gather(x, y, trans)
+
     def scan(self, calibrate=True):
         """Scan over the meshgrids of the stored xVals and yVals, and record data
         in trans.
@@ -302,8 +441,25 @@ class Beamscanner:
         initScan will set up the xVals and yVals array as a regular raster scan grid.
         however, this methods will work with any scan pattern defined in those variables.
 
+        If concurrentIO is True, instruments on different buses are read concurrently
+        through a BusScheduler.
+
         If calibrate is True, the transmission at pos_x_center, pos_y_center will be
-        recorded every self.calInterval points and stored in self.calVals"""
+        recorded every self.calInterval points and stored in self.calVals
+
+        If scan_type is "fly", runs flyScan() instead"""
+        if self.concurrentIO and self.scheduler == None:
+            # Run the scan with a scheduler for the instrument I/O
+            self.scheduler = BusScheduler.BusScheduler()
+            try:
+                return self.scan(calibrate)
+            finally:
+                self.scheduler.shutdown()
+                self.scheduler = None
+
+        if self.scan_type == "fly":
+            return self.flyScan(calibrate)
+
         self.initTime()
 
         if self.CalInterval <= 0:
@@ -315,10 +471,15 @@ class Beamscanner:
             self.moveToCenter()
             lastCalValue = self.getTransmission()
 
+        rowLength = self.xVals.shape[1]
         for i, x in enumerate(self.xVals.ravel()):
             k = i
             y = self.yVals.ravel()[k]
 
+            # Skip points already measured before a resumed scan
+            if self.store != None and self.store.isDone(k):
+                continue
+
             if calibrate:
                 if abs(x-self.pos_x_center) < self.Step:
                     self.moveToCenter()
@@ -329,78 +490,232 @@ class Beamscanner:
             # Move to position
             self.msl_x.moveAbs(x)
             self.msl_y.moveAbs(y)
-            self.msl_x.hold()
-            self.msl_y.hold()
+            MSL.holdAll(self.msl_x, self.msl_y)
 
             # Gets positions and transmissions from VVM and loops in case of error
-            self.xVals.ravel()[k] = self.msl_x.getPos()
-            self.yVals.ravel()[k] = self.msl_y.getPos()
-            self.trans.ravel()[k] = self.getTransmission()
+            self.xVals.ravel()[k], self.yVals.ravel()[k], self.trans.ravel()[k] = self.getPointData()
             self.calVals.ravel()[k] = lastCalValue
             self.time.ravel()[k] = time.time() - self.start_time
-            if self.verbose or (i % 10) == 0:
+            if self.store != None:
+                self.store.markDone(k)
+                if (k + 1) % rowLength == 0:
+                    self.store.flush()
+            if self.verbose or (self.live == None and i % 10 == 0):
                 print("    k: {:d}  X: {:.3f}, Y: {:.3f}, {:f} dB, {:f} deg".format(k, self.xVals.ravel()[k]/self.conv_factor, self.yVals.ravel()[k]/self.conv_factor, 20*np.log10(np.abs(self.trans.ravel()[k])), np.degrees(np.angle(self.trans.ravel()[k]))))
 
+    def flyVelocity(self, readings=3):
+        """Choose the X velocity for a fly scan, by timing free run VVM readings, so
+        that there are flyOversample readings per grid step.  Limited to between 1 and
+        self.velocity"""
+        t0 = time.monotonic()
+        for i in range(readings):
+            self.getTransmission()
+        samplePeriod = (time.monotonic() - t0)/readings
+        samplePeriod *= 1.0 + 1.0/self.flyPosInterval
+        return max(int(min(self.velocity, self.Step/(self.flyOversample*samplePeriod))), 1)
+
+    def flyScan(self, calibrate=True):
+        """Scan the raster grid set up by initScan, moving the X stage along each
+        row at constant velocity while reading the VVM in free run.
+
+        Each reading is timestamped and its position found from the X stage's
+        motion profile, corrected by a line fitted to the positions read from the
+        stage during the row.  The readings are then interpolated onto xVals.
+
+        If calibrate is True, the transmission at pos_x_center, pos_y_center will be
+        recorded before every row that starts within self.calInterval points of the
+        last calibration and stored in self.calVals"""
+        self.initTime()
+        # Converts time.monotonic() timestamps to times since start_time
+        self._flyTimeOffset = time.time() - time.monotonic() - self.start_time
+
+        if self.CalInterval <= 0:
+            calibrate = False
+        calRows = max(1, self.CalInterval // self.xVals.shape[1])
+
+        trigger = self.vvm.triggersource
+        self.vvm.setTriggerFree()
+        try:
+            velocity = self.flyVelocity()
+            print("Fly scan at X velocity {:d} steps/s".format(velocity))
+
+            lastCalValue = complex(0.,0.)
+            for j in range(self.xVals.shape[0]):
+                # Skip rows already measured before a resumed scan
+                if self.store != None and self.store.isDone((j, slice(None))):
+                    continue
+
+                if calibrate and (j % calRows == 0 or lastCalValue == 0):
+                    # flyRow() leaves the X stage at the fly velocity
+                    self.msl_x.setVelMax(self.velocity)
+                    self.moveToCenter()
+                    lastCalValue = self.getTransmission()
+
+                self.flyRow(j, velocity)
+                self.calVals[j] = lastCalValue
+                if self.store != None:
+                    self.store.markDone((j, slice(None)))
+                    self.store.flush()
+
+                if self.verbose or (self.live == None and j % 2 == 0):
+                    k = self.xVals.shape[1]//2
+                    print("    row: {:d}  Y: {:.3f}, center {:f} dB, {:f} deg".format(j, self.yVals[j,k]/self.conv_factor, 20*np.log10(np.abs(self.trans[j,k])), np.degrees(np.angle(self.trans[j,k]))))
+        finally:
+            self.msl_x.setVelMax(self.velocity)
+            if trigger != "UNKNOWN":
+                self.vvm.setTrigger(trigger)
+
+    def _timedPos(self):
+        """Return the time at the middle of an X position read and the position"""
+        t = time.monotonic()
+        pos = self.msl_x.getPos()
+        return (t + time.monotonic())/2, pos
+
+    def flyRow(self, j, velocity):
+        """Measure row j of the scan grid on the fly, at X velocity steps/s"""
+        xs = self.xVals[j]
+        direction = 1 if xs[-1] >= xs[0] else -1
+
+        # Run up and run out far enough to be at velocity over the whole row
+        runup = (velocity**2)/(2.0*self.accel) + self.Step/2
+        start = int(xs[0] - direction*runup)
+        end = int(xs[-1] + direction*runup)
+
+        # Move to the start of the row at the normal velocity
+        self.msl_x.setVelMax(self.velocity)
+        self.msl_x.moveAbs(start)
+        self.msl_y.moveAbs(self.yVals[j,0])
+        MSL.holdAll(self.msl_x, self.msl_y)
+        start = self.msl_x.getPos()
+        y = self.msl_y.getPos()
+
+        if self.verbose:
+            print("Flying X: {:.1f} to {:.1f}, Y:{:.1f}".format(start, end, y))
+
+        self.msl_x.setVelMax(velocity)
+        profile = self.msl_x.moveProfile(end - start)
+        t0 = time.monotonic()
+        self.msl_x.moveAbs(end)
+        t0 = (t0 + time.monotonic())/2
+        tEnd = t0 + profile.duration
+
+        posTimes = []
+        positions = []
+        sampleTimes = []
+        samples = []
+        while time.monotonic() < tEnd or not samples:
+            pos = None
+            if len(samples) % self.flyPosInterval == 0:
+                if self.scheduler == None:
+                    pos = self._timedPos()
+                else:
+                    pos = self.scheduler.submit(self.msl_x, self._timedPos)
+            sampleTimes.append(time.monotonic() - self.flySampleDelay)
+            samples.append(self.getTransmission())
+            if pos != None:
+                if self.scheduler != None:
+                    pos = pos.result()
+                posTimes.append(pos[0])
+                positions.append(pos[1])
+        MSL.holdAll(self.msl_x)
+
+        # Correct the modelled positions by a line fitted to the measured positions
+        posTimes = np.array(posTimes)
+        sampleTimes = np.array(sampleTimes)
+        residual = np.array(positions) - (start + profile.position(posTimes - t0))
+        if len(residual) > 2:
+            correction = np.polyval(np.polyfit(posTimes - t0, residual, 1), sampleTimes - t0)
+        else:
+            correction = np.mean(residual)
+        samplePos = start + profile.position(sampleTimes - t0) + correction
+
+        # Interpolate the readings onto the grid
+        order = np.argsort(samplePos)
+        samplePos = samplePos[order]
+        samples = np.array(samples)[order]
+        self.trans[j] = np.interp(xs, samplePos, samples.real) + 1j*np.interp(xs, samplePos, samples.imag)
+        self.time[j] = np.interp(xs, samplePos, sampleTimes[order]) + self._flyTimeOffset
+        self.yVals[j] = y
+
     def endSG(self):
         # Turns off signal generator output
         self.RF.off()
         self.LO.off()
 
     def spreadsheet(self):
+        """Output the scan to save_name, as a CSV file, or as an NPZ or HDF5 file
+        with the scan settings and instruments used, depending on saveFormat or
+        the file extension.  See lib/dataFile.py"""
         print("Writing data to spreadsheet...")
 
-        x_data = self.xVals/self.conv_factor
-        y_data = self.yVals/self.conv_factor
-        trans_data = self.trans
-        cal_data = self.calVals
-        time_data = self.time
-
-        if self.scan_type == "raster":
+        if dataFile.formatFor(self.save_name, self.saveFormat) == "csv":
+            # Write a row of the map at a time, so that large maps aren't copied
+            with open(self.save_name, "w") as f:
+                for j in range(self.xVals.shape[0]):
+                    dataFile.writeCSV(f, self.getColumns(slice(j, j+1)), csvFormat="%.18e", delimiter=", ")
+            return
+
+        dataFile.write(self.save_name, self.getColumns(), self.getAttributes(),
+                       fmt=self.saveFormat, compress=self.saveCompress)
+
+    def getColumns(self, rows=slice(None)):
+        """Returns a list of the (name, array) pairs of the scan data, as maps
+        with every row in the same direction.  rows selects the rows of the map
+        to return, as a slice"""
+        x_data = self.xVals[rows]/self.conv_factor
+        y_data = self.yVals[rows]/self.conv_factor
+        trans_data = np.array(self.trans[rows])
+        cal_data = np.array(self.calVals[rows])
+        time_data = np.array(self.time[rows])
+
+        if self.scan_type in ["raster", "fly"]:
             # reverse every other line in self.xVals
-            x_data[1::2,:] = x_data[1::2,::-1]
-            y_data[1::2,:] = y_data[1::2,::-1]
-            trans_data[1::2,:] = trans_data[1::2,::-1]
-            cal_data[1::2,:] = cal_data[1::2,::-1]
-            time_data[1::2,:] = time_data[1::2,::-1]
-
-        outdata = np.array((x_data.ravel(), y_data.ravel(), trans_data.ravel().real, trans_data.ravel().imag, cal_data.ravel().real, cal_data.ravel().imag, time_data.ravel()), dtype='float')
-
-        np.savetxt(self.save_name, outdata.transpose(), delimiter=", ")
-
+            odd = np.arange(self.xVals.shape[0])[rows] % 2 == 1
+            for data in (x_data, y_data, trans_data, cal_data, time_data):
+                data[odd,:] = data[odd,::-1]
+
+        return [("x", x_data), ("y", y_data), ("trans", trans_data), ("cal", cal_data), ("time", time_data)]
+
+    def getAttributes(self):
+        """Returns a dict of the scan settings, instruments and times to store with the data"""
+        settings = ["save_name", "conv_factor", "Range", "Res", "Average", "CalInterval", "Format",
+                    "Testfreq", "IFfreq", "RFharm", "RFfinalHarm", "LOharm", "RFpow", "LOpow",
+                    "searchCenter", "searchRange", "searchRes", "velocity", "accel", "scan_type",
+                    "pos_x_center", "pos_y_center", "flyOversample", "flyPosInterval", "flySampleDelay"]
+        instruments = {"vvm":self.vvm, "msl_x":self.msl_x, "msl_y":self.msl_y, "RF":self.RF, "LO":self.LO}
+        attrs = {
+            "class":type(self).__name__,
+            "config":{name:getattr(self, name, None) for name in settings},
+            "instruments":{name:dataFile.instrumentID(i) for name, i in instruments.items() if i != None},
+            "created":dataFile.timestamp(),
+        }
+        try:
+            attrs["scan-start"] = dataFile.timestamp(self.start_time)
+        except AttributeError:
+            pass
+        return attrs
 
     def contour_plot_dB(self):
         """Plot a contour plot in dB of the beam pattern"""
-
-        xi = np.linspace(self.pos_x_min/self.conv_factor, self.pos_x_max/self.conv_factor, 1000)
-        yi = np.linspace(self.pos_y_min/self.conv_factor, self.pos_y_max/self.conv_factor, 1000)
-        xi, yi = np.meshgrid(xi, yi)
-
-        pts = np.array((self.xVals.ravel(), self.yVals.ravel())).transpose()
-
-        zi = griddata(pts/self.conv_factor, 20*np.log10(np.abs(self.trans.ravel())), (xi, yi), method="linear")
-
-        CS = plt.contourf(xi, yi, zi)
-        CL = plt.contour(xi, yi, zi, colors='k')
-        plt.clabel(CL, colors='k')
-        plt.xlabel("X Position (mm)")
-        plt.ylabel("Y Position (mm)")
-        matplotlib.rcParams['contour.negative_linestyle'] = 'solid'
-        plt.xlim(self.pos_x_min/self.conv_factor, self.pos_x_max/self.conv_factor)
-        plt.ylim(self.pos_y_min/self.conv_factor, self.pos_y_max/self.conv_factor)
-        plt.title("Amplitude vs. Position")
-        plt.savefig(self.save_name.split(".")[0] + "dB_cntr.png")
-        plt.show()
+        with np.errstate(divide="ignore"):
+            self.contour_plot(20*np.log10(np.abs(self.trans)), "Amplitude vs. Position", "dB_cntr.png")
 
     def contour_plot_deg(self):
-        """Plot a contour plot in dB of the beam pattern"""
-
-        xi = np.linspace(self.pos_x_min/self.conv_factor, self.pos_x_max/self.conv_factor, 1000)
-        yi = np.linspace(self.pos_y_min/self.conv_factor, self.pos_y_max/self.conv_factor, 1000)
-        xi, yi = np.meshgrid(xi, yi)
-
-        pts = np.array((self.xVals.ravel(), self.yVals.ravel())).transpose()
-
-        zi = griddata(pts/self.conv_factor, np.rad2deg(np.angle(self.trans.ravel())), (xi, yi), method="linear")
+        """Plot a contour plot in degrees of the phase of the beam pattern"""
+        self.contour_plot(np.rad2deg(np.angle(self.trans)), "Phase vs. Position", "deg_cntr.png")
+
+    def contour_plot(self, values, title, suffix):
+        """Plot a contour plot of values, a map of the same shape as the scan, and
+        save it to save_name with suffix in place of the extension.
+
+        Raster maps are plotted directly, and other maps interpolated onto a
+        grid that is only made again when the scan positions change.  See
+        lib/beamMap.py"""
+        if self.mapGrid == None or not self.mapGrid.matches(self.xVals, self.yVals):
+            self.mapGrid = beamMap.MapGrid(self.xVals, self.yVals)
+        zi = self.mapGrid(values)
+        xi = self.mapGrid.xi/self.conv_factor
+        yi = self.mapGrid.yi/self.conv_factor
 
         CS = plt.contourf(xi, yi, zi)
         CL = plt.contour(xi, yi, zi, colors='k')
@@ -410,33 +725,24 @@ class Beamscanner:
         matplotlib.rcParams['contour.negative_linestyle'] = 'solid'
         plt.xlim(self.pos_x_min/self.conv_factor, self.pos_x_max/self.conv_factor)
         plt.ylim(self.pos_y_min/self.conv_factor, self.pos_y_max/self.conv_factor)
-        plt.title("Phase vs. Position")
-        plt.savefig(self.save_name.split(".")[0] + "deg_cntr.png")
+        plt.title(title)
+        plt.savefig(self.save_name.split(".")[0] + suffix)
         plt.show()
 
     def time_plot(self, file_name):
-        # Makes time vs amplitude & phase plot given beamscanner data format, not spreadsheet data format
-        amp_data = []
-        phase_data = []
-
-        f = open(str(file_name), 'r')
-        lines = f.readlines()
-        f.close()
-
-        for i in range(len(lines) - 1):
-            amp_data.append(float(lines[i+1].split()[3]))
-            phase_data.append(float(lines[i+1].split()[4]))
+        # Makes time vs amplitude & phase plot of the map in file_name, see lib/beamMap.py
+        points = beamMap.load(file_name).byTime()
 
         fig, ax1 = plt.subplots()
 
-        ax1.plot(self.time_data, amp_data, 'bD--', label = "Amplitude (dB)")
+        ax1.plot(points["time"], points["amp"], 'bD--', label = "Amplitude (dB)")
         ax1.set_xlabel('Time (s)')
         ax1.set_ylabel('Amplitude (dB)', color='b')
         ax1.tick_params('y', colors='b')
         plt.legend(loc = "upper left")
 
         ax2 = ax1.twinx()
-        ax2.plot(self.time_data, phase_data, 'r^-', label = "Phase (deg)")
+        ax2.plot(points["time"], points["phase"], 'r^-', label = "Phase (deg)")
         ax2.set_ylabel('Phase (deg)', color='r')
         ax2.tick_params('y', colors='r')
         plt.legend(loc = "upper right")
@@ -445,99 +751,34 @@ class Beamscanner:
         plt.show()
 
     def y_plot(self, file_name):
-        # Makes plot of amplitude & phase vs. Y-position along X = 0 plane
-        x_data_all = []
-        y_data_all = []
-        y_data = []
-        amp_data_all = []
-        amp_data = []
-        phase_data_all = []
-        phase_data = []
-
-        f = open(str(file_name), 'r')
-        lines = f.readlines()
-        f.close()
-
-        for i in range(len(lines) - 1):
-            x_data_all.append(float(lines[i+1].split()[1]))
-            y_data_all.append(float(lines[i+1].split()[2]))
-            amp_data_all.append(float(lines[i+1].split()[3]))
-            phase_data_all.append(float(lines[i+1].split()[4]))
-
-        for i in range(len(x_data_all)):
-            if x_data_all[i] == 0:
-                y_data.append(y_data_all[i])
-                amp_data.append(amp_data_all[i])
-                phase_data.append(phase_data_all[i])
-
-        fig, ax1 = plt.subplots()
-
-        x_new = np.linspace(y_data[0], y_data[-1], num=len(y_data)*10)
-
-        coefs_amp = poly.polyfit(y_data, amp_data, 2)
-        fit_amp = poly.polyval(x_new, coefs_amp)
-        ax1.plot(y_data, amp_data, 'bD', label = "Amp (meas)")
-        ax1.plot(x_new, fit_amp, 'b--', label = "Amp (fitted)")
-        ax1.set_xlabel("Y position (mm)")
-        ax1.set_ylabel("Amplitude (dB)", color='b')
-        ax1.tick_params('y', colors='b')
-        ax1.legend(loc = "upper left")
-
-        coefs_phase = poly.polyfit(y_data, phase_data, 2)
-        fit_phase = poly.polyval(x_new, coefs_phase)
-        ax2 = ax1.twinx()
-        ax2.plot(y_data, phase_data, 'r^', label = "Phase (meas)")
-        ax2.plot(x_new, fit_phase, 'r-', label = "Phase (fitted)")
-        ax2.set_ylabel('Phase (deg)', color='r')
-        ax2.tick_params('y', colors='r')
-        ax2.legend(loc = "upper right")
-
-        fig.tight_layout()
-        plt.show()
+        # Makes plot of amplitude & phase vs. Y-position along the column nearest X = 0
+        points = beamMap.load(file_name).nearestColumn(0.0)
+        self.slice_plot(points["y"], points["amp"], points["phase"], "Y position (mm)")
 
     def x_plot(self, file_name):
-        # Makes plot of amplitude & phase vs. X-position along Y = 0 plane
-        x_data_all = []
-        y_data_all = []
-        x_data = []
-        amp_data_all = []
-        amp_data = []
-        phase_data_all = []
-        phase_data = []
-
-        f = open(str(file_name), 'r')
-        lines = f.readlines()
-        f.close()
-
-        for i in range(len(lines) - 1):
-            x_data_all.append(float(lines[i+1].split()[1]))
-            y_data_all.append(float(lines[i+1].split()[2]))
-            amp_data_all.append(float(lines[i+1].split()[3]))
-            phase_data_all.append(float(lines[i+1].split()[4]))
-
-        for i in range(len(x_data_all)):
-            if int(y_data_all[i]) == 0:
-                x_data.append(x_data_all[i])
-                amp_data.append(amp_data_all[i])
-                phase_data.append(phase_data_all[i])
+        # Makes plot of amplitude & phase vs. X-position along the row nearest Y = 0
+        points = beamMap.load(file_name).nearestRow(0.0)
+        self.slice_plot(points["x"], points["amp"], points["phase"], "X position (mm)")
 
+    def slice_plot(self, pos_data, amp_data, phase_data, label):
+        # Plots amplitude & phase, with quadratic fits, along a slice through the map
         fig, ax1 = plt.subplots()
 
-        x_new = np.linspace(x_data[0], x_data[-1], num=len(x_data)*10)
+        x_new = np.linspace(pos_data[0], pos_data[-1], num=len(pos_data)*10)
 
-        coefs_amp = poly.polyfit(x_data, amp_data, 2)
+        coefs_amp = poly.polyfit(pos_data, amp_data, 2)
         fit_amp = poly.polyval(x_new, coefs_amp)
-        ax1.plot(x_data, amp_data, 'bD', label = "Amp (meas)")
+        ax1.plot(pos_data, amp_data, 'bD', label = "Amp (meas)")
         ax1.plot(x_new, fit_amp, 'b--', label = "Amp (fitted)")
-        ax1.set_xlabel("X position (mm)")
+        ax1.set_xlabel(label)
         ax1.set_ylabel("Amplitude (dB)", color='b')
         ax1.tick_params('y', colors='b')
         ax1.legend(loc = "upper left")
 
-        coefs_phase = poly.polyfit(x_data, phase_data, 2)
+        coefs_phase = poly.polyfit(pos_data, phase_data, 2)
         fit_phase = poly.polyval(x_new, coefs_phase)
         ax2 = ax1.twinx()
-        ax2.plot(x_data, phase_data, 'r^', label = "Phase (meas)")
+        ax2.plot(pos_data, phase_data, 'r^', label = "Phase (meas)")
         ax2.plot(x_new, fit_phase, 'r-', label = "Phase (fitted)")
         ax2.set_ylabel('Phase (deg)', color='r')
         ax2.tick_params('y', colors='r')
@@ -546,7 +787,6 @@ class Beamscanner:
         fig.tight_layout()
         plt.show()
 
-
 if __name__ == "__main__":
 
     # Begin
@@ -17,6 +17,8 @@ import pprint
 
 import matplotlib.pyplot as plt
 import LabEquipment.drivers.Instrument.MLBF as MLBF
+from LabEquipment.lib import settle
+from LabEquipment.lib import dataFile
 
 # create this
 from LabEquipment.applications.mixer import _default_IFP_config
@@ -56,7 +58,7 @@ class IFP(IVP.IVP):
             pprint.pprint(self.config)
 
         self.yig = None
-        self.columnHeaders = "YIG Freq (GHz)\tVoltage (mV)\tCurrent (mA)\tIF Power"
+        self.columnHeaders = "YIG Freq (GHz)\tVoltage (mV)\tCurrent (mA)\tIF Power\tVoltage Error (mV)\tCurrent Error (mA)\tIF Power Error"
 
         self.initYIG()
 
@@ -68,11 +70,13 @@ class IFP(IVP.IVP):
         super()._applyConfig()
         try:
             self.yig_address = self.config["yig-filter"]["address"]
+        except KeyError:
+            self.yig_address = None
+        if self.yig_address != None:
             if self.verbose:
                 print("UDP YIG filter configuration found")
-        except KeyError:
+        else:
             try:
-                self.yig_address = None
                 self.yigOut_channel = self.config["yig-filter"]["channel"]
                 self.yigOut_gain = self.config["yig-filter"]["gain"]
                 self.yigOut_offset = self.config["yig-filter"]["offset"]
@@ -82,6 +86,8 @@ class IFP(IVP.IVP):
                 if self.verbose:
                     print("No YIG filter configuration found")
             self.yig = None
+        self.yigSettle = settle.SettleModel(self.settleMin, self.settleMax)
+        self._yigOut = None
 
     def initYIG(self, yig_address=None):
         # Initializes Power Meter
@@ -114,10 +120,23 @@ class IFP(IVP.IVP):
     def setYIGFreq(self, freq):
         """Set the YIG frequency to <freq> GHz"""
         if self.yig: # Using YIG driver class
+            step = self._yigStep(freq)
             self.yig.f = freq*1000.0 # YIG driver class works in MHz
-            time.sleep(self.settleTime)
+            channels, tolerances = self.getYIGSettleChannels()
+            self.waitSettle(step, self.yigSettle, channels, tolerances)
         else: # Using DAC output
             self.setYIGVoltOut(self.calcYIGBias(freq))
+        self._yigFreq = freq
+
+    def getYIGFreq(self):
+        """Return the YIG frequency in GHz, or None if an analog YIG filter
+        hasn't been set yet"""
+        if self.yig:
+            return self.yig.f/1000.0
+        try:
+            return self._yigFreq
+        except AttributeError:
+            return None
 
     def calcYIGBias(self, freq):
         """Calculate the bias voltage required to set the YIG filter to requested frequency
@@ -136,16 +155,42 @@ class IFP(IVP.IVP):
             volt = self.daq.AoRange.range_min
 
         # Sets bias to specified voltage
+        step = self._yigStep(volt)
         self.daq.AOut(volt, channel=self.yigOut_channel)
-        time.sleep(self.settleTime)
+        channels, tolerances = self.getYIGSettleChannels()
+        self.waitSettle(step, self.yigSettle, channels, tolerances)
+
+    def _yigStep(self, value):
+        """Returns the step from the last YIG frequency or voltage set to value,
+        or None if it isn't known"""
+        if self._yigOut == None:
+            step = None
+        else:
+            step = value - self._yigOut
+        self._yigOut = value
+        return step
+
+    def getYIGSettleChannels(self):
+        """Returns the ADC channels to watch for the IF power settling after the
+        YIG filter is tuned, and their tolerances.  The IF power can only be
+        watched when it is read from the ADC"""
+        if self.pm != None:
+            return [], []
+        return [self.pIn_channel], [self._settleTolerance("P", self.pIn_gain)]
 
 
     def cropSweep(self):
         """Limits sweep frequencies to max and min YIG frequencies
 
         Overrides cropSweep from IV object"""
-        limFmin = self.yig.fmin/1000.0
-        limFmax = self.yig.fmax/1000.0
+        if self.yig:
+            limFmin = self.yig.fmin/1000.0
+            limFmax = self.yig.fmax/1000.0
+        else:
+            # Limited by the DAC output range
+            lims = [(self.daq.AoRange.range_min - self.yigOut_offset)/self.yigOut_gain,
+                    (self.daq.AoRange.range_max - self.yigOut_offset)/self.yigOut_gain]
+            limFmin, limFmax = min(lims), max(lims)
         if self.sweepmin < limFmin:
             if self.verbose:
                 print("Sweep min {:f} exceeds limits, limiting to {:f}".format(self.sweepmax, limFmin))
@@ -167,10 +212,14 @@ class IFP(IVP.IVP):
 
     def prepSweep(self):
         """Store current YIG filter setting, then reuse IVP.prepSweep()"""
-        self._oldYIGFreq = self.yig.f/1000.0
+        self._oldYIGFreq = self.getYIGFreq()
         super().prepSweep()
 
-    # reuse IVP.runSweep()
+    # reuse IV.runSweep()
+
+    def getWaveformProblem(self):
+        """IF sweeps step the YIG filter, not the bias waveform"""
+        return "IF sweeps set the YIG filter frequency, not the bias"
 
     def setSweep(self, sweepPt):
         """Override IV setSweep to set YIG frequency instead of bias"""
@@ -181,24 +230,26 @@ class IFP(IVP.IVP):
 
         This should be overidden when subclassing IFP.py to create a new sweep
         type"""
-        self.setYIGFreq(self._oldYIGFreq)
+        if self._oldYIGFreq != None:
+            self.setYIGFreq(self._oldYIGFreq)
         if self.verbose:
-            print("Sweep is over.  YIG filter reset to {:.3f} GHz.".format(self.yig.f/1000.0))
-
-    def spreadsheet(self):
-        if self.verbose:
-            print("\nWriting data to spreadsheet...")
-
-        # Creates document for libre office
-        out = open(self.save_name, 'w')
-
-        # Writes data to spreadsheet
-        # Write a header describing the data
-        out.write("# {:s}\n".format(self.columnHeaders))
-        for i in range(len(self.Vdata)):
-            out.write("{:.6g},\t{:.6g},\t{:.6g},\t{:.6g}\n".format(self.SweepPts[i], self.Vdata[i], self.Idata[i], self.Pdata[i]))
-
-        out.close()
+            print("Sweep is over.  YIG filter reset to {:} GHz.".format(self.getYIGFreq()))
+
+    def getColumns(self):
+        return [("freq", self.SweepPts), ("V", self.Vdata), ("I", self.Idata), ("P", self.Pdata),
+                ("Verr", self.Verr), ("Ierr", self.Ierr), ("Perr", self.Perr)]
+
+    def getLiveView(self):
+        view = super().getLiveView()
+        view["x"] = "SweepPts"
+        view["labels"]["SweepPts"] = "YIG Frequency (GHz)"
+        return view
+
+    def getInstrumentIDs(self):
+        ids = super().getInstrumentIDs()
+        if self.yig != None:
+            ids["yig"] = dataFile.instrumentID(self.yig)
+        return ids
 
     def plotIF(self):
         """Plot IF curve - will be a straight line for typical YIG usage"""
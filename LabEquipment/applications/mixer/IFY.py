@@ -22,8 +22,10 @@ import matplotlib.pyplot as plt
 from LabEquipment.applications.mixer import IFP
 from LabEquipment.applications.mixer import _default_IFY_config
 from LabEquipment.applications.mixer import TempSensor
+from LabEquipment.applications.mixer import LoadMover
+from LabEquipment.applications.mixer import YFactor
 
-class IFY(IFP.IFP):
+class IFY(YFactor.YFactor, IFP.IFP):
     """An object that can set IF frequency of a YIG filter, and measure
     the output power for each of two receiver loads."""
     def __init__(self, config=None, configFile=None, verbose=False, vverbose=False):
@@ -54,7 +56,7 @@ class IFY(IFP.IFP):
             print("IFY.__init__: Done setting configFile and config: Current config:")
             pprint.pprint(self.config)
 
-        self.columnHeaders = "YIG Freq (GHz)\tVoltage (mV)\tCurrent (mA)\tHot IF Power\tCold IF Power\tY Factor\tNoise Temp (K)\tHot Load Temp (K)\tCold Load Temp (K)"
+        self.columnHeaders = "YIG Freq (GHz)\tVoltage (mV)\tCurrent (mA)\tHot IF Power\tCold IF Power\tY Factor\tNoise Temp (K)\tHot Load Temp (K)\tCold Load Temp (K)\tVoltage Error (mV)\tCurrent Error (mA)\tHot IF Power Error\tCold IF Power Error\tY Factor Error\tNoise Temp Error (K)"
 
     def _applyConfig(self):
         super()._applyConfig()
@@ -84,6 +86,9 @@ class IFY(IFP.IFP):
                 if self.verbose:
                     print("Load mover configuration found")
                 try:
+                    # Release the DAQ board held by any LoadMover from an earlier config
+                    if getattr(self, "loadMover", None) != None:
+                        self.loadMover.endDAQ()
                     self.loadMover = LoadMover.LoadMover(config=self.config["yfactor"]["load-mover"])
                 except KeyError:
                     if self.verbose:
@@ -95,6 +100,13 @@ class IFY(IFP.IFP):
             if self.verbose:
                 print("Invalid Y Factor configuration found")
 
+    def endDAQ(self):
+        """Disconnects and releases the DAQ device, including the LoadMover's
+        connection to it"""
+        if getattr(self, "loadMover", None) != None:
+            self.loadMover.endDAQ()
+        super().endDAQ()
+
     def prepSweep(self):
         """Prepare to run a sweep.
 
@@ -107,77 +119,104 @@ class IFY(IFP.IFP):
         super().prepSweep()
 
         # Add storage for hot and cold load IF powers, Y factors and Trx
-        self.Hdata = np.empty_like(self.SweepPts)
-        self.Cdata = np.empty_like(self.SweepPts)
-        self.Ydata = np.empty_like(self.SweepPts)
-        self.Trxdata = np.empty_like(self.SweepPts)
-        self.Thdata = np.empty_like(self.SweepPts)
-        self.Tcdata = np.empty_like(self.SweepPts)
-
-
-    def runSweep(self):
-        """Run the sweep, looping over SweepPts.
-
-        Calls innerSweep() to run the sweep over blocks of SweepPts"""
-        if self.verbose:
-            print("\nRunning sweep...")
+        self.Hdata = np.full_like(self.SweepPts, np.nan)
+        self.Cdata = np.full_like(self.SweepPts, np.nan)
+        self.Ydata = np.full_like(self.SweepPts, np.nan)
+        self.Trxdata = np.full_like(self.SweepPts, np.nan)
+        self.Thdata = np.full_like(self.SweepPts, np.nan)
+        self.Tcdata = np.full_like(self.SweepPts, np.nan)
+        self.Herr = np.full_like(self.SweepPts, np.nan)
+        self.Cerr = np.full_like(self.SweepPts, np.nan)
+        self.Yerr = np.full_like(self.SweepPts, np.nan)
+        self.Trxerr = np.full_like(self.SweepPts, np.nan)
+
+
+    def runSweep(self, start=0):
+        """Run the sweep, looping over SweepPts from the point start on.
+
+        Calls innerSweep() to run the sweep over blocks of SweepPts, or
+        runChoppedSweep() if the loads are chopped.  Each block is appended to
+        the journal as it is completed, if journalFile is set, starting a new
+        journal unless start is given to continue the sweep in the journal
+        opened by resume()"""
+        if start == 0:
+            self.startJournal()
+        try:
+            if start >= len(self.SweepPts):
+                return
+            if self.loadSwitching == "chopped":
+                self.runChoppedSweep(start)
+                return
 
-        if self.verbose:
-            print("\t{:s}\n".format(self.columnHeaders))
+            if self.verbose:
+                print("\nRunning sweep...")
 
-        hotLoad = 1
-        coldLoad = 0
-        i = 0
-        if self.innerScanCycle < len(self.SweepPts) and self.innerScanCycle > 0:
-            j = self.innerScanCycle
-        else:
-            j = len(self.SweepPts)
+            if self.verbose:
+                print("\t{:s}\n".format(self.columnHeaders))
 
-        cont = True
-        # Start of outer loop
-        while cont:
-            # check to see if j is exactly at or beyond end of SweepPts
-            if j >= len(self.SweepPts):
-                j = len(self.SweepPts)
-                cont = False
-            sweepPts = self.SweepPts[i:j]
-
-            # Get hot load data
-            load = hotLoad
-            self.prepInnerSweep(load)
-            Vdata, Idata, Pdata = self.innerSweep(sweepPts)
-            self.Vdata[i:j] = Vdata
-            self.Idata[i:j] = Idata
-            self.Hdata[i:j] = Pdata
-            if self.hotLoadTemp == "sensor":
-                self.Thdata[i:j] = self.hotLoadSensorTemp
-            else:
-                self.Thdata[i:j] = self.hotLoadTemp
-
-            # Get cold load data
-            load = coldLoad
-            self.prepInnerSweep(load)
-            Vdata, Idata, Pdata = self.innerSweep(sweepPts)
-            self.Vdata[i:j] = (Vdata + self.Vdata[i:j])/2.0
-            self.Idata[i:j] = (Idata + self.Idata[i:j])/2.0
-            self.Cdata[i:j] = Pdata
-            if self.coldLoadTemp == "sensor":
-                self.Tcdata[i:j] = self.coldLoadSensorTemp
+            hotLoad = 1
+            coldLoad = 0
+            i = start
+            if self.innerScanCycle < len(self.SweepPts) and self.innerScanCycle > 0:
+                j = i + self.innerScanCycle
             else:
-                self.Tcdata[i:j] = self.coldLoadTemp
+                j = len(self.SweepPts)
 
-            # Calculate Y and Trx, and output updates if verbose
-            self.Ydata[i:j] = self.calcY(start=i, end=j)
-            self.Trxdata[i:j] = self.calcTrx(start=i, end=j)
+            cont = True
+            # Start of outer loop
+            while cont:
+                # check to see if j is exactly at or beyond end of SweepPts
+                if j >= len(self.SweepPts):
+                    j = len(self.SweepPts)
+                    cont = False
+                sweepPts = self.SweepPts[i:j]
+
+                # Get hot load data
+                load = hotLoad
+                self.prepInnerSweep(load)
+                Vdata, Idata, Pdata, hotErr = self.innerSweep(sweepPts)
+                self.Vdata[i:j] = Vdata
+                self.Idata[i:j] = Idata
+                self.Hdata[i:j] = Pdata
+                self.Herr[i:j] = hotErr[:, 2]
+                if self.hotLoadTemp == "sensor":
+                    self.Thdata[i:j] = self.hotLoadSensorTemp
+                else:
+                    self.Thdata[i:j] = self.hotLoadTemp
+
+                # Get cold load data
+                load = coldLoad
+                self.prepInnerSweep(load)
+                Vdata, Idata, Pdata, coldErr = self.innerSweep(sweepPts)
+                self.Vdata[i:j] = (Vdata + self.Vdata[i:j])/2.0
+                self.Idata[i:j] = (Idata + self.Idata[i:j])/2.0
+                self.Cdata[i:j] = Pdata
+                self.Verr[i:j] = np.hypot(hotErr[:, 0], coldErr[:, 0])/2.0
+                self.Ierr[i:j] = np.hypot(hotErr[:, 1], coldErr[:, 1])/2.0
+                self.Cerr[i:j] = coldErr[:, 2]
+                if self.coldLoadTemp == "sensor":
+                    self.Tcdata[i:j] = self.coldLoadSensorTemp
+                else:
+                    self.Tcdata[i:j] = self.coldLoadTemp
 
-            if self.verbose:
-                for index in range(i, j, 5):
-                    print("\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}".format(self.SweepPts[index], self.Vdata[index], self.Idata[index], self.Hdata[index], self.Cdata[index], self.Ydata[index], self.Trxdata[index]))
-            # increment indices for outer loop
-            i = i+self.innerScanCycle
-            j = j+self.innerScanCycle
-        # End of outer loop
+                # Calculate Y and Trx, and output updates if verbose
+                self.Ydata[i:j] = self.calcY(start=i, end=j)
+                self.Trxdata[i:j] = self.calcTrx(start=i, end=j)
+                self.Yerr[i:j] = self.calcYErr(start=i, end=j)
+                self.Trxerr[i:j] = self.calcTrxErr(start=i, end=j)
+                self.journalPoints(i, j)
 
+                if self.verbose:
+                    for index in range(i, j, 5):
+                        print("\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}".format(self.SweepPts[index], self.Vdata[index], self.Idata[index], self.Hdata[index], self.Cdata[index], self.Ydata[index], self.Trxdata[index]))
+                # increment indices for outer loop
+                i = i+self.innerScanCycle
+                j = j+self.innerScanCycle
+            # End of outer loop
+        finally:
+            # Flush and close the journal even if the sweep fails, so that it
+            # can be resumed
+            self.endJournal()
 
     def prepInnerSweep(self, variable):
         """Set up for the inner sweep.
@@ -192,27 +231,22 @@ class IFY(IFP.IFP):
     def innerSweep(self, sweepPts):
         """An inner loop called within the main sweep.
 
-        For IFY, this returns V, I and P data over sweepPts.
+        For IFY, this returns V, I and P data over sweepPts, and an array of
+        the standard errors of V, I and P at each point.
 
         Override this for other sweep types."""
         Vdata = np.empty_like(sweepPts)
         Idata = np.empty_like(sweepPts)
         Pdata = np.empty_like(sweepPts)
+        Err = np.empty((len(sweepPts), 3))
 
-        for index, bias in enumerate(sweepPts):
-            self.setSweep(bias)
+        def store(index, data, errors):
+            Vdata[index], Idata[index], Pdata[index] = data
+            Err[index] = errors
 
-            #Collects data from scan
-            data = self.getData()
+        self.acquirePoints(sweepPts, store)
 
-            Vdata[index] = data[0]
-            Idata[index] = data[1]
-            if len(data) >= 3:
-                Pdata[index] = data[2]
-            else:
-                Pdata[index] = 0.0
-
-        return Vdata, Idata, Pdata
+        return Vdata, Idata, Pdata, Err
 
     def setLoadPosition(self, position):
         """Set the ambient/hot load position.
@@ -266,22 +300,24 @@ class IFY(IFP.IFP):
         output during a scan."""
         return (self.Thdata[start:end] - self.Ydata[start:end]*self.Tcdata[start:end])/(self.Ydata[start:end]-1)
 
-    def spreadsheet(self):
-        """Output the acquired data to a CSV file.
+    def getLiveView(self):
+        view = super().getLiveView()
+        view["panels"] = [["Hdata", "Cdata"], ["Ydata"], ["Trxdata"]]
+        view["labels"].update({"Hdata":"Hot load IF power", "Cdata":"Cold load IF power",
+                               "Ydata":"Y factor", "Trxdata":"Trx (K)"})
+        return view
 
-        This should be overridden to output additional data when subclassing IVY
-        """
-        if self.verbose:
-            print("\nWriting data to spreadsheet...")
+    def getColumns(self):
+        """Returns a list of the (name, array) pairs of data to output, in the
+        order of columnHeaders
 
-        out = open(self.save_name, 'w')
-
-        # Write a header describing the data
-        out.write("# {:s}\n".format(self.columnHeaders))
-        # Write out the data
-        for i in range(len(self.Vdata)):
-            out.write("{:.6g},\t{:.6g},\t{:.6g},\t{:.6g},\t{:.6g},\t{:.6g},\t{:.6g},\t{:.6g},\t{:.6g}\n".format(self.SweepPts[i], self.Vdata[i], self.Idata[i], self.Hdata[i], self.Cdata[i], self.Ydata[i], self.Trxdata[i], self.Thdata[i], self.Tcdata[i]))
-        out.close()
+        This should be overridden to output additional data when subclassing IFY
+        """
+        return [("freq", self.SweepPts), ("V", self.Vdata), ("I", self.Idata),
+                ("Phot", self.Hdata), ("Pcold", self.Cdata), ("Y", self.Ydata), ("Trx", self.Trxdata),
+                ("Thot", self.Thdata), ("Tcold", self.Tcdata),
+                ("Verr", self.Verr), ("Ierr", self.Ierr), ("Phot_err", self.Herr), ("Pcold_err", self.Cerr),
+                ("Yerr", self.Yerr), ("Trxerr", self.Trxerr)]
 
     def plotPF(self):
         """Plot the hot and cold load IF powers against YIG Frequency"""
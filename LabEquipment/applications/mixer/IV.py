@@ -14,7 +14,9 @@ from __future__ import print_function, division
 
 import sys
 import time
+import queue
 import pprint
+import threading
 from pkg_resources import resource_filename
 
 import numpy as np
@@ -22,6 +24,11 @@ import LabEquipment.drivers.DAQ.DAQ as DAQ
 import matplotlib.pyplot as plt
 
 from LabEquipment.lib import hjsonConfig
+from LabEquipment.lib import pointStats
+from LabEquipment.lib import dataFile
+from LabEquipment.lib import journal
+from LabEquipment.lib import liveView
+from LabEquipment.lib import settle
 
 from LabEquipment.applications.mixer import _default_IV_config
 
@@ -33,7 +40,9 @@ class IV:
         self.verbose = verbose or vverbose
         self.vverbose = vverbose
 
-        self.daq = DAQ.DAQ(autoConnect=False, verbose=self.vverbose)
+        # Created by initDAQ, once the whole config is known, so that its daq
+        # section can select the backend
+        self.daq = None
 
         self.config = None
         self.setConfig(_default_IV_config.defaultConfig)
@@ -66,7 +75,19 @@ class IV:
             pprint.pprint(self.config)
 
         self._bias = 0.0
-        self.columnHeaders = "Bias (mV)\t\tVoltage (mV)\t\tCurrent (mA)"
+        self.columnHeaders = "Bias (mV)\t\tVoltage (mV)\t\tCurrent (mA)\t\tVoltage Error (mV)\t\tCurrent Error (mA)"
+
+        # Statistics of the samples read by the last call to getRawStats()
+        self.lastStats = None
+        # Last voltage set by setVoltOut(), to find the size of each step
+        self._voltOut = None
+        # Times that the last sweep started and ended, stored with the data
+        self.sweepStart = None
+        self.sweepEnd = None
+        # Journal the sweep data are written to as they are acquired
+        self.journal = None
+        # Viewer showing the sweep data as they are acquired
+        self.live = None
 
         self.initDAQ()
 
@@ -104,10 +125,8 @@ class IV:
 
         This should be overridden to read any additional configuration values
         when subclassing IV.py"""
-        try:
-            self.daq.setConfig(self.config["daq"])
-        except KeyError:
-            pass
+        if self.daq != None:
+            self.daq = DAQ.configure(self.daq, self.getDaqConfig(), verbose=self.vverbose)
 
         try:
             self.vOut_channel = self.config["vOut"]["channel"]
@@ -134,24 +153,85 @@ class IV:
             self.step = self.config["sweep"]["step"]
             self.reverseSweep = self.config["sweep"]["reverse"]
             self.save_name = self.config["sweep"]["save-file"]
+            self.sweepMode = self.config["sweep"]["mode"]
+
+            # Output file format - "csv", "npz" or "hdf5", or None to select it
+            # from the save-file extension - see lib/dataFile.py
+            self.saveFormat = self.config["sweep"]["save-format"]
+            self.saveCompress = self.config["sweep"]["save-compress"]
+
+            # Journal of the data written as they are acquired, so that
+            # interrupted sweeps can be resumed - see lib/journal.py
+            self.journalFile = self.config["journal"]["file"]
+            self.journalSyncEvery = self.config["journal"]["sync-every"]
+            self.journalSyncInterval = self.config["journal"]["sync-interval"]
+
+            # Live view of the sweep in a separate process - see lib/liveView.py
+            self.liveView = self.config["live"]["view"]
+            self.liveFps = self.config["live"]["fps"]
+
+            # Background acquisition of the sweep points
+            self.pipeline = self.config["sweep"]["pipeline"]
+            self.pipelineDepth = self.config["sweep"]["pipeline-depth"]
+
+            # Adaptive refinement of the sweep points
+            self.coarseStep = self.config["sweep"]["adaptive"]["coarse-step"]
+            self.maxPoints = self.config["sweep"]["adaptive"]["max-points"]
+            self.refineTolerance = self.config["sweep"]["adaptive"]["tolerance"]
+
+            # Reduction of the samples taken at each point - see lib/pointStats.py
+            self.statValue = self.config["statistics"]["value"]
+            self.sigmaClip = self.config["statistics"]["sigma-clip"]
+            self.statBlock = self.config["statistics"]["block"]
+
+            # Adaptive averaging, reading samples at each point until the
+            # standard errors are within tolerance
+            self.adaptive = self.config["statistics"]["adaptive"]
+            self.minAvg = self.config["statistics"]["min-average"]
+            self.maxAvg = self.config["statistics"]["max-average"]
+            self.tolerance = self.config["statistics"]["tolerance"]
+
+            # Settle detection after output changes - see lib/settle.py
+            self.settleMode = self.config["settle"]["mode"]
+            self.settleSamples = self.config["settle"]["samples"]
+            self.settleMin = self.config["settle"]["min-time"]
+            self.settleMax = self.config["settle"]["max-time"]
+            self.settleTolerance = self.config["settle"]["tolerance"]
         except KeyError:
             if self.verbose:
                 print("Got KeyError while applying IV config")
                 pprint.pprint(self.config)
             raise
 
+        for name, tolerance in (self.tolerance or {}).items():
+            if tolerance != None and not tolerance > 0:
+                raise ValueError("IV: The {:s} tolerance for adaptive averaging must be positive, not {}".format(name, tolerance))
+
+        self.biasSettle = settle.SettleModel(self.settleMin, self.settleMax)
+
     def __delete__(self):
         """Run this before deleting the IV object, to release the DAQ board"""
         self.endDAQ()
 
+    def getDaqConfig(self):
+        """Returns the daq section of the config, or None if there isn't one"""
+        try:
+            return self.config["daq"]
+        except KeyError:
+            return None
+
     def initDAQ(self):
-        """Connect the DAQ device"""
+        """Connect the DAQ device, creating it with the daq section of the
+        config the first time"""
+        if self.daq == None:
+            self.daq = DAQ.configure(None, self.getDaqConfig(), verbose=self.vverbose)
         self.daq.connect()
         self.daq.setAiRangeValue(self.daq.AiRange)
 
     def endDAQ(self):
         """Disconnects and releases the DAQ device"""
-        self.daq.disconnect()
+        if self.daq != None:
+            self.daq.disconnect()
 
 
     def cropSweep(self):
@@ -218,30 +298,212 @@ class IV:
             volt = self.daq.AoRange.range_min
 
         # Sets bias to specified voltage
+        if self._voltOut == None:
+            step = None
+        else:
+            step = volt - self._voltOut
         self.daq.AOut(volt, channel=self.vOut_channel)
-        time.sleep(self.settleTime)
+        self._voltOut = volt
+
+        channels, tolerances = self.getSettleChannels()
+        self.waitSettle(step, self.biasSettle, channels, tolerances)
+
+    def getSettleChannels(self):
+        """Returns the ADC channels to watch for the bias settling, and the
+        tolerances in volts on the change in their means between checks"""
+        return ([self.vIn_channel, self.iIn_channel],
+                [self._settleTolerance("V", self.vIn_gain/1000), self._settleTolerance("I", self.iIn_gain)])
+
+    def _settleTolerance(self, name, gain):
+        """Returns the settle tolerance named name converted to ADC volts, or None if it isn't set"""
+        try:
+            return self.settleTolerance[name]*abs(gain)
+        except (KeyError, TypeError):
+            return None
+
+    def waitSettle(self, step, model, channels, tolerances):
+        """Waits for the ADC channels to settle after a change of size step in an
+        output, whose settle times are learnt by the SettleModel model.
+
+        In "fixed" settle mode, or with no channels to watch, this sleeps for
+        settleTime.  In "detect" mode, it waits for most of the settle time
+        predicted by model, then reads blocks of settleSamples samples until the
+        means of two successive blocks agree, taking between settleMin and
+        settleMax seconds in all.  Returns the measured settle time"""
+        if self.settleMode != "detect" or not channels:
+            time.sleep(self.settleTime)
+            return self.settleTime
+
+        start = time.monotonic()
+        predicted = model.predict(step)
+        if predicted != None:
+            # Start checking a little early, so that the model can learn shorter settle times
+            time.sleep(0.8*predicted)
+
+        # The first scan reads two blocks, and each later scan one more, to
+        # compare with the block before it
+        blocks = []
+        while True:
+            blockStart = time.monotonic() - start
+            count = 1 if blocks else 2
+            data = self.daq.AInScanList(channels, self.Rate, count*self.settleSamples)
+            for block in np.split(data, count):
+                blocks.append((blockStart, pointStats.reduce(block)))
+                blockStart += self.settleSamples/self.Rate
+            (lastStart, last), (blockStart, stats) = blocks[-2:]
+            if settle.blocksAgree(last, stats, tolerances):
+                # The output had settled by the start of the previous block
+                settled = lastStart
+                break
+            if time.monotonic() - start >= self.settleMax:
+                if self.verbose:
+                    print("Output did not settle within {:.3g} s".format(self.settleMax))
+                settled = self.settleMax
+                break
+        model.add(step, settled)
+
+        remaining = self.settleMin - (time.monotonic() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+        return settled
+
+    def clipVoltOut(self, volts):
+        """Clips an array of DAC output voltages to the DAC output range"""
+        return np.clip(volts, self.daq.AoRange.range_min, self.daq.AoRange.range_max)
 
     def getData(self):
         """Gets V and I data, and returns it as a tuple
 
-        This should be overidden when subclassing IV.py to to get any additional
-        data required"""
+        This reads the point with readPoint() and converts it with convertPoint(),
+        which should be overidden instead when subclassing IV.py to get any
+        additional data"""
+        data, errors = self.convertPoint(self.readPoint())
+        return data
+
+    def readPoint(self):
+        """Reads the raw data at the current point from the DAQ, and returns it
+        for convertPoint().  In a pipelined sweep this is called on the
+        acquisition thread, so it should only read the hardware.
 
-        data = self.getRawData()
+        This should be overidden when subclassing IV.py to read any additional
+        data"""
+        return self.readSamples([self.vIn_channel, self.iIn_channel], self.getRawTolerances())
 
-        # Get the output voltage/current data
-        Vdata = self.calcV(data[self.vIn_channel])
-        Idata = self.calcI(data[self.iIn_channel])
+    def convertPoint(self, raw):
+        """Converts the raw data returned by readPoint() to V and I, and returns
+        the tuples of the data and their standard errors.  The statistics of the
+        samples are kept in self.lastStats.
 
-        return Vdata, Idata
+        This should be overidden when subclassing IV.py to convert any additional
+        data"""
+        self.lastStats = self.reduceSamples(raw)
+        Vraw, Iraw = self.lastStats.value(self.statValue)
+        return (self.calcV(Vraw), self.calcI(Iraw)), self.getDataErrors()
 
     def getRawData(self):
         """Gets the voltages from the DAQ"""
-        # Sets proper format for low and high channels to scan over
-        channels = [self.vIn_channel, self.iIn_channel]
-        low_channel, high_channel = min(channels), max(channels)
-        data = self.daq.AInScan(low_channel, high_channel, self.Rate, self.Navg)
-        return np.mean(data[:, self.vIn_channel]), np.mean(data[:, self.iIn_channel])
+        # Scans only the V and I channels where the DAQ can
+        stats = self.getRawStats([self.vIn_channel, self.iIn_channel], self.getRawTolerances())
+        Vraw, Iraw = stats.value(self.statValue)
+        return Vraw, Iraw
+
+    def getRawTolerances(self):
+        """Returns the tolerances on the standard errors of the V and I ADC
+        readings in volts, from the V (mV) and I (mA) tolerances in the config.
+        A channel without a tolerance is None"""
+        return [self._rawTolerance("V", self.vIn_gain/1000), self._rawTolerance("I", self.iIn_gain)]
+
+    def _rawTolerance(self, name, gain):
+        """Returns the tolerance named name converted to ADC volts, or None if it isn't set"""
+        try:
+            return self.tolerance[name]*abs(gain)
+        except (KeyError, TypeError):
+            return None
+
+    def getRawStats(self, channels, tolerances=None):
+        """Reads Navg samples from each of the ADC channels with readSamples(),
+        and returns their PointStats, which are also kept in self.lastStats"""
+        self.lastStats = self.reduceSamples(self.readSamples(channels, tolerances))
+        return self.lastStats
+
+    def readSamples(self, channels, tolerances=None):
+        """Reads Navg samples from each of the ADC channels, and returns them as
+        an array of shape (Navg, len(channels)), or their PointStats if they
+        are reduced as they are read.
+
+        In a pipelined sweep the samples are a copy, which stays valid while
+        later points are read.
+
+        If statBlock is set, the samples are streamed in blocks of statBlock
+        samples, each of which is reduced as it arrives, so that the Navg samples
+        are never all held at once.
+
+        If adaptive is set and tolerances, a list of the tolerance on the standard
+        error of each channel in volts, is given, the samples are read by
+        getAdaptiveStats() instead"""
+        if self.adaptive and tolerances != None and any(t != None for t in tolerances):
+            return self.getAdaptiveStats(channels, tolerances)
+        if self.statBlock > 0 and self.statBlock < self.Navg:
+            low_channel, high_channel = min(channels), max(channels)
+            columns = [c - low_channel for c in channels]
+            reducer = pointStats.StreamingReducer(self.sigmaClip)
+            blocks = -(-self.Navg//self.statBlock)
+            for index, block in self.daq.stream(low_channel, high_channel, self.Rate, self.statBlock, max_blocks=blocks):
+                reducer.add(block[:self.Navg - index, columns])
+            return reducer.result()
+        samples = self.daq.AInScanList(channels, self.Rate, self.Navg)
+        if self.pipeline:
+            # The samples are queued while the next points are read, so they
+            # mustn't share a pooled scan buffer with the next scans
+            samples = samples.copy()
+        return samples
+
+    def reduceSamples(self, samples):
+        """Returns the PointStats of samples returned by readSamples()"""
+        if isinstance(samples, pointStats.PointStats):
+            return samples
+        return pointStats.reduce(samples, self.sigmaClip)
+
+    def getAdaptiveStats(self, channels, tolerances):
+        """Reads samples from each of the ADC channels until the standard errors
+        of the channels are within tolerances, or maxAvg samples have been read,
+        and returns their PointStats.
+
+        minAvg samples, and at least 2 so that their spread can be estimated,
+        are read first.  The number of samples needed to reach
+        the tolerances is then estimated from their spread, and read in one
+        scan, or in blocks of statBlock samples if set, repeating until done"""
+        reducer = pointStats.StreamingReducer(self.sigmaClip)
+        samples = 0
+        block = max(min(self.minAvg, self.maxAvg), 2)
+        while True:
+            reducer.add(self.daq.AInScanList(channels, self.Rate, block))
+            samples += block
+            stats = reducer.result()
+            if samples >= self.maxAvg:
+                return stats
+
+            # Standard errors scale as 1/sqrt(samples), so the samples needed
+            # scale as the square of the ratio of error to tolerance
+            err = stats.error(self.statValue)
+            ratio = max((e/t)**2 for e, t in zip(err, tolerances) if t != None)
+            if ratio <= 1.0:
+                return stats
+            needed = int(np.ceil(1.1*samples*ratio)) - samples
+            block = min(max(needed, self.minAvg), self.maxAvg - samples)
+            if self.statBlock > 0:
+                block = min(block, self.statBlock)
+
+    def getDataErrors(self):
+        """Gets the standard errors of the V and I data returned by the last
+        call to getData() or convertPoint(), and returns them as a tuple
+
+        This should be overidden when subclassing IV.py to add the errors of any
+        additional data"""
+        if self.lastStats == None:
+            return np.nan, np.nan
+        err = self.lastStats.error(self.statValue)
+        return self.calcVErr(err[0]), self.calcIErr(err[1])
 
     def calcBias(self, bias):
         """Converts bias voltage to output voltage from DAQ"""
@@ -259,11 +521,25 @@ class IV:
         """Converts ADC reading in volts to bias current in mA"""
         return (volts - self.iIn_offset) / self.iIn_gain
 
+    def calcVErr(self, volts):
+        """Converts an uncertainty in an ADC reading in volts to one in bias voltage in mV"""
+        return volts * 1000 / abs(self.vIn_gain)
+
+    def calcIErr(self, volts):
+        """Converts an uncertainty in an ADC reading in volts to one in bias current in mA"""
+        return volts / abs(self.iIn_gain)
+
     def sweep(self):
         """Short cut to prep, run and end the sweep"""
+        self.sweepStart = time.time()
         self.prepSweep()
-        self.runSweep()
+        self.startLive()
+        try:
+            self.runSweep()
+        finally:
+            self.endLive()
         self.endSweep()
+        self.sweepEnd = time.time()
 
 
     def prepSweep(self):
@@ -280,16 +556,23 @@ class IV:
         self.sort()
 
         print("Preparing for sweep...")
-        # Calculate sweep values
-        self.SweepPts = np.arange(self.sweepmin, self.sweepmax+self.step, self.step)
+        # Calculate sweep values.  Adaptive sweeps start from a coarse grid that
+        # is refined as the sweep runs
+        if self.sweepMode == "adaptive":
+            count = int(np.ceil((self.sweepmax - self.sweepmin)/abs(self.coarseStep))) + 1
+            self.SweepPts = np.linspace(self.sweepmin, self.sweepmax, max(count, 2))
+        else:
+            self.SweepPts = np.arange(self.sweepmin, self.sweepmax+self.step, self.step)
         if self.reverseSweep:
             if self.verbose:
                 print("Flipping SweepPts")
             self.SweepPts = np.flipud(self.SweepPts)
 
-        # Prepares for data collection
-        self.Vdata = np.empty_like(self.SweepPts)
-        self.Idata = np.empty_like(self.SweepPts)
+        # Prepares for data collection.  Points not yet measured are NaN
+        self.Vdata = np.full_like(self.SweepPts, np.nan)
+        self.Idata = np.full_like(self.SweepPts, np.nan)
+        self.Verr = np.full_like(self.SweepPts, np.nan)
+        self.Ierr = np.full_like(self.SweepPts, np.nan)
 
         # Setting voltage to max in preparation for sweep
         if self.reverseSweep:
@@ -306,33 +589,259 @@ class IV:
     def runSweep(self):
         """Runs the sweep.
 
+        If sweepMode is "waveform" and getWaveformProblem() finds nothing to stop
+        it, the sweep is run as a single scan by runWaveformSweep().  If
+        sweepMode is "adaptive", the points are refined by runAdaptiveSweep().
+        Otherwise each bias point is set and read in turn.
+
         This should be overidden when subclassing IV.py to create a new sweep
         type"""
+        if self.sweepMode == "adaptive":
+            self.runAdaptiveSweep()
+            return
+        if self.sweepMode == "waveform":
+            problem = self.getWaveformProblem()
+            if problem == None:
+                self.runWaveformSweep()
+                return
+            if self.verbose:
+                print("{:s}, running point by point sweep".format(problem))
+
         if self.verbose:
             print("\nRunning sweep...")
 
-        # Sets proper format for low and high channels to scan over
-        channels = [self.vIn_channel, self.iIn_channel]
-        low_channel, high_channel = min(channels), max(channels)
-
         # Print a header for intermediate output
         if self.verbose:
             print("\t{:s}\n".format(self.columnHeaders))
 
         # Carry out the sweep
-        for index, sweepPt in enumerate(self.SweepPts):
-            self.setSweep(sweepPt)
+        self.acquirePoints(self.SweepPts, self.storePoint)
+
+    def storePoint(self, index, data, errors):
+        """Stores the data and errors returned by convertPoint() for point index
+        of the sweep, and outputs them while the sweep is being taken
+
+        This should be overidden when subclassing IV.py to store any additional
+        data"""
+        self.Vdata[index], self.Idata[index] = data
+        self.Verr[index], self.Ierr[index] = errors
+
+        if index%5 == 0 and self.verbose:
+            print("\t{:.3f}\t\t{:.3f}\t\t{:.3f}".format(self.SweepPts[index], self.Vdata[index], self.Idata[index]))
+
+    def acquirePoints(self, sweepPts, store):
+        """Sets and reads each of sweepPts in turn, and calls store(index, data,
+        errors) with the data and errors returned by convertPoint() for each.
+
+        If pipeline is set, the points are set and read on a background
+        acquisition thread, which queues the raw data of up to pipelineDepth
+        points while they are converted and stored on this thread, so that the
+        DAQ doesn't wait for conversion, file output or display.  An exception on
+        either thread stops the acquisition, and is raised here"""
+        if not self.pipeline:
+            for index, sweepPt in enumerate(sweepPts):
+                self.setSweep(sweepPt)
+                store(index, *self.convertPoint(self.readPoint()))
+            return
+
+        # Points are queued as (index, raw data), and the end of the sweep as
+        # (None, None), or (None, exception) if the acquisition failed
+        points = queue.Queue(maxsize=max(self.pipelineDepth, 1))
+        stop = threading.Event()
+
+        def acquire():
+            try:
+                for index, sweepPt in enumerate(sweepPts):
+                    if stop.is_set():
+                        return
+                    self.setSweep(sweepPt)
+                    points.put((index, self.readPoint()))
+            except BaseException as err:
+                points.put((None, err))
+            else:
+                points.put((None, None))
+
+        thread = threading.Thread(target=acquire, name="IV acquisition", daemon=True)
+        thread.start()
+        try:
+            while True:
+                index, raw = points.get()
+                if index == None:
+                    if raw != None:
+                        raise raw
+                    break
+                store(index, *self.convertPoint(raw))
+        finally:
+            # Unblock and wait for the acquisition thread, so that it has let go
+            # of the hardware before the sweep ends
+            stop.set()
+            while thread.is_alive():
+                try:
+                    points.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            thread.join()
+
+    def runAdaptiveSweep(self):
+        """Runs a sweep that starts from the coarse grid of SweepPts set up by
+        prepSweep(), and adds points where the data bend sharply.
+
+        After each pass, each point's deviation from the straight line through
+        its neighbours is compared with the tolerances from getRefineTolerances(),
+        or three times its noise if that is larger.  The midpoints of the
+        intervals on either side of points that deviate by more are then
+        measured in the next pass, worst first, until no points deviate, the
+        intervals are no more than twice step wide, or maxPoints points have
+        been measured.
+
+        Each pass runs in the sweep direction, so the bias moves back and forth
+        across the sweep between passes.  The data are stored sorted by the sweep
+        variable by setSweepData()"""
+        if self.verbose:
+            print("\nRunning adaptive sweep...")
+
+        tolerances = self.getRefineTolerances()
+        columns = [i for i, t in enumerate(tolerances) if t != None]
+        step = abs(self.step)
+
+        rows = {}
+        newPts = list(self.SweepPts)
+        while newPts:
+            def store(index, data, errors, pts=newPts):
+                rows[pts[index]] = (data, errors)
+            self.acquirePoints(newPts, store)
+            if self.verbose:
+                print("\tMeasured {:d} points, {:d} in all".format(len(newPts), len(rows)))
+
+            pts = np.array(sorted(rows))
+            if len(pts) < 3 or not columns or len(pts) >= self.maxPoints:
+                break
+            data = np.array([rows[p][0] for p in pts], dtype=float)[:, columns]
+            err = np.array([rows[p][1] for p in pts], dtype=float)[:, columns]
+            tol = np.array([tolerances[c] for c in columns])
+
+            # Deviation of each inner point from the line through its neighbours,
+            # in units of the tolerance or the noise on the deviation
+            frac = ((pts[1:-1] - pts[:-2])/(pts[2:] - pts[:-2]))[:, None]
+            deviation = np.abs(data[1:-1] - (data[:-2] + (data[2:] - data[:-2])*frac))
+            noise = np.nan_to_num(err[1:-1]*np.sqrt(1 + frac**2 + (1 - frac)**2))
+            score = (deviation/np.maximum(tol, 3*noise)).max(axis=1)
+
+            # Refine both intervals either side of each point that deviates
+            intervals = np.zeros(len(pts) - 1)
+            intervals[:-1] = score
+            intervals[1:] = np.maximum(intervals[1:], score)
+            candidates = np.nonzero((intervals > 1.0) & (np.diff(pts) >= 2*step))[0]
+            candidates = candidates[np.argsort(-intervals[candidates])][:self.maxPoints - len(pts)]
+
+            newPts = sorted((pts[candidates] + pts[candidates + 1])/2, reverse=bool(self.reverseSweep))
+
+        sweepPts = np.array(sorted(rows, reverse=bool(self.reverseSweep)))
+        self.setSweepData(sweepPts,
+                          np.array([rows[p][0] for p in sweepPts], dtype=float),
+                          np.array([rows[p][1] for p in sweepPts], dtype=float))
 
-            # Collects data from new bias point
-            data = self.getData()
+        if self.verbose:
+            print("\t{:s}\n".format(self.columnHeaders))
+            for index in range(0, len(self.SweepPts), 5):
+                print("\t{:.3f}\t\t{:.3f}\t\t{:.3f}".format(self.SweepPts[index], self.Vdata[index], self.Idata[index]))
+
+    def getRefineTolerances(self):
+        """Returns the tolerances on the deviation of the V (mV) and I (mA) data
+        from a straight line between points in an adaptive sweep.  Data without a
+        tolerance are None, and don't cause points to be added"""
+        return [self._refineTolerance("V"), self._refineTolerance("I")]
+
+    def _refineTolerance(self, name):
+        """Returns the refinement tolerance named name, or None if it isn't set"""
+        try:
+            return float(self.refineTolerance[name])
+        except (KeyError, TypeError):
+            return None
+
+    def setSweepData(self, sweepPts, data, errors):
+        """Replaces the sweep points and data with sweepPts, and the (point, value)
+        arrays data and errors of the values returned by getData() and
+        getDataErrors() at each point
+
+        This should be overidden when subclassing IV.py to store any additional
+        data"""
+        self.SweepPts = sweepPts
+        self.Vdata = data[:, 0].copy()
+        self.Idata = data[:, 1].copy()
+        self.Verr = errors[:, 0].copy()
+        self.Ierr = errors[:, 1].copy()
+
+    def getWaveformProblem(self):
+        """Returns the reason the sweep can't be run as a waveform sweep, or None
+        if it can
+
+        This should be overridden when subclassing IV.py if the sweep reads data
+        that can't be scanned by the DAQ with the bias waveform"""
+        if not self.daq.supportsAOutScan():
+            return "DAQ does not support analog output scans"
+        return None
+
+    def getWaveformChannels(self):
+        """Returns the ADC channels read in a waveform sweep
+
+        This should be overridden when subclassing IV.py to read any additional
+        channels"""
+        return [self.vIn_channel, self.iIn_channel]
+
+    def storeWaveformData(self, data, err):
+        """Stores the data of a waveform sweep from the ADC voltages data and
+        their standard errors err, in the columns of getWaveformChannels()
+
+        This should be overridden when subclassing IV.py to store any additional
+        data"""
+        self.Vdata[:] = self.calcV(data[:, 0])
+        self.Idata[:] = self.calcI(data[:, 1])
+        self.Verr[:] = self.calcVErr(err[:, 0])
+        self.Ierr[:] = self.calcIErr(err[:, 1])
+
+    def runWaveformSweep(self):
+        """Runs the sweep as a single hardware paced analog output/input scan"""
+        if self.verbose:
+            print("\nRunning waveform sweep...")
+
+        data = self.getWaveformData(self.SweepPts, self.getWaveformChannels())
+        self.storeWaveformData(data, self.lastStats.error(self.statValue))
 
-            self.Vdata[index] = data[0]
-            self.Idata[index] = data[1]
+        # The DAC is left at the last point of the sweep
+        self._bias = self.SweepPts[-1]
 
-            # Outputs data while sweep is being taken
-            if index%5 == 0 and self.verbose:
+        if self.verbose:
+            print("\t{:s}\n".format(self.columnHeaders))
+            for index in range(0, len(self.SweepPts), 5):
                 print("\t{:.3f}\t\t{:.3f}\t\t{:.3f}".format(self.SweepPts[index], self.Vdata[index], self.Idata[index]))
 
+    def getWaveformData(self, sweepPts, channels):
+        """Uploads the bias points in sweepPts to the DAC as a single output
+        waveform and scans the ADC channels in lockstep with it.
+
+        Each bias point is held for settleTime worth of samples, which are
+        discarded, followed by Navg samples, which are reduced to PointStats
+        kept in self.lastStats.  Returns the ADC voltage of each point as an
+        array of shape (len(sweepPts), len(channels))"""
+        settleSamples = int(np.ceil(self.settleTime * self.Rate))
+        pointSamples = settleSamples + self.Navg
+
+        waveform = np.repeat(self.clipVoltOut(self.calcBias(np.asarray(sweepPts))), pointSamples)
+
+        low_channel, high_channel = min(channels), max(channels)
+        # The DAC output is unknown if the scan fails part way through, and is
+        # left at the last point of the waveform if it completes
+        self._voltOut = None
+        data = self.daq.AOutAInScan(waveform, self.vOut_channel, low_channel, high_channel, self.Rate)
+        self._voltOut = waveform[-1]
+
+        # Reshape to (point, sample, channel), drop the settling samples and reduce
+        data = data.reshape((len(sweepPts), pointSamples, -1))[:, settleSamples:, :]
+        self.lastStats = pointStats.reduce(data[:, :, [c - low_channel for c in channels]], self.sigmaClip, axis=1)
+
+        return self.lastStats.value(self.statValue)
+
     def setSweep(self, sweepPt):
         """Set the bias to the sweepPt value.
 
@@ -351,21 +860,175 @@ class IV:
 
 
     def spreadsheet(self):
-        """Output the acquired data to a CSV file.
+        """Output the acquired data to save_name, as a CSV file, or as an NPZ or
+        HDF5 file with the config and instruments used, depending on saveFormat
+        or the file extension.  See lib/dataFile.py
 
-        This should be overridden to output additional data when subclassing IV
+        To output additional data when subclassing IV, override getColumns()
         """
         if self.verbose:
             print("\nWriting data to spreadsheet...")
 
-        out = open(self.save_name, 'w')
+        dataFile.write(self.save_name, self.getColumns(), self.getAttributes(),
+                       fmt=self.saveFormat, compress=self.saveCompress, header=self.columnHeaders)
 
-        # Write a header describing the data
-        out.write("# {:s}\n".format(self.columnHeaders))
-        # Write out the data
-        for i in range(len(self.Vdata)):
-            out.write("{:.6g},\t{:.6g},\t{:.6g}\n".format(self.SweepPts[i], self.Vdata[i], self.Idata[i]))
-        out.close()
+    def getColumns(self):
+        """Returns a list of the (name, array) pairs of data to output, in the
+        order of columnHeaders.  The arrays are the data arrays themselves, not
+        copies, so that loadJournal() can restore the data to them
+
+        This should be overridden to output additional data when subclassing IV
+        """
+        return [("bias", self.SweepPts), ("V", self.Vdata), ("I", self.Idata),
+                ("Verr", self.Verr), ("Ierr", self.Ierr)]
+
+    def getAttributes(self):
+        """Returns a dict of the config, instruments and times to store with the
+        data, and the range of the sweep, which may have been set as attributes
+        rather than in the config"""
+        attrs = {
+            "class":type(self).__name__,
+            "config":self.config,
+            "sweep-range":{"min":self.sweepmin, "max":self.sweepmax, "step":self.step, "reverse":self.reverseSweep},
+            "instruments":self.getInstrumentIDs(),
+            "created":dataFile.timestamp(),
+        }
+        if self.sweepStart != None:
+            attrs["sweep-start"] = dataFile.timestamp(self.sweepStart)
+        if self.sweepEnd != None:
+            attrs["sweep-end"] = dataFile.timestamp(self.sweepEnd)
+        return attrs
+
+    def startJournal(self):
+        """Starts a new journal of the sweep data in journalFile, if it is set,
+        closing any journal left open by an interrupted sweep"""
+        self.endJournal()
+        if self.journalFile:
+            names = [name for name, column in self.getColumns()]
+            self.journal = journal.SweepJournal.create(self.journalFile, names, self.SweepPts, self.getAttributes(),
+                                                       self.journalSyncEvery, self.journalSyncInterval)
+
+    def journalPoints(self, start, end):
+        """Appends the data of points start to end of the sweep to the journal,
+        if there is one"""
+        if self.journal != None:
+            self.journal.append(start, np.column_stack([column[start:end] for name, column in self.getColumns()]))
+
+    def endJournal(self):
+        """Flushes and closes the journal, if there is one"""
+        if self.journal != None:
+            self.journal.close()
+            self.journal = None
+
+    def loadJournal(self, filename):
+        """Opens the journal in filename to continue the sweep it records.
+
+        The config and sweep range are set from the journal, the sweep is
+        prepared, and the data already acquired are restored to the arrays
+        returned by getColumns().  Returns the index of the first point missing
+        from the journal"""
+        self.endJournal()
+        sweepJournal = journal.SweepJournal.open(filename)
+        try:
+            self.setConfig(sweepJournal.attrs["config"])
+        except KeyError:
+            pass
+        try:
+            sweepRange = sweepJournal.attrs["sweep-range"]
+            self.sweepmin = sweepRange["min"]
+            self.sweepmax = sweepRange["max"]
+            self.step = sweepRange["step"]
+            self.reverseSweep = sweepRange["reverse"]
+        except KeyError:
+            pass
+        self.journalFile = filename
+        sweepJournal.syncEvery = self.journalSyncEvery
+        sweepJournal.syncInterval = self.journalSyncInterval
+
+        self.prepSweep()
+        columns = self.getColumns()
+        if len(self.SweepPts) != len(sweepJournal.sweepPts) or not np.allclose(self.SweepPts, sweepJournal.sweepPts):
+            sweepJournal.close()
+            raise ValueError("IV: The sweep points in journal {:s} don't match the config".format(filename))
+        if [name for name, column in columns] != sweepJournal.columns:
+            sweepJournal.close()
+            raise ValueError("IV: The columns in journal {:s} don't match the data".format(filename))
+
+        indices, rows = sweepJournal.read()
+        for (name, column), values in zip(columns, rows.T):
+            column[indices] = values
+        self.journal = sweepJournal
+        return sweepJournal.firstMissing()
+
+    def resume(self, filename):
+        """Resume the sweep recorded in the journal filename, measuring the points
+        missing from it, and end the sweep.  The config and sweep range are taken
+        from the journal, and the whole sweep can then be output with spreadsheet().
+
+        The subclass's runSweep() must take the index of the first point to
+        measure and journal its points, as in IVY and IFY"""
+        start = self.loadJournal(filename)
+        if self.verbose:
+            print("\nResuming sweep from point {:d} of {:d}".format(start, len(self.SweepPts)))
+        self.sweepStart = time.time()
+        self.startLive()
+        try:
+            self.runSweep(start)
+        finally:
+            self.endLive()
+        self.endSweep()
+        self.sweepEnd = time.time()
+
+    def getLiveView(self):
+        """Returns the data to show in the live view, as a dict of the name of the
+        attribute holding the x axis data, "x", a list of "panels", each a list of
+        the names of the attributes to plot against it, and axis "labels"
+
+        This should be overridden to show additional data when subclassing IV"""
+        return {"x":"Vdata", "panels":[["Idata"]],
+                "labels":{"Vdata":"Voltage (mV)", "Idata":"Current (mA)"}}
+
+    def startLive(self):
+        """Starts a live view of the sweep in a separate process, if liveView is
+        set.  The data arrays named by getLiveView() are moved into shared memory
+        that the viewer reads as they are filled, so the sweep isn't slowed"""
+        self.endLive()
+        if not self.liveView:
+            return
+        if self.sweepMode == "adaptive":
+            # Adaptive sweeps only fill the data arrays at the end
+            if self.verbose:
+                print("Live view isn't available for adaptive sweeps")
+            return
+
+        options = self.getLiveView()
+        names = [options["x"]]
+        for panel in options["panels"]:
+            names.extend(name for name in panel if name not in names)
+        self.live = liveView.LiveView("lines", [(name, getattr(self, name)) for name in names],
+                                      fps=self.liveFps, title=type(self).__name__, **options)
+        for name in names:
+            setattr(self, name, self.live[name])
+
+    def endLive(self):
+        """Ends the live view, if there is one, moving the data arrays back out of
+        shared memory.  The viewer keeps showing the data until it is closed"""
+        if self.live == None:
+            return
+        for name in self.live.names:
+            if getattr(self, name) is self.live[name]:
+                setattr(self, name, np.array(getattr(self, name)))
+        self.live.close()
+        self.live = None
+
+    def getInstrumentIDs(self):
+        """Returns a dict of the identification of each instrument used
+
+        This should be overridden to add any additional instruments when
+        subclassing IV"""
+        if self.daq.boardnum == None:
+            return {"daq":None}
+        return {"daq":self.daq.name(self.daq.boardnum)}
 
     def plotIV(self):
         """Plot the IV curve data on the figure"""
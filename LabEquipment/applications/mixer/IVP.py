@@ -18,9 +18,11 @@ import pprint
 
 import matplotlib.pyplot as plt
 import LabEquipment.drivers.Instrument.HP436A as PM
+import LabEquipment.drivers.Instrument.Instrument as Instrument
 
 from LabEquipment.applications.mixer import _default_IVP_config
 from LabEquipment.applications.mixer import IV
+from LabEquipment.lib import dataFile
 
 
 class IVP(IV.IV):
@@ -55,7 +57,7 @@ class IVP(IV.IV):
             print("IVP.__init__: Done setting configFile and config: Current config:")
             pprint.pprint(self.config)
 
-        self.columnHeaders = "Bias (mV)\tVoltage (mV)\tCurrent (mA)\tIF Power"
+        self.columnHeaders = "Bias (mV)\tVoltage (mV)\tCurrent (mA)\tIF Power\tVoltage Error (mV)\tCurrent Error (mA)\tIF Power Error"
         self.pm = None
 
         self.initPM()
@@ -104,7 +106,7 @@ class IVP(IV.IV):
             return
 
         try:
-            self.rm = visa.ResourceManager()
+            self.rm = Instrument.ResourceManager()
             lr = self.rm.list_resources()
             if pm_address in lr:
                 self.pm = PM.PowerMeter(self.rm.open_resource(pm_address), averaging=self.pm_averaging, Navg=self.pm_Navg)
@@ -141,93 +143,139 @@ class IVP(IV.IV):
                 print("  Voltage: {:.4g} mV, Current: {:.4g} mA".format(data[0], data[1]))
         return data
 
-    def getData(self):
-        """Gets V, I and P (if PM present) data, and returns it as a tuple"""
-
+    def readPoint(self):
+        """Reads the raw V, I and P data at the current point.  With a GPIB power
+        meter this returns the raw V and I data and the power read from the meter"""
         if self.pm != None:
-            data = super().getData()
-            Vdata = data[self.vIn_channel]
-            Idata = data[self.iIn_channel]
-            Pdata = self.pm.getData(rate="I")
+            return super().readPoint(), self.pm.getData(rate="I")
+        return self.readSamples([self.vIn_channel, self.iIn_channel, self.pIn_channel], self.getRawTolerances())
 
-        else:
-            Vdata, Idata, Pdata = self.getDataAin()
+    def convertPoint(self, raw):
+        """Converts the raw data returned by readPoint() to V, I and P, and returns
+        the tuples of the data and their standard errors"""
+        if self.pm != None:
+            raw, Pdata = raw
+            (Vdata, Idata), errors = super().convertPoint(raw)
+            return (Vdata, Idata, Pdata), errors
 
-        return Vdata, Idata, Pdata
+        self.lastStats = self.reduceSamples(raw)
+        Vraw, Iraw, Praw = self.lastStats.value(self.statValue)
+        return (self.calcV(Vraw), self.calcI(Iraw), self.calcP(Praw)), self.getDataErrors()
 
     def getDataAin(self):
         """Get the data for bias and IF power from the DAQ"""
-        data = self.getRawDataAin()
+        Vraw, Iraw, Praw = self.getRawDataAin()
 
         # Get the output voltage/current data
-        Vdata = self.calcV(data[self.vIn_channel])
-        Idata = self.calcI(data[self.iIn_channel])
-        Pdata = self.calcP(data[self.pIn_channel])
+        Vdata = self.calcV(Vraw)
+        Idata = self.calcI(Iraw)
+        Pdata = self.calcP(Praw)
 
         return Vdata, Idata, Pdata
 
     def getRawDataAin(self):
         """Gets the voltages for the bias and power meter from the DAQ"""
-        # Sets proper format for low and high channels to scan over
-        channels = [self.vIn_channel, self.iIn_channel, self.pIn_channel]
-        low_channel, high_channel = min(channels), max(channels)
-        data = self.daq.AInScan(low_channel, high_channel, self.Rate, self.Navg)
-        return np.mean(data[:, self.vIn_channel]), np.mean(data[:, self.iIn_channel]), np.mean(data[:, self.pIn_channel])
+        # Scans only the V, I and P channels where the DAQ can
+        stats = self.getRawStats([self.vIn_channel, self.iIn_channel, self.pIn_channel], self.getRawTolerances())
+        Vraw, Iraw, Praw = stats.value(self.statValue)
+        return Vraw, Iraw, Praw
+
+    def getRawTolerances(self):
+        """Returns the tolerances on the standard errors of the V, I and P ADC
+        readings in volts.  P is only read from the ADC without a GPIB power meter"""
+        tolerances = super().getRawTolerances()
+        if self.pm == None:
+            tolerances.append(self._rawTolerance("P", self.pIn_gain))
+        return tolerances
+
+    def getSettleChannels(self):
+        """Returns the ADC channels to watch for the bias settling, including the
+        IF power when it is read from the ADC"""
+        channels, tolerances = super().getSettleChannels()
+        if self.pm == None:
+            channels.append(self.pIn_channel)
+            tolerances.append(self._settleTolerance("P", self.pIn_gain))
+        return channels, tolerances
+
+    def getDataErrors(self):
+        """Gets the standard errors of the V, I and P data returned by the last
+        call to getData() or convertPoint(), and returns them as a tuple.
+
+        The error of P is not known when it is read from a GPIB power meter"""
+        Verr, Ierr = super().getDataErrors()
+        if self.pm != None or self.lastStats == None:
+            return Verr, Ierr, np.nan
+        return Verr, Ierr, self.calcPErr(self.lastStats.error(self.statValue)[2])
 
     def calcP(self, volts):
         """Convert ADC voltage to IF power"""
         return (volts - self.pIn_offset) / self.pIn_gain
 
+    def calcPErr(self, volts):
+        """Convert an uncertainty in ADC voltage to one in IF power"""
+        return volts / abs(self.pIn_gain)
+
     def prepSweep(self):
         super().prepSweep()
 
         # Prepares for data collection
-        self.Pdata = np.empty_like(self.SweepPts)
+        self.Pdata = np.full_like(self.SweepPts, np.nan)
+        self.Perr = np.full_like(self.SweepPts, np.nan)
 
 
-    def runSweep(self):
-        if self.verbose:
-            print("\nRunning sweep...")
+    def getWaveformProblem(self):
+        """The IF power can only be read in a waveform sweep from the DAQ"""
+        if self.pm != None:
+            return "IF power is read from the power meter, which can't be scanned with the bias waveform"
+        return super().getWaveformProblem()
 
-        if self.verbose:
-            print("\t{:s}\n".format(self.columnHeaders))
+    def getWaveformChannels(self):
+        return super().getWaveformChannels() + [self.pIn_channel]
 
-        for index, bias in enumerate(self.SweepPts):
-            self.setSweep(bias)
+    def storeWaveformData(self, data, err):
+        super().storeWaveformData(data, err)
+        self.Pdata[:] = self.calcP(data[:, 2])
+        self.Perr[:] = self.calcPErr(err[:, 2])
 
-            #Collects data from scan
-            data = self.getData()
+    def storePoint(self, index, data, errors):
+        """Stores the V, I and P data and errors of point index of the sweep"""
+        self.Vdata[index], self.Idata[index], self.Pdata[index] = data
+        self.Verr[index], self.Ierr[index], self.Perr[index] = errors
 
-            self.Vdata[index] = data[0]
-            self.Idata[index] = data[1]
-            if len(data) >= 3:
-                self.Pdata[index] = data[2]
-            else:
-                self.Pdata[index] = 0.0
+        if index%5 == 0 and self.verbose:
+            print("\t{:.3f}\t\t{:.3f}\t\t{:.3f}\t\t{:.3g}".format(self.SweepPts[index], self.Vdata[index], self.Idata[index], self.Pdata[index]))
 
-            if index%5 == 0 and self.verbose:
-                print("\t{:.3f}\t\t{:.3f}\t\t{:.3f}\t\t{:.3g}".format(self.SweepPts[index], self.Vdata[index], self.Idata[index], self.Pdata[index]))
+    def getRefineTolerances(self):
+        """Returns the tolerances on the deviation of the V, I and P data from a
+        straight line between points in an adaptive sweep"""
+        return super().getRefineTolerances() + [self._refineTolerance("P")]
 
+    def setSweepData(self, sweepPts, data, errors):
+        """Replaces the sweep points and data, including the IF power"""
+        super().setSweepData(sweepPts, data, errors)
+        self.Pdata = data[:, 2].copy()
+        self.Perr = errors[:, 2].copy()
 
     def endPM(self):
         # Disconnects power meter
         if self.pm != None:
             self.pm.close()
 
-    def spreadsheet(self):
-        if self.verbose:
-            print("\nWriting data to spreadsheet...")
+    def getColumns(self):
+        return [("bias", self.SweepPts), ("V", self.Vdata), ("I", self.Idata), ("P", self.Pdata),
+                ("Verr", self.Verr), ("Ierr", self.Ierr), ("Perr", self.Perr)]
 
-        # Creates document for libre office
-        out = open(self.save_name, 'w')
+    def getLiveView(self):
+        view = super().getLiveView()
+        view["panels"].append(["Pdata"])
+        view["labels"]["Pdata"] = "IF Power"
+        return view
 
-        # Writes data to spreadsheet
-        # Write a header describing the data
-        out.write("# {:s}\n".format(self.columnHeaders))
-        for i in range(len(self.Vdata)):
-            out.write("{:.6g},\t{:.6g},\t{:.6g},\t{:.6g}\n".format(self.SweepPts[i], self.Vdata[i], self.Idata[i], self.Pdata[i]))
-
-        out.close()
+    def getInstrumentIDs(self):
+        ids = super().getInstrumentIDs()
+        if self.pm != None:
+            ids["power-meter"] = dataFile.instrumentID(self.pm)
+        return ids
 
     def plotPV(self):
         # Plot PV curve
@@ -76,14 +76,21 @@ class IVP_timestream(IVP.IVP):
     def prepSweep(self):
         self.SweepPts = np.arange(0, self.streamLength, 1)
 
-        # Prepares for data collection
-        self.Vdata = np.empty_like(self.SweepPts, dtype=np.float)
-        self.Idata = np.empty_like(self.Vdata)
-        self.Pdata = np.empty_like(self.Vdata)
-        self.Tdata = np.empty_like(self.Vdata)
+        # Prepares for data collection.  Points not yet measured are NaN
+        self.Vdata = np.full_like(self.SweepPts, np.nan, dtype=float)
+        self.Idata = np.full_like(self.Vdata, np.nan)
+        self.Pdata = np.full_like(self.Vdata, np.nan)
+        self.Tdata = np.full_like(self.Vdata, np.nan)
 
 
     def runSweep(self):
+        if self.sweepMode != "point" and self.verbose:
+            print("Timestreams are taken at a fixed bias, ignoring sweep mode {:s}".format(self.sweepMode))
+        if self.pm == None:
+            # All channels are on the DAQ, so stream them
+            self.runStream()
+            return
+
         if self.verbose:
             print("\nRunning sweep...")
 
@@ -110,24 +117,47 @@ class IVP_timestream(IVP.IVP):
             if index%100 == 0 and self.verbose:
                 print("\t{:.3f}\t\t{:.3f}\t\t{:.3f}\t\t{:.3g}".format(self.Tdata[index], self.Vdata[index], self.Idata[index], self.Pdata[index]))
 
-    def endSweep(self):
-        """Do nothing because we didn't do anyting"""
-        pass
+    def runStream(self):
+        """Take the timestream from a single continuous DAQ scan.
 
-    def spreadsheet(self):
+        Each point is the mean of a block of max(Navg, sampleTime*Rate)
+        consecutive samples, and the point times are taken from the sample
+        index of the start of each block, so there are no gaps between points."""
         if self.verbose:
-            print("\nWriting data to spreadsheet...")
+            print("\nRunning streamed sweep...")
+
+        if self.verbose:
+            print("\t{:s}\n".format(self.columnHeaders))
+
+        channels = [self.vIn_channel, self.iIn_channel, self.pIn_channel]
+        low_channel, high_channel = min(channels), max(channels)
+        columns = [c - low_channel for c in channels]
+        blockSize = max(self.Navg, int(round(self.sampleTime*self.Rate)))
 
-        # Creates document for libre office
-        out = open(self.save_name, 'w')
+        blocks = self.daq.stream(low_channel, high_channel, self.Rate, blockSize, max_blocks=len(self.SweepPts))
+        for index, (sample, block) in enumerate(blocks):
+            data = block.mean(axis=0)[columns]
+
+            self.Tdata[index] = sample/self.Rate
+            self.Vdata[index] = self.calcV(data[0])
+            self.Idata[index] = self.calcI(data[1])
+            self.Pdata[index] = self.calcP(data[2])
+
+            if index%100 == 0 and self.verbose:
+                print("\t{:.3f}\t\t{:.3f}\t\t{:.3f}\t\t{:.3g}".format(self.Tdata[index], self.Vdata[index], self.Idata[index], self.Pdata[index]))
+
+    def endSweep(self):
+        """Do nothing because we didn't do anyting"""
+        pass
 
-        # Writes data to spreadsheet
-        # Write a header describing the data
-        out.write("# {:s}\n".format(self.columnHeaders))
-        for i in range(len(self.Vdata)):
-            out.write("{:.6g},\t{:.6g},\t{:.6g},\t{:.6g}\n".format(self.Tdata[i], self.Vdata[i], self.Idata[i], self.Pdata[i]))
+    def getLiveView(self):
+        view = super().getLiveView()
+        view["x"] = "Tdata"
+        view["labels"]["Tdata"] = "Time (s)"
+        return view
 
-        out.close()
+    def getColumns(self):
+        return [("time", self.Tdata), ("V", self.Vdata), ("I", self.Idata), ("P", self.Pdata)]
 
     def plotIT(self):
         self.ax.plot(self.Tdata, self.Idata, 'r-', label="Current")
@@ -9,11 +9,13 @@
 
 from __future__ import print_function, division
 
+import sys
 import pprint
 from time import sleep
 from pkg_resources import resource_filename
 
 import LabEquipment.drivers.DAQ.DAQ as DAQ
+from LabEquipment.lib import hjsonConfig
 from LabEquipment.applications.mixer import _default_LoadMover_config
 
 class LoadMover(object):
@@ -22,7 +24,9 @@ class LoadMover(object):
         self.verbose = verbose
         self.vverbose = vverbose
 
-        self.daq = DAQ.DAQ(autoConnect=False, verbose=self.vverbose)
+        # Created by initDAQ, once the whole config is known, so that its daq
+        # section can select the backend
+        self.daq = None
 
         self.config = None
         self.setConfig(_default_LoadMover_config.defaultConfig)
@@ -87,13 +91,10 @@ class LoadMover(object):
 
         This should be overridden to read any additional configuration values
         when subclassing LoadMover.py"""
-        try:
-            self.daq.setConfig(self.config["daq"])
-        except KeyError:
-            pass
+        if self.daq != None:
+            self.daq = DAQ.configure(self.daq, self.getDaqConfig(), verbose=self.vverbose)
 
         try:
-            self.boardnum = self.config["boardnum"]
             self.controlBit = self.config["control-bit"]
             self.loadInState = self.config["load-in"]
             self.switchTime = self.config["switch-time"]
@@ -107,13 +108,26 @@ class LoadMover(object):
         """Run this before deleting the LoadMover object, to release the DAQ board"""
         self.endDAQ()
 
+    def getDaqConfig(self):
+        """Returns the daq section of the config, or None if there isn't one"""
+        try:
+            return self.config["daq"]
+        except KeyError:
+            return None
+
     def initDAQ(self):
-        """Lists available DAQ devices, connects the selected board and sets the AI Range"""
+        """Lists available DAQ devices, connects the selected board and sets the AI Range.
+        The DAQ is created with the daq section of the config the first time"""
+        if self.daq == None:
+            self.daq = DAQ.configure(None, self.getDaqConfig(), verbose=self.vverbose)
+        # The board is set up by the daq section of the config
+        self.boardnum = self.daq.config["boardnum"]
         self.daq.connect()
 
     def endDAQ(self):
         """Disconnects and releases selected board number"""
-        self.daq.disconnect()
+        if self.daq != None:
+            self.daq.disconnect()
 
     def setLoadPosition(self, bitState):
         """Set the load position bit to chosen state"""
@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+##################################################
+#                                                #
+# Chopped Y factor measurements shared by the    #
+# IVY and IFY sweeps, switching the loads with a #
+# DAQ digital output at each point               #
+#                                                #
+##################################################
+
+from __future__ import print_function, division
+
+import numpy as np
+
+from LabEquipment.lib import lockin
+from LabEquipment.lib import pointStats
+
+
+class YFactor(object):
+    """Mixin for the Y factor sweeps IVY and IFY, measuring the hot and cold
+    load IF powers at each point by chopping between the loads.
+
+    Use before the sweep class in the bases, as in class IVY(YFactor, IVP.IVP),
+    so that its _applyConfig() also reads the chopper configuration.  The sweep
+    class provides the Y factor data arrays and calcY() and calcTrx(), and the
+    mixin their standard errors"""
+    def _applyConfig(self):
+        super()._applyConfig()
+
+        # Chopped Y factor measurements, switching the loads with a DAQ digital
+        # output at each point - see lib/lockin.py
+        try:
+            self.chopBit = self.config["yfactor"]["chopper"]["control-bit"]
+            self.chopHotState = self.config["yfactor"]["chopper"]["hot-state"]
+            self.chopPeriod = self.config["yfactor"]["chopper"]["period"]
+            self.chopCycles = self.config["yfactor"]["chopper"]["cycles"]
+            self.chopBlank = self.config["yfactor"]["chopper"]["blank"]
+        except KeyError:
+            if self.verbose:
+                print("No chopper configuration found")
+
+    def calcYErr(self, start=0, end=-1):
+        """Calculate the standard error of the Y factor from those of Hdata and Cdata"""
+        return np.abs(self.Ydata[start:end])*np.hypot(self.Herr[start:end]/self.Hdata[start:end], self.Cerr[start:end]/self.Cdata[start:end])
+
+    def calcTrxErr(self, start=0, end=-1):
+        """Calculate the standard error of the Noise Temperature from that of the Y factor"""
+        return np.abs(self.Thdata[start:end] - self.Tcdata[start:end])/(self.Ydata[start:end]-1)**2*self.Yerr[start:end]
+
+    def runChoppedSweep(self, start=0):
+        """Run the sweep in a single pass over SweepPts from the point start on,
+        chopping between the loads at each point to measure the hot and cold load IF powers with
+        getChoppedData()"""
+        if self.pm != None:
+            raise RuntimeError("{:s}: Chopped Y factor measurements need the IF power on a DAQ analog input".format(type(self).__name__))
+
+        if self.verbose:
+            print("\nRunning chopped sweep...")
+            print("\t{:s}\n".format(self.columnHeaders))
+
+        for index in range(start, len(self.SweepPts)):
+            self.setSweep(self.SweepPts[index])
+
+            data, err = self.getChoppedData()
+            self.Vdata[index], self.Idata[index], self.Hdata[index], self.Cdata[index] = data
+            self.Verr[index], self.Ierr[index], self.Herr[index], self.Cerr[index] = err
+            if self.hotLoadTemp == "sensor":
+                self.Thdata[index] = self.hotLoadSensor.getT()
+            else:
+                self.Thdata[index] = self.hotLoadTemp
+            if self.coldLoadTemp == "sensor":
+                self.Tcdata[index] = self.coldLoadSensor.getT()
+            else:
+                self.Tcdata[index] = self.coldLoadTemp
+
+            self.Ydata[index:index+1] = self.calcY(start=index, end=index+1)
+            self.Trxdata[index:index+1] = self.calcTrx(start=index, end=index+1)
+            self.Yerr[index:index+1] = self.calcYErr(start=index, end=index+1)
+            self.Trxerr[index:index+1] = self.calcTrxErr(start=index, end=index+1)
+            self.journalPoints(index, index+1)
+
+            if index%5 == 0 and self.verbose:
+                print("\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}".format(self.SweepPts[index], self.Vdata[index], self.Idata[index], self.Hdata[index], self.Cdata[index], self.Ydata[index], self.Trxdata[index]))
+
+    def getChoppedData(self):
+        """Measure V, I and the hot and cold load IF powers at the current point,
+        chopping between the loads for chopCycles periods of chopPeriod seconds.
+
+        The hot and cold IF powers are demodulated from the IF power samples
+        against the recorded switching waveform, discarding chopBlank seconds
+        after each switch.  Returns the tuples (V, I, Phot, Pcold) and their
+        standard errors"""
+        halfPeriod = max(int(round(self.chopPeriod*self.Rate/2)), 1)
+        channels = [self.vIn_channel, self.iIn_channel, self.pIn_channel]
+        data, reference, switches = lockin.choppedScan(self.daq, channels, self.Rate, self.chopBit,
+                                                       self.chopHotState, halfPeriod, self.chopCycles)
+        keep = lockin.blankMask(switches, len(data), int(np.ceil(self.chopBlank*self.Rate)))
+
+        stats = pointStats.reduce(data[keep, :2], self.sigmaClip)
+        Vraw, Iraw = stats.value(self.statValue)
+        Verr, Ierr = stats.error(self.statValue)
+        hot, cold, hotErr, coldErr = lockin.demodulate(data[:, 2], reference, keep, self.Rate)
+
+        return ((self.calcV(Vraw), self.calcI(Iraw), self.calcP(hot), self.calcP(cold)),
+                (self.calcVErr(Verr), self.calcIErr(Ierr), self.calcPErr(hotErr), self.calcPErr(coldErr)))
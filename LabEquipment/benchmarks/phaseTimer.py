@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+"""Attribute the time spent in a sweep or scan to phases such as instrument
+I/O, settling sleeps and file output, by temporarily wrapping the functions
+that implement each phase"""
+from __future__ import print_function, division
+
+import time
+import functools
+import threading
+import collections
+
+
+class PhaseTimer(object):
+    """Accumulates the time spent inside wrapped functions, by phase.
+
+    Only the outermost wrapped call is timed, so a sleep inside a DAQ scan counts
+    as I/O, not as settling.  Only calls on the thread that created the timer are
+    timed, unless allThreads, so that work run concurrently on other threads
+    isn't counted as well as the time spent waiting for it.  The times of each
+    thread are also kept separately in threadTimes, by thread name.  Use as a
+    context manager to restore the wrapped functions on exit:
+
+        with PhaseTimer() as timer:
+            timer.wrap(iv.daq, "AInScan", "io")
+            timer.wrap(time, "sleep", "settle")
+            iv.sweep()
+        print(timer.times)"""
+    def __init__(self, allThreads=False):
+        self.allThreads = allThreads
+        self.thread = threading.get_ident()
+        self.threadName = threading.current_thread().name
+        self.times = collections.defaultdict(float)
+        self.threadTimes = collections.defaultdict(lambda: collections.defaultdict(float))
+        self.calls = collections.defaultdict(int)
+        self._local = threading.local()
+        self._patches = []
+
+    def wrap(self, owner, name, phase):
+        """Replace owner.name with a wrapper that adds its run time to phase.
+
+        owner may be a module, class or instance"""
+        original = getattr(owner, name)
+        timer = self
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            if getattr(timer._local, "phase", None) != None:
+                return original(*args, **kwargs)
+            if not timer.allThreads and threading.get_ident() != timer.thread:
+                return original(*args, **kwargs)
+            timer._local.phase = phase
+            t0 = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - t0
+                timer.times[phase] += elapsed
+                timer.threadTimes[threading.current_thread().name][phase] += elapsed
+                timer.calls[phase] += 1
+                timer._local.phase = None
+
+        # Methods looked up on a class are plain functions, so the wrapper binds in the same way
+        ownDict = getattr(owner, "__dict__", {})
+        self._patches.append((owner, name, name in ownDict, ownDict.get(name, original)))
+        setattr(owner, name, timed)
+
+    def wrapAll(self, owner, names, phase):
+        """Wrap each of the named attributes of owner that exist"""
+        for name in names:
+            if hasattr(owner, name):
+                self.wrap(owner, name, phase)
+
+    def restore(self):
+        """Put back all of the wrapped functions, most recent first"""
+        while self._patches:
+            owner, name, owned, original = self._patches.pop()
+            if owned:
+                setattr(owner, name, original)
+            else:
+                delattr(owner, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.restore()
+        return False
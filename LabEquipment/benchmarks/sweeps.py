@@ -0,0 +1,460 @@
+#! /usr/bin/env python
+##################################################
+#                                                #
+# Throughput benchmarks for the mixer sweeps and #
+# the Beamscanner, run against the simulated DAQ #
+# and VISA instruments.                          #
+#                                                #
+# Each case is run at several sizes, recording   #
+# points per second, the time spent in           #
+# instrument I/O, settling sleeps, file output   #
+# and Python overhead, and the peak memory       #
+# allocated.  Results are saved as JSON, and can #
+# be compared against a baseline run to catch    #
+# throughput regressions.                        #
+#                                                #
+##################################################
+
+from __future__ import print_function, division
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import datetime
+import tracemalloc
+import contextlib
+import subprocess
+import concurrent.futures
+
+import numpy as np
+
+from LabEquipment.benchmarks.phaseTimer import PhaseTimer
+
+# DAQ methods that talk to the device
+daqIO = ["AIn", "AInScan", "AInScanList", "AOut", "DOut", "AOutAInScan", "stream", "streamTo"]
+
+
+def useSimulators():
+    """Select the simulated DAQ and VISA backends.
+
+    Must be called before the DAQ objects are created"""
+    os.environ["LABEQUIPMENT_DAQ"] = "sim"
+    os.environ["LABEQUIPMENT_VISA"] = "sim"
+
+
+class Case(object):
+    """A benchmark case, run at each of a list of sizes.
+
+    Subclasses create the application object in setup(), and run the
+    measurement to be timed in run()"""
+    name = None
+    sizes = []
+    quickSizes = []
+    # Time the phases on every thread, for cases that do their I/O on a
+    # background thread.  The phases of each other thread are then reported
+    # separately
+    allThreads = False
+
+    def setup(self, size, outDir):
+        raise NotImplementedError
+
+    def wrap(self, timer, obj):
+        """Wrap the functions making up each phase of the run"""
+        timer.wrapAll(obj.daq, daqIO, "io")
+        timer.wrap(time, "sleep", "settle")
+
+    def run(self, obj):
+        raise NotImplementedError
+
+    def points(self, obj):
+        """Number of measurement points in the completed run"""
+        return len(obj.SweepPts)
+
+    def teardown(self, obj):
+        obj.endDAQ()
+
+
+class IVSweep(Case):
+    """IV.sweep() and IV.spreadsheet() over <size> bias points"""
+    name = "iv"
+    mode = "point"
+    sizes = [21, 81, 321]
+    quickSizes = [21, 81]
+
+    def config(self, size, outDir):
+        return {
+            "sweep":{
+                "min":-4.0,
+                "max":4.0,
+                "step":8.0/(size - 1),
+                "mode":self.mode,
+                "save-file":os.path.join(outDir, "{}.dat".format(self.name)),
+            }
+        }
+
+    def setup(self, size, outDir):
+        from LabEquipment.applications.mixer import IV
+        return IV.IV(config=self.config(size, outDir))
+
+    def wrap(self, timer, obj):
+        super().wrap(timer, obj)
+        timer.wrap(obj, "spreadsheet", "file")
+
+    def run(self, obj):
+        obj.sweep()
+        obj.spreadsheet()
+
+
+class IVWaveformSweep(IVSweep):
+    """IV sweep run as a single hardware paced DAC/ADC scan"""
+    name = "iv-waveform"
+    mode = "waveform"
+
+
+class IVAdaptiveSweep(IVSweep):
+    """IV sweep with adaptive averaging, to the worst case current error of the
+    fixed 200 sample average on the simulated junction"""
+    name = "iv-adaptive"
+
+    def config(self, size, outDir):
+        config = super().config(size, outDir)
+        config["statistics"] = {
+            "adaptive":True,
+            "tolerance":{"V":None, "I":4.5e-4},
+        }
+        return config
+
+
+class IVSettleSweep(IVSweep):
+    """IV sweep detecting when the bias has settled, rather than waiting settleTime"""
+    name = "iv-settle"
+
+    def config(self, size, outDir):
+        config = super().config(size, outDir)
+        config["settle"] = {"mode":"detect"}
+        return config
+
+
+class IVPipelineSweep(IVSweep):
+    """IV sweep setting and reading the bias points on a background acquisition thread"""
+    name = "iv-pipeline"
+    allThreads = True
+
+    def config(self, size, outDir):
+        config = super().config(size, outDir)
+        config["sweep"]["pipeline"] = True
+        return config
+
+
+class IVYSweep(IVSweep):
+    """IVY.sweep() with the load mover switching loads once per sweep"""
+    name = "ivy"
+    sizes = [21, 81]
+    quickSizes = [21]
+
+    def config(self, size, outDir):
+        config = super().config(size, outDir)
+        config["yfactor"] = {
+            "load-switching":"load-mover",
+            "load-mover":{"switch-time":0.1},
+        }
+        return config
+
+    def setup(self, size, outDir):
+        from LabEquipment.applications.mixer import IVY
+        return IVY.IVY(config=self.config(size, outDir))
+
+    def wrap(self, timer, obj):
+        super().wrap(timer, obj)
+        from LabEquipment.applications.mixer import LoadMover
+        timer.wrapAll(obj.loadMover.daq, daqIO, "io")
+        timer.wrap(LoadMover, "sleep", "settle")
+
+    def teardown(self, obj):
+        obj.loadMover.endDAQ()
+        super().teardown(obj)
+
+
+class IVYChoppedSweep(IVYSweep):
+    """IVY.sweep() chopping between the loads with the DAQ digital output at each point"""
+    name = "ivy-chopped"
+
+    def config(self, size, outDir):
+        config = IVSweep.config(self, size, outDir)
+        config["yfactor"] = {"load-switching":"chopped"}
+        return config
+
+    def wrap(self, timer, obj):
+        IVSweep.wrap(self, timer, obj)
+
+    def teardown(self, obj):
+        obj.endDAQ()
+
+
+class IFYSweep(IVYSweep):
+    """IFY.sweep() over <size> YIG frequencies, with an analog YIG filter driver"""
+    name = "ify"
+
+    def config(self, size, outDir):
+        config = super().config(size, outDir)
+        config["sweep"].update({"min":4.0, "max":20.0, "step":16.0/(size - 1)})
+        config["yig-filter"] = {"address":None, "channel":1, "gain":0.2, "offset":0.0}
+        return config
+
+    def setup(self, size, outDir):
+        from LabEquipment.applications.mixer import IFY
+        return IFY.IFY(config=self.config(size, outDir))
+
+
+class BeamscannerScan(Case):
+    """Beamscanner.scan() and spreadsheet() over a <size> x <size> raster grid"""
+    name = "beamscanner"
+    sizes = [3, 5, 9]
+    quickSizes = [3, 5]
+    step = 2500 # Grid spacing in MSL steps
+    velocity = 100000
+    accel = 1000000
+
+    def setup(self, size, outDir):
+        from LabEquipment.applications.Beamscanner import Beamscanner
+        from LabEquipment.drivers.Instrument import HP8508A, HP83630A, HMCT2240, MSL
+
+        bs = Beamscanner.Beamscanner()
+        bs.save_name = os.path.join(outDir, "beamscan.csv")
+        bs.conv_factor = 5000.0
+        bs.Range = (size - 1)*self.step
+        bs.Res = self.step
+        bs.Average = 5
+        bs.CalInterval = 150
+        bs.Format = "POL"
+        bs.Testfreq = 225e9
+        bs.IFfreq = 120e6
+        bs.RFharm = 9
+        bs.RFfinalHarm = 3
+        bs.LOharm = 12
+        bs.RFpow = 0.0
+        bs.LOpow = 20.0
+        bs.velocity = self.velocity
+        bs.accel = self.accel
+        bs.pos_x_center = -37000
+        bs.pos_y_center = 52000
+        bs.searchCenter = (bs.pos_x_center, bs.pos_y_center)
+        bs.centerBeforeScan = False
+        bs.setStep(bs.Res)
+        bs.calcFreqs()
+
+        rm = bs.initGPIB("@sim")
+        bs.vvm = HP8508A.HP8508A(rm.open_resource("GPIB0::8::INSTR"))
+        bs.RF = HMCT2240.HMCT2240(rm.open_resource("GPIB0::30::INSTR"))
+        bs.LO = HP83630A.HP83630A(rm.open_resource("GPIB0::19::INSTR"))
+        bs.msl_x = MSL.MSL(rm.open_resource("ASRL4::INSTR"), partyName="X")
+        bs.msl_y = MSL.MSL(rm.open_resource("ASRL4::INSTR"), partyName="Y")
+        bs.initSG()
+        bs.initVVM()
+        bs.initMSL()
+        bs.initScan(bs.Range, mapFile=self.mapFile(outDir))
+        return bs
+
+    def mapFile(self, outDir):
+        """The MapStore directory for the scan, or None to keep the map in memory"""
+        return None
+
+    def wrap(self, timer, obj):
+        from LabEquipment.drivers.Instrument import VisaSim
+        timer.wrapAll(VisaSim.SimResource, ["write", "read", "query"], "io")
+        # Waiting for I/O running on the bus scheduler's threads
+        timer.wrap(concurrent.futures.Future, "result", "io")
+        timer.wrap(time, "sleep", "settle")
+        timer.wrap(obj, "spreadsheet", "file")
+
+    def run(self, obj):
+        obj.scan()
+        obj.spreadsheet()
+
+    def points(self, obj):
+        return obj.xVals.size
+
+    def teardown(self, obj):
+        pass
+
+
+class BeamscannerFlyScan(BeamscannerScan):
+    """Beamscanner.scan() and spreadsheet() over a <size> x <size> grid as a fly scan"""
+    name = "beamscanner-fly"
+
+    def setup(self, size, outDir):
+        bs = super().setup(size, outDir)
+        bs.scan_type = "fly"
+        return bs
+
+
+class BeamscannerStoredScan(BeamscannerScan):
+    """Beamscanner raster scan kept in a memory mapped MapStore on disk"""
+    name = "beamscanner-stored"
+
+    def mapFile(self, outDir):
+        return os.path.join(outDir, "beamscan.map")
+
+
+cases = [IVSweep(), IVWaveformSweep(), IVAdaptiveSweep(), IVSettleSweep(), IVPipelineSweep(), IVYSweep(), IVYChoppedSweep(), IFYSweep(), BeamscannerScan(), BeamscannerFlyScan(), BeamscannerStoredScan()]
+
+
+def runCase(case, size, outDir, memory=False, verbose=False):
+    """Run case once at size, returning a dictionary of results.
+
+    If memory, the run is traced with tracemalloc to record the peak memory
+    allocated.  Tracing slows Python code, so the timing of such runs should not
+    be compared with untraced runs"""
+    out = sys.stdout if verbose else io.StringIO()
+    with contextlib.redirect_stdout(out):
+        obj = case.setup(size, outDir)
+        try:
+            with PhaseTimer(allThreads=case.allThreads) as timer:
+                case.wrap(timer, obj)
+                if memory:
+                    tracemalloc.start()
+                t0 = time.perf_counter()
+                case.run(obj)
+                total = time.perf_counter() - t0
+                if memory:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+            points = case.points(obj)
+        finally:
+            case.teardown(obj)
+
+    def phaseTimes(times):
+        phases = {p:times.get(p, 0.0) for p in ["io", "settle", "file"]}
+        phases["overhead"] = total - sum(phases.values())
+        return phases
+
+    result = {
+        "size":size,
+        "points":points,
+        "total_s":total,
+        "points_per_s":points/total,
+        "phases_s":phaseTimes(timer.threadTimes[timer.threadName]),
+        "calls":dict(timer.calls),
+    }
+    if case.allThreads:
+        # Phases of the other threads, which overlap those of the main thread
+        result["thread_phases_s"] = {name:phaseTimes(times) for name, times in timer.threadTimes.items()
+                                     if name != timer.threadName}
+    if memory:
+        result["peak_memory_bytes"] = peak
+    return result
+
+
+def scaling(runs):
+    """Fit the run times to fixed + per_point*points, and to points**exponent"""
+    points = np.array([r["points"] for r in runs], dtype=float)
+    times = np.array([r["total_s"] for r in runs])
+    if len(np.unique(points)) < 2:
+        return None
+    perPoint, fixed = np.polyfit(points, times, 1)
+    exponent = np.polyfit(np.log(points), np.log(times), 1)[0]
+    return {"fixed_s":fixed, "per_point_s":perPoint, "exponent":exponent}
+
+
+def _gitCommit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runBenchmarks(names=None, quick=False, repeats=1, memory=True, verbose=False):
+    """Run the named cases (or all cases), returning the results as a dictionary"""
+    useSimulators()
+
+    results = {
+        "timestamp":datetime.datetime.now().isoformat(),
+        "host":platform.node(),
+        "python":platform.python_version(),
+        "numpy":np.__version__,
+        "commit":_gitCommit(),
+        "quick":quick,
+        "repeats":repeats,
+        "cases":{},
+    }
+
+    with tempfile.TemporaryDirectory() as outDir:
+        for case in cases:
+            if names and case.name not in names:
+                continue
+            runs = []
+            peaks = {}
+            for size in (case.quickSizes if quick else case.sizes):
+                for r in range(repeats):
+                    run = runCase(case, size, outDir, verbose=verbose)
+                    run["repeat"] = r
+                    runs.append(run)
+                    print("{:12s} size {:4d}: {:6d} points in {:8.3f} s, {:8.2f} points/s".format(
+                        case.name, size, run["points"], run["total_s"], run["points_per_s"]))
+                if memory:
+                    peaks[size] = runCase(case, size, outDir, memory=True)["peak_memory_bytes"]
+            for run in runs:
+                if run["size"] in peaks:
+                    run["peak_memory_bytes"] = peaks[run["size"]]
+            results["cases"][case.name] = {
+                "description":case.__doc__,
+                "runs":runs,
+                "scaling":scaling(runs),
+            }
+    return results
+
+
+def compare(results, baseline, tolerance=0.1):
+    """Compare points per second against a baseline result set.
+
+    Returns a list of (case, size, baseline points/s, points/s) for runs that are
+    more than tolerance (fractionally) slower than the baseline"""
+    def rates(res):
+        out = {}
+        for name, case in res["cases"].items():
+            for run in case["runs"]:
+                out.setdefault((name, run["size"]), []).append(run["points_per_s"])
+        return {k:np.mean(v) for k, v in out.items()}
+
+    new = rates(results)
+    old = rates(baseline)
+    regressions = []
+    for key in sorted(set(new) & set(old)):
+        if new[key] < old[key]*(1.0 - tolerance):
+            regressions.append((key[0], key[1], old[key], new[key]))
+    return regressions
+
+
+def printSummary(results):
+    """Print the per phase breakdown of each run"""
+    print("\n{:12s} {:>5s} {:>7s} {:>10s} {:>7s} {:>7s} {:>7s} {:>8s} {:>10s}".format(
+        "case", "size", "points", "points/s", "io", "settle", "file", "overhead", "peak MB"))
+    for name, case in results["cases"].items():
+        for run in case["runs"]:
+            fractions = {p:t/run["total_s"] for p, t in run["phases_s"].items()}
+            print("{:12s} {:5d} {:7d} {:10.2f} {:7.1%} {:7.1%} {:7.1%} {:8.1%} {:10.2f}".format(
+                name, run["size"], run["points"], run["points_per_s"], fractions["io"], fractions["settle"],
+                fractions["file"], fractions["overhead"], run.get("peak_memory_bytes", float("nan"))/1e6))
+            for thread, phases in run.get("thread_phases_s", {}).items():
+                fractions = {p:t/run["total_s"] for p, t in phases.items()}
+                print("  {:33s} {:7.1%} {:7.1%} {:7.1%} {:8.1%}".format(
+                    thread, fractions["io"], fractions["settle"], fractions["file"], fractions["overhead"]))
+        s = case["scaling"]
+        if s:
+            print("{:12s} fixed {:.3f} s + {:.2f} ms/point, time ~ points**{:.2f}".format(
+                "", s["fixed_s"], s["per_point_s"]*1000, s["exponent"]))
+
+
+def save(results, filename):
+    with open(filename, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load(filename):
+    with open(filename, "r") as f:
+        return json.load(f)
@@ -10,11 +10,73 @@
 
 from __future__ import print_function, division
 
+import os
 import platform
-if platform.system().lower().startswith('win'):
-    from .DAQ_windows import *
-else:
-    from .DAQ_linux import *
+from importlib import import_module
+from LabEquipment.lib import hjsonConfig
+from . import _default_DAQ_config
+
+# Modules implementing each backend
+_modules = {"sim":".DAQ_sim",
+            "hardware":".DAQ_windows" if platform.system().lower().startswith('win') else ".DAQ_linux"}
+
+
+def backendFor(config=None):
+    """Returns the name of the backend to use: the LABEQUIPMENT_DAQ environment
+    variable if it is set, or else the "backend" key of config, or of the
+    default DAQ config"""
+    try:
+        name = os.environ["LABEQUIPMENT_DAQ"]
+    except KeyError:
+        try:
+            name = config["backend"]
+        except (KeyError, TypeError):
+            name = _default_DAQ_config.defaultConfig["backend"]
+    name = name.lower()
+    if name not in _modules:
+        raise ValueError("Unknown DAQ backend {:s}".format(name))
+    return name
+
+
+def backendModule(name):
+    """Returns the module of the backend name, importing it if needed"""
+    return import_module(_modules[name], __package__)
+
+
+# The backend used when no config selects one
+backend = backendFor()
+
+
+def DAQ(config=None, configFile=None, verbose=False, vverbose=False, autoConnect=True):
+    """Create a DAQ object of the backend selected by the LABEQUIPMENT_DAQ
+    environment variable, or else the "backend" key of config, configFile or
+    the default DAQ config, in that order.  The arguments are passed on to the
+    backend's DAQ class"""
+    merged = _default_DAQ_config.defaultConfig
+    if configFile != None:
+        merged = hjsonConfig.merge(merged, hjsonConfig.hjsonConfig(filename=configFile))
+    if config != None:
+        merged = hjsonConfig.merge(merged, config)
+    daqClass = backendModule(backendFor(merged)).DAQ
+    return daqClass(config=config, configFile=configFile, verbose=verbose, vverbose=vverbose, autoConnect=autoConnect)
+
+
+def configure(daq, config, verbose=False):
+    """Apply config, a DAQ config section, to the DAQ object daq, and return it.
+
+    If daq is None, or config selects a different backend, a new DAQ object of
+    that backend is returned, without connecting, and daq is disconnected"""
+    if daq == None:
+        return DAQ(config=config, verbose=verbose, autoConnect=False)
+    if config == None:
+        return daq
+    merged = hjsonConfig.merge(daq.config, config)
+    if backendFor(merged) == daq.backend:
+        daq.setConfig(config)
+        return daq
+    daq.disconnect()
+    return DAQ(config=merged, verbose=daq.vverbose, autoConnect=False)
+
 
 if __name__ == "__main__":
     daq = DAQ()
@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+##################################################
+#                                                #
+# Shares one connected DAQ device per board      #
+# number between all of the DAQ objects in a     #
+# process, e.g. the IV and LoadMover objects in  #
+# IVY, which use the same board.                 #
+#                                                #
+##################################################
+
+from __future__ import print_function, division
+
+import threading
+
+_lock = threading.Lock()
+_handles = {}
+_inventories = {}
+
+
+class DeviceHandle(object):
+    """A connected DAQ board, shared by all of the DAQ objects connected to it.
+
+    device is the backend's device object.  Use of each of the analog input,
+    analog output and digital subsystems is serialized by the ai, ao and dio
+    locks, so different subsystems can be used at the same time from different
+    threads.  info caches information read from the device, and state holds any
+    other per board state the backend needs to share."""
+    def __init__(self, backend, boardnum, device):
+        self.backend = backend
+        self.boardnum = boardnum
+        self.device = device
+        self.refs = 0
+        self.ai = threading.RLock()
+        self.ao = threading.RLock()
+        self.dio = threading.RLock()
+        self.info = {}
+        self.state = {}
+
+    def cached(self, key, get):
+        """Return the info stored under key, calling get() to read it from the device if needed"""
+        try:
+            return self.info[key]
+        except KeyError:
+            value = self.info[key] = get()
+            return value
+
+
+def inventory(backend, listDevices):
+    """Return the list of devices found by listDevices(), calling it only the first
+    time the inventory is needed for backend"""
+    with _lock:
+        try:
+            return _inventories[backend]
+        except KeyError:
+            pass
+    devices = listDevices()
+    if devices:
+        with _lock:
+            _inventories.setdefault(backend, devices)
+    return devices
+
+
+def clearInventory(backend=None):
+    """Forget the device inventory, so that it is listed again on the next connect"""
+    with _lock:
+        if backend == None:
+            _inventories.clear()
+        else:
+            _inventories.pop(backend, None)
+
+
+def acquire(backend, boardnum, openDevice):
+    """Return the DeviceHandle for board boardnum, calling openDevice(boardnum) to
+    connect to the board if no other DAQ object is connected to it"""
+    key = (backend, boardnum)
+    with _lock:
+        try:
+            handle = _handles[key]
+        except KeyError:
+            handle = _handles[key] = DeviceHandle(backend, boardnum, openDevice(boardnum))
+        handle.refs += 1
+        return handle
+
+
+def release(handle, closeDevice):
+    """Release a handle returned by acquire(), calling closeDevice(device) once the
+    last DAQ object connected to the board has released it.
+
+    Returns True if the device was closed"""
+    key = (handle.backend, handle.boardnum)
+    with _lock:
+        handle.refs -= 1
+        if handle.refs > 0:
+            return False
+        if _handles.get(key) is handle:
+            del _handles[key]
+    closeDevice(handle.device)
+    return True
+
+
+def connected():
+    """Return a dictionary of the number of DAQ objects connected to each (backend, boardnum)"""
+    with _lock:
+        return {k:h.refs for k, h in _handles.items()}
@@ -0,0 +1,121 @@
+#! /usr/bin/env python
+##################################################
+#                                                #
+# On disk cache of the capabilities of DAQ       #
+# boards - channel counts, ranges, scan support  #
+# and so on - keyed by product and unique ID, so #
+# that connecting doesn't need to probe the      #
+# board each time.                               #
+#                                                #
+##################################################
+
+from __future__ import print_function, division
+
+import os
+import json
+import tempfile
+import threading
+
+# Increment when the stored capabilities change, to invalidate old caches
+cacheVersion = 2
+
+
+class CachedProps(object):
+    """Device information read from the capability cache, with the same
+    attributes as the objects that it replaces"""
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class CapabilityCache(object):
+    """A JSON file of board capabilities, keyed by product ID and unique ID.
+
+    A different board has a different key, so it is probed when it first
+    appears, while the capabilities of boards seen before are kept"""
+    def __init__(self, filename):
+        self.filename = os.path.expanduser(filename)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(descriptor):
+        """Return the cache key for the board with DaqDeviceDescriptor descriptor,
+        or None if the board can't be identified"""
+        if not descriptor.unique_id:
+            return None
+        return "{}:{}".format(descriptor.product_id, descriptor.unique_id)
+
+    def _read(self):
+        try:
+            with open(self.filename, "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(entries, dict):
+            return {}
+        return entries
+
+    def _write(self, entries):
+        """Write entries to the cache file, replacing it atomically"""
+        directory = os.path.dirname(self.filename) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".daq-capabilities")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.filename)
+        except OSError:
+            os.unlink(tmp)
+            raise
+
+    def get(self, descriptor):
+        """Return the cached capabilities of the board, or None if it isn't cached"""
+        key = self.key(descriptor)
+        if key == None:
+            return None
+        with self.lock:
+            entry = self._read().get(key)
+        if entry == None or entry.get("version") != cacheVersion:
+            return None
+        return entry["capabilities"]
+
+    def put(self, descriptor, capabilities):
+        """Store the capabilities of the board.  Failure to write the cache is not an error"""
+        key = self.key(descriptor)
+        if key == None:
+            return
+        with self.lock:
+            entries = self._read()
+            entries[key] = {
+                "version":cacheVersion,
+                "product":descriptor.product_name,
+                "capabilities":capabilities,
+            }
+            try:
+                self._write(entries)
+            except OSError as err:
+                print("DAQCapabilities: Could not write capability cache {:s}: {}".format(self.filename, err))
+
+    def clear(self, descriptor=None):
+        """Forget the capabilities of the board, or of all boards"""
+        with self.lock:
+            if descriptor == None:
+                entries = {}
+            else:
+                entries = self._read()
+                entries.pop(self.key(descriptor), None)
+            try:
+                self._write(entries)
+            except OSError:
+                pass
+
+
+def cacheFor(config):
+    """Return the CapabilityCache set by config["capabilityCache"], or None if
+    caching is disabled"""
+    try:
+        filename = config["capabilityCache"]
+    except KeyError:
+        return None
+    if not filename:
+        return None
+    return CapabilityCache(filename)
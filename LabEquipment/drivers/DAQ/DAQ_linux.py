@@ -15,26 +15,36 @@
 from __future__ import print_function, division
 
 from uldaq import *
+import time
 from time import sleep
 import numpy as np
 from LabEquipment.lib import hjsonConfig
 
 from . import _default_DAQ_config
+from . import DAQBroker
+from . import DAQCapabilities
 
 
 class DAQ:
+    # Name of the backend, as selected in the DAQ config
+    backend = "hardware"
+
     def __init__(self, config=None, configFile=None, verbose=False, vverbose=True, autoConnect=True):
         """Create the DAQ device, and if autoConnect, automatically connect to
         board number 0"""
         self.verbose = verbose or vverbose
         self.vverbose = vverbose # Set to true to set config object to be verbose
 
+        # Scan buffers kept for reuse, keyed by (channel_count, samples_per_channel)
+        self._scanBuffers = {}
+
         # Load the default config
         self.config = None
         self.setConfig(_default_DAQ_config.defaultConfig)
 
         self.devices = None
         self.daq_device = None
+        self.handle = None
         self.boardnum = None
 
         self.interface_type = enums.InterfaceType.USB
@@ -80,7 +90,10 @@ class DAQ:
         self.AiRange = self.lookUpRange(self.config["ADCrange"], self.config["ADCpolarity"])
         self.DoPort = self.lookUpDioPort(self.config["DOutPort"])
         self.DiPort = self.lookUpDioPort(self.config["DInPort"])
-        self.sleepTime = self.config("sleepTime")
+        self.sleepTime = self.config["sleepTime"]
+        self.bufferPool = self.config["bufferPool"]
+        if not self.bufferPool:
+            self.clearBufferPool()
 
 
     def lookUpMode(self, mode):
@@ -105,7 +118,7 @@ class DAQ:
     def listDevices(self):
         """List DAQ devices connected to this machine"""
         try:
-            self.devices = get_daq_device_inventory(self.interface_type)
+            self.devices = DAQBroker.inventory("linux", lambda: get_daq_device_inventory(self.interface_type))
             self.number_of_devices = len(self.devices)
             if self.number_of_devices == 0:
                 raise Exception('Error: No DAQ devices found')
@@ -118,7 +131,7 @@ class DAQ:
 
     def connect(self, boardnum=None):
         """Connects to DAQ device <boardnum>.  If device is already connected,
-        this will access that device.
+        by this or another DAQ object, this will share that device.
 
         Sets self.daq_device to the resulting uldaq object."""
         if boardnum == None:
@@ -127,26 +140,25 @@ class DAQ:
         try:
             if self.devices == None:
                 self.listDevices()
-            if self.daq_device != None:
-                del self.daq_device
-            self.daq_device = DaqDevice(self.devices[boardnum])
+            if self.handle != None:
+                self._release()
+            self.handle = DAQBroker.acquire("linux", boardnum, self._openDevice)
+            self.daq_device = self.handle.device
             self.boardnum = boardnum
-            # Connect to DAQ device
-            descriptor = self.daq_device.get_descriptor()
-            if not self.daq_device.is_connected():
-                self.daq_device.connect()
             if self.verbose:
+                descriptor = self.daq_device.get_descriptor()
                 print("Connected to {:s} {:s}".format(descriptor.product_name, descriptor.unique_id))
         except (KeyboardInterrupt, ValueError):
             print("Could not connect to DAQ device.")
 
         # Get some basic info on the device
-        self.AiDevice = self.daq_device.get_ai_device()
+        self.AiDevice = self.handle.cached("AiDevice", self.daq_device.get_ai_device)
         self.getAiInfo()
-        self.AoDevice = self.daq_device.get_ao_device()
+        self.AoDevice = self.handle.cached("AoDevice", self.daq_device.get_ao_device)
         self.getAoInfo()
-        self.DioDevice = self.daq_device.get_dio_device()
+        self.DioDevice = self.handle.cached("DioDevice", self.daq_device.get_dio_device)
         self.getDioInfo()
+        self.capabilities = self.handle.cached("capabilities", self._loadCapabilities)
 
         # Set the Ai Input mode and range to that specified in __init__
         self.setAiMode(self.AiMode)
@@ -157,10 +169,32 @@ class DAQ:
         self.getAiRange()
         self.getAoRange()
 
+    def _openDevice(self, boardnum):
+        """Create and connect the uldaq device for board boardnum.  Called by
+        DAQBroker.acquire when no other DAQ object is connected to the board"""
+        device = DaqDevice(self.devices[boardnum])
+        if not device.is_connected():
+            device.connect()
+        return device
+
+    @staticmethod
+    def _closeDevice(device):
+        """Disconnect and release the uldaq device once no DAQ objects are using it"""
+        if device.is_connected():
+            device.disconnect()
+        device.release()
+
+    def _release(self):
+        """Release this object's handle on the shared device"""
+        DAQBroker.release(self.handle, self._closeDevice)
+        self.handle = None
+
     def disconnect(self):
-        """Disconnects DAQ device"""
-        if self.daq_device != None:
-            del self.daq_device
+        """Disconnects DAQ device.  The device is only closed once all DAQ objects
+        sharing it have disconnected"""
+        self.clearBufferPool()
+        if self.handle != None:
+            self._release()
             if self.verbose:
                     print("DAQ device {:s} {:s} is disconnected.".format(self.devices[self.boardnum].product_name, self.devices[self.boardnum].unique_id))
         else:
@@ -178,34 +212,69 @@ class DAQ:
             name = None
         return name
 
+    def _loadCapabilities(self):
+        """Return the capabilities of the connected board from the capability
+        cache, probing the board if it isn't in the cache"""
+        cache = DAQCapabilities.cacheFor(self.config)
+        descriptor = self.daq_device.get_descriptor()
+        if cache != None:
+            capabilities = cache.get(descriptor)
+            if capabilities != None:
+                return capabilities
+        capabilities = self._probeCapabilities()
+        if cache != None:
+            cache.put(descriptor, capabilities)
+        return capabilities
+
+    def _probeCapabilities(self):
+        """Read the capabilities of the connected board from the AI, AO and DIO Info objects"""
+        capabilities = {
+            "aiChannels":{},
+            "aiRanges":{},
+            "aiQueueLength":{},
+            "aiPacer":self.AiInfo.has_pacer(),
+            "aiQueueTypes":[q.name for q in self.AiInfo.get_queue_types()],
+            "aiQueueLimitations":[l.name for l in self.AiInfo.get_chan_queue_limitations()],
+            "aoChannels":self.AoInfo.get_num_chans(),
+            "aoRanges":[r.name for r in self.AoInfo.get_ranges()],
+            "aoPacer":self.AoInfo.has_pacer(),
+            "dioPorts":[p.name for p in self.DioInfo.get_port_types()],
+            "packetSize":1,
+        }
+        for mode in AnalogInputMode:
+            n = self.AiInfo.get_num_chans_by_mode(mode)
+            capabilities["aiChannels"][mode.name] = n
+            capabilities["aiRanges"][mode.name] = [r.name for r in self.AiInfo.get_ranges(mode)] if n else []
+            capabilities["aiQueueLength"][mode.name] = self.AiInfo.get_max_queue_length(mode) if n else 0
+        return capabilities
+
     def numChannels(self):
         """Get the number of channels in the current AI Mode"""
-        self.number_of_channels = self.AiInfo.get_num_chans_by_mode(self.AiMode)
+        self.number_of_channels = self.capabilities["aiChannels"][self.AiMode.name]
 
     def getAiInfo(self):
         """Get the AI Info object"""
         if self.daq_device == None:
             raise RuntimeError("DAQ device is not connected")
-        self.AiInfo = self.AiDevice.get_info()
+        self.AiInfo = self.handle.cached("AiInfo", self.AiDevice.get_info)
 
     def getAoInfo(self):
         """Get the AO Info object"""
         if self.daq_device == None:
             raise RuntimeError("DAQ device is not connected")
-        self.AoInfo = self.AoDevice.get_info()
+        self.AoInfo = self.handle.cached("AoInfo", self.AoDevice.get_info)
 
     def getDioInfo(self):
         """Get the DIO Info object"""
         if self.daq_device == None:
             raise RuntimeError("DAQ device is not connected")
-        self.DioInfo = self.DioDevice.get_info()
+        self.DioInfo = self.handle.cached("DioInfo", self.DioDevice.get_info)
 
     def setAiMode(self, mode):
         """Set the AiMode to one of the modes in AnalogInputMode"""
         self.AiMode = mode
-        self.getAiInfo()
         self.numChannels()
-        self.setAiRange(self.AiInfo.get_ranges(self.AiMode)[0])
+        self.setAiRange(self.getAiRanges()[0])
         self.getAiRange()
 
     def getAiMode(self):
@@ -222,7 +291,7 @@ class DAQ:
 
     def setAiRangeIndex(self, r):
         """Sets the AI Range to the index r in the list of ranges returned by
-        self.AiInfo.get_ranges(self.AiMode)"""
+        self.getAiRanges()"""
         ranges = self.getAiRanges()
         if r < len(ranges):
             self.AiRange = ranges[r]
@@ -231,7 +300,7 @@ class DAQ:
 
     def getAiRangeIndex(self):
         """Returns the index of the current AiRange in the list of
-        self.AiInfo.get_ranges(self.AiMode)"""
+        self.getAiRanges()"""
         ranges = self.getAiRanges()
         return ranges.index(self.AiRange)
 
@@ -245,7 +314,7 @@ class DAQ:
 
     def getAiRanges(self):
         """Returns the list of valid ranges for this DAQ"""
-        return self.AiInfo.get_ranges(self.AiMode)
+        return [Range[r] for r in self.capabilities["aiRanges"][self.AiMode.name]]
 
     def setAoRange(self, r):
         """Sets the AO Range to one of the members of the Range class"""
@@ -255,23 +324,23 @@ class DAQ:
         """Returns the current AO Range"""
         return self.AoRange
 
-    def setAiRangeIndec(self, r):
-        """Sets the AO Range to one of the ranges returned by AoGetRanges()"""
-        ranges = self.getAoInfoRanges()
+    def setAoRangeIndex(self, r):
+        """Sets the AO Range to one of the ranges returned by getAoRanges()"""
+        ranges = self.getAoRanges()
         if r < len(ranges):
             self.AoRange = ranges[r]
         else:
             raise ValueError("Specified range index not found")
 
-    def getAiRangeIndex(self):
+    def getAoRangeIndex(self):
         """Returns the index of the current AoRange in the list of ranges
         returned by self.getAoRanges()"""
         ranges = self.getAoRanges()
         return ranges.index(self.AoRange)
 
-    def getAiRanges(self):
+    def getAoRanges(self):
         """Returns the list of available AoRanges"""
-        self.AoInfo.get_ranges()
+        return [Range[r] for r in self.capabilities["aoRanges"]]
 
 
     def AIn(self, channel = 0):
@@ -282,7 +351,8 @@ class DAQ:
             raise ValueError("channel index requested is higher than number of channels")
         if channel < 0:
             raise ValueError("channel index must be 0 or positive")
-        data = self.AiDevice.a_in(channel, self.AiMode, self.AiRange, AInFlag.DEFAULT)
+        with self.handle.ai:
+            data = self.AiDevice.a_in(channel, self.AiMode, self.AiRange, AInFlag.DEFAULT)
         return data
 
     def AOut(self, data, channel=0):
@@ -291,21 +361,26 @@ class DAQ:
             raise RuntimeError("DAQ device is not connected")
         if channel < 0:
             raise ValueError("channel index must be 0 or positive")
-        self.AoDevice.a_out(channel, self.AoRange, AOutFlag.DEFAULT, data)
+        with self.handle.ao:
+            self.AoDevice.a_out(channel, self.AoRange, AOutFlag.DEFAULT, data)
 
     def DOut(self, data, channel=0, port=DigitalPortType.FIRSTPORTA):
         """Write output digital data to specified channel"""
-        # Configure port
-        self.DioDevice.d_config_port(port, DigitalDirection.OUTPUT)
+        with self.handle.dio:
+            # Configure port
+            self.DioDevice.d_config_port(port, DigitalDirection.OUTPUT)
 
-        # Writes output for bit
-        self.DioDevice.d_bit_out(port, channel, data)
+            # Writes output for bit
+            self.DioDevice.d_bit_out(port, channel, data)
 
     def AInScan(self, low_channel, high_channel, rate, samples_per_channel, scan_time = None):
         """Runs a scan across multiple channels, with multiple samples per channel.  Returns a numpy array of
-        shape (samples_per_channel, channel_count)"""
+        shape (samples_per_channel, channel_count).
+
+        The array is a view of the scan buffer.  If bufferPool is set, it will be
+        overwritten by the next scan of the same shape."""
         # Verify that the specified device supports hardware pacing for analog input.
-        if not self.AiInfo.has_pacer():
+        if not self.capabilities["aiPacer"]:
             raise Exception('Error: The specified DAQ device does not support hardware paced analog input')
 
         # Verify the high channel does not exceed the number of channels, and
@@ -314,38 +389,266 @@ class DAQ:
             high_channel = self.number_of_channels - 1
         channel_count = high_channel - low_channel + 1
 
-        # Allocate a buffer to receive the data.
+        # Get a buffer to receive the data.
+        data, d = self._getScanBuffer(channel_count, samples_per_channel)
+
+        self._runAInScan(low_channel, high_channel, rate, samples_per_channel, data, scan_time)
+        return d
+
+    def _runAInScan(self, low_channel, high_channel, rate, samples_per_channel, data, scan_time=None):
+        """Runs an analog input scan into buffer data, waiting until it is complete"""
+        with self.handle.ai:
+            status = ScanStatus.IDLE
+            try:
+                # Start the acquisition.
+                self.AiDevice.a_in_scan(low_channel, high_channel, self.AiMode, self.AiRange, samples_per_channel,
+                                                rate, ScanOption.CONTINUOUS, AInScanFlag.DEFAULT, data)
+
+                start_time = time.time()
+
+                # Set scan time to a high number of seconds if it isn't set
+                if scan_time == None:
+                    scan_time = 500000
+
+                while (time.time() - start_time) <= scan_time:
+                    # Get the status of the background operation
+                    status, transfer_status = self.AiDevice.get_scan_status()
+                    index = transfer_status.current_index
+
+                    # Check to see if we are done
+                    if transfer_status.current_scan_count >= samples_per_channel:
+                        break
+
+                    sleep(self.sleepTime)
+            finally:
+                if self.daq_device:
+                    # Stop the acquisition if it is still running.
+                    if status == ScanStatus.RUNNING:
+                        self.AiDevice.scan_stop()
+
+    def supportsChannelList(self, channels, ranges=None):
+        """Returns True if the device's channel queue can scan the list of channels,
+        with the list of ranges if given, in a single scan"""
+        queueTypes = self.capabilities["aiQueueTypes"]
+        limitations = self.capabilities["aiQueueLimitations"]
+        if "CHAN" not in queueTypes:
+            return False
+        if len(channels) > self.capabilities["aiQueueLength"][self.AiMode.name]:
+            return False
+        if ranges != None and len(set(ranges)) > 1 and "GAIN" not in queueTypes:
+            return False
+        if "UNIQUE_CHAN" in limitations and len(set(channels)) < len(channels):
+            return False
+        if "ASCENDING_CHAN" in limitations and list(channels) != sorted(channels):
+            return False
+        if "CONSECUTIVE_CHAN" in limitations and list(channels) != list(range(channels[0], channels[0] + len(channels))):
+            return False
+        return True
+
+    def AInScanList(self, channels, rate, samples_per_channel, ranges=None, scan_time=None):
+        """Runs a scan of the list of channels, with multiple samples per channel.
+        Returns a numpy array of shape (samples_per_channel, len(channels)), with
+        the columns in the order of channels.
+
+        ranges is an optional list of the range to use for each channel.  If the
+        device's channel queue can scan the list, only the listed channels are
+        sampled, so each gets a larger share of the aggregate sample rate.
+        Otherwise the contiguous block of channels between the lowest and highest
+        listed channels is scanned, at the current AiRange"""
+        channels = list(channels)
+        if not self.supportsChannelList(channels, ranges):
+            if self.vverbose:
+                print("DAQ.AInScanList: Channel queue can't scan {}, scanning contiguous channels".format(channels))
+            low_channel = min(channels)
+            d = self.AInScan(low_channel, max(channels), rate, samples_per_channel, scan_time)
+            return d[:, [c - low_channel for c in channels]]
+
+        # Verify that the specified device supports hardware pacing for analog input.
+        if not self.capabilities["aiPacer"]:
+            raise Exception('Error: The specified DAQ device does not support hardware paced analog input')
+        for c in channels:
+            if c < 0 or c >= self.number_of_channels:
+                raise ValueError("channel {:d} is not a valid channel index".format(c))
+
+        queue = []
+        for i, c in enumerate(channels):
+            element = AiQueueElement()
+            element.channel = c
+            element.input_mode = self.AiMode
+            element.range = ranges[i] if ranges != None else self.AiRange
+            queue.append(element)
+
+        # Get a buffer to receive the data.
+        data, d = self._getScanBuffer(len(channels), samples_per_channel)
+
+        with self.handle.ai:
+            self.AiDevice.a_in_load_queue(queue)
+            try:
+                # The channels scanned come from the queue
+                self._runAInScan(min(channels), max(channels), rate, samples_per_channel, data, scan_time)
+            finally:
+                # Clear the queue so that other scans use the channel range again
+                self.AiDevice.a_in_load_queue([])
+        return d
+
+    def _getScanBuffer(self, channel_count, samples_per_channel):
+        """Returns a (buffer, array) pair, where buffer is a uldaq float buffer
+        for a scan and array is a numpy view of it with shape
+        (samples_per_channel, channel_count).
+
+        If bufferPool is set, the buffer is kept and reused for later scans of
+        the same shape, so arrays returned by those scans share memory."""
+        key = (channel_count, samples_per_channel)
+        if self.bufferPool and key in self._scanBuffers:
+            return self._scanBuffers[key]
+
         data = create_float_buffer(channel_count, samples_per_channel)
+        d = np.ctypeslib.as_array(data).reshape((samples_per_channel, channel_count))
 
-        try:
-            # Start the acquisition.
-            self.AiDevice.a_in_scan(low_channel, high_channel, self.AiMode, self.AiRange, samples_per_channel,
-                                            rate, ScanOption.CONTINUOUS, AInScanFlag.DEFAULT, data)
+        if self.bufferPool:
+            self._scanBuffers[key] = (data, d)
+        return data, d
 
-            start_time = time.time()
+    def clearBufferPool(self):
+        """Releases all the scan buffers held for reuse"""
+        self._scanBuffers.clear()
 
-            # Set scan time to a high number of seconds if it isn't set
-            if scan_time == None:
-                scan_time = 500000
+    def stream(self, low_channel, high_channel, rate, block_size, buffer_blocks=16, max_blocks=None, copy=False):
+        """Runs a continuous background scan across multiple channels into a
+        circular buffer holding buffer_blocks blocks of block_size samples per
+        channel, and yields (index, block) tuples as each block is filled.
 
-            while (time.time() - start_time) <= scan_time:
-                # Get the status of the background operation
-                status, transfer_status = self.AiDevice.get_scan_status()
-                index = transfer_status.current_index
+        index is the absolute sample number of the first sample in the block,
+        counted from the start of the stream.  block is a numpy array of shape
+        (block_size, channel_count).  Unless copy is True, block is a view into
+        the circular buffer, and is only valid until the next buffer_blocks - 1
+        blocks have been acquired, or the stream ends.
 
-                # Check to see if we are done
-                if transfer_status.current_scan_count >= samples_per_channel:
-                    break
+        The scan runs until max_blocks blocks have been yielded, or the
+        generator is closed.  Raises RuntimeError if the buffer overruns."""
+        # Verify that the specified device supports hardware pacing for analog input.
+        if not self.capabilities["aiPacer"]:
+            raise Exception('Error: The specified DAQ device does not support hardware paced analog input')
 
-                sleep(self.sleepTime)
-        finally:
-            if self.daq_device:
-                # Stop the acquisition if it is still running.
-                if status == ScanStatus.RUNNING:
+        # Verify the high channel does not exceed the number of channels, and
+        # set the channel count.
+        if high_channel >= self.number_of_channels:
+            high_channel = self.number_of_channels - 1
+        channel_count = high_channel - low_channel + 1
+
+        # Allocate the circular buffer once for the whole stream
+        buffer_samples = block_size*buffer_blocks
+        data = create_float_buffer(channel_count, buffer_samples)
+        ring = np.ctypeslib.as_array(data).reshape((buffer_blocks, block_size, channel_count))
+
+        with self.handle.ai:
+            try:
+                # Start the acquisition.
+                self.AiDevice.a_in_scan(low_channel, high_channel, self.AiMode, self.AiRange, buffer_samples,
+                                                rate, ScanOption.CONTINUOUS, AInScanFlag.DEFAULT, data)
+
+                block = 0
+                while max_blocks == None or block < max_blocks:
+                    # Get the status of the background operation
+                    status, transfer_status = self.AiDevice.get_scan_status()
+                    if status != ScanStatus.RUNNING:
+                        raise RuntimeError("DAQ stream stopped unexpectedly")
+
+                    acquired = transfer_status.current_scan_count
+                    if acquired > (max(block - 1, 0) + buffer_blocks)*block_size:
+                        raise RuntimeError("DAQ stream buffer overrun at sample {:d}".format(block*block_size))
+
+                    if acquired < (block + 1)*block_size:
+                        sleep(self.sleepTime)
+                        continue
+
+                    # Yield one block per status check, so that overruns are caught
+                    # even if the consumer is slow
+                    d = ring[block % buffer_blocks]
+                    if copy:
+                        d = d.copy()
+                    yield block*block_size, d
+                    block += 1
+            finally:
+                if self.daq_device:
+                    # Stop the acquisition
                     self.AiDevice.scan_stop()
 
-        d = np.array(data)
-        d = d.reshape((samples_per_channel, channel_count))
+    def streamTo(self, callback, low_channel, high_channel, rate, block_size, buffer_blocks=16, max_blocks=None, copy=False):
+        """Runs stream(), passing each (index, block) to callback(index, block).
+
+        The stream stops when callback returns False, or after max_blocks blocks"""
+        blocks = self.stream(low_channel, high_channel, rate, block_size, buffer_blocks, max_blocks, copy)
+        try:
+            for index, block in blocks:
+                if callback(index, block) == False:
+                    break
+        finally:
+            blocks.close()
+
+    def supportsAOutScan(self):
+        """Returns True if the device supports hardware paced analog output"""
+        return self.capabilities["aoPacer"]
+
+    def AOutAInScan(self, aout_data, ao_channel, low_channel, high_channel, rate, scan_time = None):
+        """Runs a hardware paced analog output scan of aout_data on ao_channel,
+        clocked at rate in lockstep with an analog input scan across multiple
+        channels.  One sample is taken on each input channel for each output
+        sample.
+
+        The input scan is started before the output scan, so any offset between
+        the start of the two scans appears as a short delay at the start of the
+        output waveform.  Returns a numpy array of shape
+        (len(aout_data), channel_count)"""
+        # Verify that the specified device supports hardware pacing for analog input and output.
+        if not self.capabilities["aiPacer"]:
+            raise Exception('Error: The specified DAQ device does not support hardware paced analog input')
+        if not self.supportsAOutScan():
+            raise Exception('Error: The specified DAQ device does not support hardware paced analog output')
+
+        # Verify the high channel does not exceed the number of channels, and
+        # set the channel count.
+        if high_channel >= self.number_of_channels:
+            high_channel = self.number_of_channels - 1
+        channel_count = high_channel - low_channel + 1
+        samples_per_channel = len(aout_data)
+
+        # Allocate buffers for the output waveform and the input data
+        out_data = create_float_buffer(1, samples_per_channel)
+        np.ctypeslib.as_array(out_data)[:] = aout_data
+        data, d = self._getScanBuffer(channel_count, samples_per_channel)
+
+        with self.handle.ai, self.handle.ao:
+            try:
+                # Start the acquisition, then the output waveform
+                self.AiDevice.a_in_scan(low_channel, high_channel, self.AiMode, self.AiRange, samples_per_channel,
+                                                rate, ScanOption.DEFAULTIO, AInScanFlag.DEFAULT, data)
+                self.AoDevice.a_out_scan(ao_channel, ao_channel, self.AoRange, samples_per_channel,
+                                                rate, ScanOption.DEFAULTIO, AOutScanFlag.DEFAULT, out_data)
+
+                start_time = time.time()
+
+                # Set scan time to a high number of seconds if it isn't set
+                if scan_time == None:
+                    scan_time = 500000
+
+                while (time.time() - start_time) <= scan_time:
+                    # Get the status of the background operations
+                    status, transfer_status = self.AiDevice.get_scan_status()
+                    out_status, out_transfer_status = self.AoDevice.get_scan_status()
+
+                    # Check to see if we are done
+                    if transfer_status.current_scan_count >= samples_per_channel:
+                        break
+
+                    sleep(self.sleepTime)
+            finally:
+                if self.daq_device:
+                    # Stop the acquisition and output, whether or not they were
+                    # seen running - the input scan may have started before
+                    # a_out_scan raised
+                    self.AiDevice.scan_stop()
+                    self.AoDevice.scan_stop()
 
         return d
 
@@ -0,0 +1,620 @@
+#! /usr/bin/env python
+##################################################
+#                                                #
+# Simulated DAQ device, for running, profiling   #
+# and benchmarking the mixer applications        #
+# without MCC DAQ hardware.                      #
+#                                                #
+# Import this via the DAQ.py wrapper, by setting #
+# LABEQUIPMENT_DAQ=sim in the environment or     #
+# "backend":"sim" in the DAQ config.             #
+#                                                #
+##################################################
+
+from __future__ import print_function, division
+
+import enum
+import time
+from time import sleep
+import numpy as np
+import pprint
+from LabEquipment.lib import hjsonConfig
+
+from . import _default_DAQ_config
+from . import DAQBroker
+
+
+class ULRange(enum.Enum):
+    """Simulated analog ranges, named as in the MCC libraries"""
+    BIP10VOLTS = (-10.0, 10.0)
+    BIP5VOLTS = (-5.0, 5.0)
+    BIP4VOLTS = (-4.0, 4.0)
+    BIP2PT5VOLTS = (-2.5, 2.5)
+    BIP2VOLTS = (-2.0, 2.0)
+    BIP1PT25VOLTS = (-1.25, 1.25)
+    BIP1VOLTS = (-1.0, 1.0)
+    UNI10VOLTS = (0.0, 10.0)
+    UNI5VOLTS = (0.0, 5.0)
+
+    @property
+    def range_min(self):
+        return self.value[0]
+
+    @property
+    def range_max(self):
+        return self.value[1]
+
+
+class AnalogInputMode(enum.Enum):
+    """Simulated analog input modes, with the number of channels in each"""
+    DIFFERENTIAL = 4
+    SINGLE_ENDED = 8
+
+
+class DigitalPortType(enum.Enum):
+    """Simulated digital ports"""
+    AUXPORT = 1
+    FIRSTPORTA = 10
+    FIRSTPORTB = 11
+
+
+def logistic(x):
+    """Smooth step from 0 to 1, used to build the junction model"""
+    return 0.5*(1.0 + np.tanh(x))
+
+
+class SISJunction(object):
+    """A simple model of an LO pumped SIS junction.
+
+    Gives the DC current through the junction, and the IF output power seen
+    with a hot or cold load in the beam, as functions of the bias voltage in mV"""
+    def __init__(self, vgap=2.8, rn=10.0, rsg=300.0, width=0.03, photonStep=0.9, pumping=0.3, trx=40.0, gain=1e-3):
+        self.vgap = vgap # Gap voltage in mV
+        self.rn = rn # Normal state resistance in Ohms
+        self.rsg = rsg # Subgap resistance in Ohms
+        self.width = width # Width of the gap and photon step edges in mV
+        self.photonStep = photonStep # Width of the first photon step (hf/e) in mV
+        self.pumping = pumping # Height of the photon step as a fraction of the gap current
+        self.trx = trx # Receiver noise temperature in K on the photon step
+        self.gain = gain # IF power per K of load plus receiver temperature
+
+    def _onGap(self, v):
+        """Fraction of the way up the gap edge"""
+        return logistic((np.abs(v) - self.vgap)/self.width)
+
+    def _onStep(self, v):
+        """1 on the first photon step below the gap, 0 elsewhere"""
+        return logistic((np.abs(v) - self.vgap + self.photonStep)/self.width)*(1.0 - self._onGap(v))
+
+    def current(self, v):
+        """Junction current in mA at bias voltage v in mV"""
+        v = np.asarray(v)
+        gapCurrent = self.vgap/self.rn
+        return v/self.rn*self._onGap(v) + np.sign(v)*self.pumping*gapCurrent*self._onStep(v) + v/self.rsg
+
+    def ifPower(self, v, tLoad):
+        """IF output power at bias voltage v in mV, with a load at temperature tLoad in K"""
+        v = np.asarray(v)
+        conversion = self._onStep(v) + 0.05
+        return self.gain*(tLoad*conversion + self.trx)
+
+
+class DAQ:
+    """A simulated DAQ object, providing the same interface as the MCC DAQ
+    drivers in DAQ_linux and DAQ_windows.
+
+    The analog output channel that sets the mixer bias drives a simulated SIS
+    junction through a bias box with a first order settling response.  The
+    bias voltage, current and IF power are returned on the configured ADC
+    channels, with gaussian noise.  The IF power depends on the state of the
+    load control bit on the digital output port."""
+    # Name of the backend, as selected in the DAQ config
+    backend = "sim"
+
+    def __init__(self, config=None, configFile=None, verbose=False, vverbose=False, autoConnect=True):
+        """Create the DAQ device, and if autoConnect, automatically connect to
+        board number 0"""
+        self.verbose = verbose or vverbose
+        self.vverbose = vverbose # Set to true to set config object to be verbose
+
+        # State of the simulated outputs.  Analog outputs are stored as
+        # (value, time set, value when set), to model settling.  The times at
+        # which digital outputs were set are logged as (time set, value), so that
+        # scans see a bit that is switched while they run
+        self._aOut = {}
+        self._dOut = {}
+        self._dOutLog = {}
+
+        # Load the default config
+        self.config = None
+        self.setConfig(_default_DAQ_config.defaultConfig)
+
+        self.devices = None
+        self.daq_device = None
+        self.handle = None
+        self.boardnum = None
+        self.number_of_channels = None
+
+        if configFile != None:
+            self.readConfig(configFile)
+
+        if config != None:
+            self.setConfig(config)
+
+        if autoConnect:
+            self.connect(self.config["boardnum"])
+
+    def readConfig(self, filename):
+        """Read the .hjson configuration file to set up the DAQ unit."""
+        # Opens use file
+        self.configFile = filename
+
+        if self.verbose:
+            print("DAQ.readConfig: Reading config file: ",self.configFile)
+        try:
+            newConfig = hjsonConfig.hjsonConfig(filename=filename, verbose=self.vverbose)
+            self.setConfig(newConfig)
+        except OSError:
+            if self.verbose:
+                print("DAQ.readConfig: No DAQ config file found, using existing DAQ config.")
+
+    def setConfig(self, config):
+        """Merge a new config into the existing config.
+
+        Called automatically from readFile()"""
+        self.config = hjsonConfig.merge(self.config, config)
+        self._applyConfig()
+
+    def _applyConfig(self):
+        """Apply the configuration to set up the object variables.  Will get
+        called automatically from setConfig"""
+        try:
+            self.AoRange = self.lookUpRange(self.config["DACrange"], "unipolar")
+            self.AiMode = self.lookUpMode(self.config["ADCmode"])
+            self.AiRange = self.lookUpRange(self.config["ADCrange"], self.config["ADCpolarity"])
+            self.DoPort = self.lookUpDioPort(self.config["DOutPort"])
+            self.DiPort = self.lookUpDioPort(self.config["DInPort"])
+            self.sleepTime = self.config["sleepTime"]
+            self.bufferPool = self.config["bufferPool"]
+
+            sim = self.config["sim"]
+            self.maxRate = sim["max-rate"]
+            self.latency = sim["latency"]
+            self.realtime = sim["realtime"]
+            self.noise = sim["noise"]
+            self.settleTau = sim["settle-tau"]
+            try:
+                self.gainQueue = sim["gain-queue"]
+            except KeyError:
+                self.gainQueue = False
+            try:
+                self.biasJitter = sim["bias-jitter"]
+            except KeyError:
+                self.biasJitter = 0.0
+
+            self.biasChannel = sim["bias"]["channel"]
+            self.biasGain = sim["bias"]["gain"]
+            self.biasOffset = sim["bias"]["offset"]
+            self.vChannel = sim["vIn"]["channel"]
+            self.vGain = sim["vIn"]["gain"]
+            self.vOffset = sim["vIn"]["offset"]
+            self.iChannel = sim["iIn"]["channel"]
+            self.iGain = sim["iIn"]["gain"]
+            self.iOffset = sim["iIn"]["offset"]
+            self.pChannel = sim["pIn"]["channel"]
+            self.pGain = sim["pIn"]["gain"]
+            self.pOffset = sim["pIn"]["offset"]
+
+            self.loadPort = self.lookUpDioPort(sim["load"]["port"])
+            self.loadBit = sim["load"]["bit"]
+            self.loadHotState = sim["load"]["hot-state"]
+            self.hotLoadTemp = sim["load"]["hot-temp"]
+            self.coldLoadTemp = sim["load"]["cold-temp"]
+
+            self.junction = SISJunction(**sim["junction"])
+            self._rng = np.random.default_rng(sim["seed"])
+        except KeyError:
+            if self.verbose:
+                print("DAQ._applyConfig: Got KeyError while applying DAQ config")
+                pprint.pprint(self.config)
+            raise
+
+    def lookUpMode(self, mode):
+        """Look up an Analog Input Mode and return the enum value"""
+        return AnalogInputMode[mode.upper()]
+
+    def lookUpRange(self, rang, polarity):
+        """Look up a range by maximum voltage and polarity and return the enum value"""
+        ulout = None
+        for ulr in list(ULRange):
+            if ulr.name.startswith(polarity.upper()[0:2]):
+                if ulr.range_max == rang:
+                    ulout = ulr
+                    break
+        return ulout
+
+    def lookUpDioPort(self, portName):
+        """Look up the DioPort by port name and return the enum value"""
+        return DigitalPortType[portName.upper()]
+
+    def _wait(self, duration=0.0):
+        """Simulate the latency of a call to the device, plus the duration of
+        any scan if running in realtime"""
+        if not self.realtime:
+            duration = 0.0
+        if duration + self.latency > 0:
+            sleep(duration + self.latency)
+
+    def listDevices(self):
+        """List the simulated DAQ device"""
+        self.devices = ["Simulated DAQ"]
+        self.number_of_devices = 1
+        if self.verbose:
+            print("Found {:d} DAQ device(s): ".format(self.number_of_devices))
+            print("    Simulated DAQ (SIM0001)")
+
+    def connect(self, boardnum=None):
+        """Connects to the simulated DAQ device."""
+        if boardnum == None:
+            boardnum = self.config["boardnum"]
+
+        if self.devices == None:
+            self.listDevices()
+        if self.handle != None:
+            self.disconnect()
+        self.handle = DAQBroker.acquire("sim", boardnum, self._openDevice)
+        self.daq_device = self.handle.device
+        self.boardnum = boardnum
+        # The output state is shared by all DAQ objects connected to the board, as
+        # the LoadMover and the mixer applications share the real board.  Carry
+        # over anything set before connecting
+        aOut = self.handle.state.setdefault("aOut", {})
+        dOut = self.handle.state.setdefault("dOut", {})
+        dOutLog = self.handle.state.setdefault("dOutLog", {})
+        aOut.update(self._aOut)
+        dOut.update(self._dOut)
+        dOutLog.update(self._dOutLog)
+        self._aOut, self._dOut, self._dOutLog = aOut, dOut, dOutLog
+        if self.verbose:
+            print("Connected to Simulated DAQ SIM0001")
+
+        self.setAiMode(self.AiMode)
+        self.setAiRange(self.AiRange)
+        self.setAoRange(self.AoRange)
+
+    def _openDevice(self, boardnum):
+        """Connect to the simulated device.  Called by DAQBroker.acquire when no
+        other DAQ object is connected to the board"""
+        self._wait()
+        return self.devices[0]
+
+    def disconnect(self):
+        """Disconnects the simulated DAQ device"""
+        if self.verbose:
+            if self.daq_device != None:
+                print("DAQ device Simulated DAQ is disconnected.")
+            else:
+                print("DAQ device Simulated DAQ not connected")
+        if self.handle != None:
+            DAQBroker.release(self.handle, lambda device: None)
+            self.handle = None
+            # Keep a copy of the outputs, as the shared state may be changed by others
+            self._aOut = dict(self._aOut)
+            self._dOut = dict(self._dOut)
+            self._dOutLog = {k:list(v) for k, v in self._dOutLog.items()}
+        self.daq_device = None
+        self.boardnum = None
+        self.number_of_channels = None
+
+    def name(self, index=0):
+        if self.daq_device != None:
+            name = self.daq_device
+        else:
+            name = None
+        return name
+
+    def numChannels(self):
+        """Get the number of channels in the current AI Mode"""
+        self.number_of_channels = self.AiMode.value
+
+    def setAiMode(self, mode):
+        """Set the AiMode to one of the modes in AnalogInputMode"""
+        self.AiMode = mode
+        self.numChannels()
+
+    def getAiMode(self):
+        """Get the AiMode"""
+        return self.AiMode
+
+    def setAiRange(self, r):
+        """Set the AI Range to one of the members of ULRange"""
+        self.AiRange = r
+
+    def getAiRange(self):
+        """Get the AI Range"""
+        return self.AiRange
+
+    def setAiRangeIndex(self, r):
+        """Sets the AI Range to the index r in the list of ranges returned by
+        self.getAiRanges()"""
+        ranges = self.getAiRanges()
+        if r < len(ranges):
+            self.AiRange = ranges[r]
+        else:
+            raise ValueError("Specified range index not found")
+
+    def getAiRangeIndex(self):
+        """Returns the index of the current AiRange in the list of ranges
+        returned by self.getAiRanges()"""
+        return self.getAiRanges().index(self.AiRange)
+
+    def setAiRangeValue(self, v):
+        """Set the AiRange by value"""
+        self.setAiRange(ULRange(v))
+
+    def getAiRangeValue(self):
+        """Get the value of the current AiRange"""
+        return self.getAiRange().value
+
+    def getAiRanges(self):
+        """Returns the list of valid AI ranges"""
+        return [r for r in ULRange if r.name.startswith("BI")]
+
+    def setAoRange(self, r):
+        """Sets the AO Range to one of the members of ULRange"""
+        self.AoRange = r
+
+    def getAoRange(self):
+        """Returns the current AO Range"""
+        return self.AoRange
+
+    def _checkConnected(self):
+        if self.daq_device == None:
+            raise RuntimeError("DAQ device is not connected")
+
+    def _settle(self, start, target, times):
+        """Value of an output settling from start towards target, at times
+        since the change"""
+        if self.settleTau <= 0:
+            return np.full_like(times, target, dtype=float)
+        return target + (start - target)*np.exp(-np.clip(times, 0, None)/self.settleTau)
+
+    def _aOutTrace(self, channel, times):
+        """Value of analog output channel at absolute times"""
+        value, setTime, startValue = self._aOut.get(channel, (0.0, 0.0, 0.0))
+        return self._settle(startValue, value, times - setTime)
+
+    def _aOutAt(self, channel, t):
+        """Settled value of analog output channel at absolute time t"""
+        return float(self._aOutTrace(channel, np.array([t]))[0])
+
+    def _loadTemp(self, times=None):
+        """Temperature of the load currently in the beam, or an array of the
+        temperatures of the load in the beam at absolute times"""
+        key = (self.loadPort, self.loadBit)
+        if times is None:
+            state = self._dOut.get(key, not self.loadHotState)
+            if int(state) == int(self.loadHotState):
+                return self.hotLoadTemp
+            return self.coldLoadTemp
+
+        log = self._dOutLog.get(key, [])
+        changes = np.array([t for t, s in log])
+        states = np.array([s for t, s in log] + [int(not self.loadHotState)])
+        # Index -1 picks the state before the first change
+        state = states[np.searchsorted(changes, times, side="right") - 1]
+        return np.where(state == int(self.loadHotState), self.hotLoadTemp, self.coldLoadTemp)
+
+    def _signals(self, dacVolts, channels, ranges=None, times=None):
+        """Returns the ADC voltages on channels for an array of bias DAC output
+        voltages, as an array of shape (len(dacVolts), len(channels)).
+
+        ranges is an optional list of the ADC range for each channel.  times is
+        the array of absolute times of the samples, used to follow a load that is
+        switched during a scan"""
+        bias = (dacVolts - self.biasOffset)/self.biasGain
+        if self.biasJitter > 0:
+            # Noise on the junction bias, which shows up most on the steep parts of the IV curve
+            bias = bias + self._rng.normal(0.0, self.biasJitter, bias.shape)
+        data = np.empty((len(dacVolts), len(channels)))
+        for col, channel in enumerate(channels):
+            if channel == self.vChannel:
+                data[:, col] = bias*self.vGain/1000.0 + self.vOffset
+            elif channel == self.iChannel:
+                data[:, col] = self.junction.current(bias)*self.iGain + self.iOffset
+            elif channel == self.pChannel:
+                data[:, col] = self.junction.ifPower(bias, self._loadTemp(times))*self.pGain + self.pOffset
+            else:
+                data[:, col] = 0.0
+        if self.noise > 0:
+            data += self._rng.normal(0.0, self.noise, data.shape)
+        if ranges == None:
+            return np.clip(data, self.AiRange.range_min, self.AiRange.range_max)
+        for col, r in enumerate(ranges):
+            np.clip(data[:, col], r.range_min, r.range_max, out=data[:, col])
+        return data
+
+    def _checkRate(self, rate, channel_count):
+        if rate*channel_count > self.maxRate:
+            raise ValueError("Requested scan rate {:g} x {:d} channels exceeds the maximum rate of {:g}".format(rate, channel_count, self.maxRate))
+
+    def _channels(self, low_channel, high_channel):
+        if high_channel >= self.number_of_channels:
+            high_channel = self.number_of_channels - 1
+        if low_channel < 0:
+            low_channel = 0
+        return list(range(low_channel, high_channel + 1))
+
+    def AIn(self, channel = 0):
+        """Reads input analog data from specified channel"""
+        self._checkConnected()
+        if channel > self.number_of_channels:
+            raise ValueError("channel index requested is higher than number of channels")
+        if channel < 0:
+            raise ValueError("channel index must be 0 or positive")
+        with self.handle.ai:
+            self._wait()
+            t = np.array([time.time()])
+            return float(self._signals(self._aOutTrace(self.biasChannel, t), [channel], times=t)[0, 0])
+
+    def AOut(self, data, channel=0):
+        """Write output analog data to specified channel"""
+        self._checkConnected()
+        if channel < 0:
+            raise ValueError("channel index must be 0 or positive")
+        with self.handle.ao:
+            self._wait()
+            t = time.time()
+            self._aOut[channel] = (min(max(data, self.AoRange.range_min), self.AoRange.range_max), t, self._aOutAt(channel, t))
+
+    def DOut(self, data, channel=0, port=None):
+        """Write output digital data to specified channel"""
+        self._checkConnected()
+        if port == None:
+            port = self.DoPort
+        with self.handle.dio:
+            self._wait()
+            self._dOut[(port, channel)] = int(data)
+            log = self._dOutLog.setdefault((port, channel), [])
+            log.append((time.time(), int(data)))
+            # Only the recent history is needed by scans
+            if len(log) > 1000:
+                del log[:-1000]
+
+    def AInScan(self, low_channel, high_channel, rate, samples_per_channel, scan_time = None):
+        """Runs a scan across multiple channels, with multiple samples per channel.  Returns a numpy array of
+        shape (samples_per_channel, channel_count)"""
+        self._checkConnected()
+        channels = self._channels(low_channel, high_channel)
+        self._checkRate(rate, len(channels))
+
+        with self.handle.ai:
+            t0 = time.time()
+            times = t0 + np.arange(samples_per_channel)/rate
+            d = self._signals(self._aOutTrace(self.biasChannel, times), channels, times=times)
+            self._wait(samples_per_channel/rate)
+        return d
+
+    def supportsChannelList(self, channels, ranges=None):
+        """Returns True if the simulated gain queue can scan the list of channels"""
+        return self.gainQueue
+
+    def AInScanList(self, channels, rate, samples_per_channel, ranges=None, scan_time=None):
+        """Runs a scan of the list of channels, with multiple samples per channel.
+        Returns a numpy array of shape (samples_per_channel, len(channels)), with
+        the columns in the order of channels.
+
+        ranges is an optional list of the range to use for each channel.  Without
+        the simulated gain queue, the contiguous block of channels between the
+        lowest and highest listed channels is scanned, at the current AiRange"""
+        channels = list(channels)
+        if not self.supportsChannelList(channels, ranges):
+            low_channel = min(channels)
+            d = self.AInScan(low_channel, max(channels), rate, samples_per_channel, scan_time)
+            return d[:, [c - low_channel for c in channels]]
+
+        self._checkConnected()
+        for c in channels:
+            if c < 0 or c >= self.number_of_channels:
+                raise ValueError("channel {:d} is not a valid channel index".format(c))
+        self._checkRate(rate, len(channels))
+
+        with self.handle.ai:
+            t0 = time.time()
+            times = t0 + np.arange(samples_per_channel)/rate
+            d = self._signals(self._aOutTrace(self.biasChannel, times), channels, ranges, times)
+            self._wait(samples_per_channel/rate)
+        return d
+
+    def stream(self, low_channel, high_channel, rate, block_size, buffer_blocks=16, max_blocks=None, copy=False):
+        """Runs a simulated continuous scan, yielding (index, block) tuples in
+        the same way as the hardware drivers.
+
+        block is a view into a circular buffer of buffer_blocks blocks, unless
+        copy is True."""
+        self._checkConnected()
+        channels = self._channels(low_channel, high_channel)
+        self._checkRate(rate, len(channels))
+
+        with self.handle.ai:
+            ring = np.empty((buffer_blocks, block_size, len(channels)))
+            t0 = time.time()
+            self._wait()
+
+            block = 0
+            while max_blocks == None or block < max_blocks:
+                index = block*block_size
+                times = t0 + (index + np.arange(block_size))/rate
+                if self.realtime:
+                    # Wait until the block would have been acquired
+                    remaining = times[-1] - time.time()
+                    if remaining > 0:
+                        sleep(remaining)
+                d = ring[block % buffer_blocks]
+                d[:] = self._signals(self._aOutTrace(self.biasChannel, times), channels, times=times)
+                if copy:
+                    d = d.copy()
+                yield index, d
+                block += 1
+
+    def streamTo(self, callback, low_channel, high_channel, rate, block_size, buffer_blocks=16, max_blocks=None, copy=False):
+        """Runs stream(), passing each (index, block) to callback(index, block).
+
+        The stream stops when callback returns False, or after max_blocks blocks"""
+        blocks = self.stream(low_channel, high_channel, rate, block_size, buffer_blocks, max_blocks, copy)
+        try:
+            for index, block in blocks:
+                if callback(index, block) == False:
+                    break
+        finally:
+            blocks.close()
+
+    def clearBufferPool(self):
+        """The simulated DAQ does not keep scan buffers"""
+        pass
+
+    def supportsAOutScan(self):
+        """Returns True if the device supports hardware paced analog output"""
+        return True
+
+    def AOutAInScan(self, aout_data, ao_channel, low_channel, high_channel, rate, scan_time = None):
+        """Runs a simulated analog output scan of aout_data on ao_channel, in
+        lockstep with an analog input scan.  Returns a numpy array of shape
+        (len(aout_data), channel_count)"""
+        self._checkConnected()
+        channels = self._channels(low_channel, high_channel)
+        self._checkRate(rate, len(channels))
+
+        with self.handle.ai, self.handle.ao:
+            aout_data = np.clip(np.asarray(aout_data, dtype=float), self.AoRange.range_min, self.AoRange.range_max)
+            samples = len(aout_data)
+            t0 = time.time()
+
+            # Settle the output through each step of the waveform
+            trace = np.empty(samples)
+            start = self._aOutAt(ao_channel, t0)
+            steps = np.concatenate(([0], np.flatnonzero(np.diff(aout_data)) + 1, [samples]))
+            for s, e in zip(steps[:-1], steps[1:]):
+                trace[s:e] = self._settle(start, aout_data[s], np.arange(1, e - s + 1)/rate)
+                start = trace[e - 1]
+
+            tEnd = t0 + samples/rate
+            self._aOut[ao_channel] = (aout_data[-1], tEnd, start)
+
+            times = t0 + np.arange(samples)/rate
+            if ao_channel == self.biasChannel:
+                d = self._signals(trace, channels, times=times)
+            else:
+                d = self._signals(self._aOutTrace(self.biasChannel, times), channels, times=times)
+            self._wait(samples/rate)
+        return d
+
+
+if __name__ == "__main__":
+    daq = DAQ()
+    data = daq.AIn(0)
+    print(data)
+    data = daq.AInScan(0,1,10000,1000,1)
+    print(data)
+    daq.DOut(1)
+    daq.disconnect()
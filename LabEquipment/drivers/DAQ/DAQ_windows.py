@@ -25,10 +25,13 @@ from mcculw import enums
 from time import sleep
 import numpy as np
 import ctypes
+from math import gcd
 from LabEquipment.lib import hjsonConfig
 import pprint
 
 from . import _default_DAQ_config
+from . import DAQBroker
+from . import DAQCapabilities
 
 
 
@@ -39,6 +42,31 @@ ignore_instacal()
 def memhandle_as_ctypes_array_scaled(memhandle):
     return ctypes.cast(memhandle, ctypes.POINTER(ctypes.c_double))
 
+class ScanBuffer(object):
+    """A scaled Windows buffer of count samples, which frees itself when it is
+    no longer referenced.
+
+    np.asarray(buffer) is a numpy view of the buffer's memory, which holds a
+    reference to the buffer as its base, so the memory stays valid while any
+    views of it exist"""
+    def __init__(self, count):
+        self.memhandle = scaled_win_buf_alloc(count)
+        if not self.memhandle:
+            raise MemoryError("Could not allocate a DAQ scan buffer of {:d} samples".format(count))
+        self.count = count
+        self.pooled = False
+        address = ctypes.cast(memhandle_as_ctypes_array_scaled(self.memhandle), ctypes.c_void_p).value
+        self.__array_interface__ = {"shape":(count,), "typestr":"<f8", "data":(address, False), "version":3}
+
+    def free(self):
+        """Free the buffer now.  There must be no views of it left"""
+        if self.memhandle:
+            win_buf_free(self.memhandle)
+            self.memhandle = None
+
+    def __del__(self):
+        self.free()
+
 class DAQ:
     """A DAQ object representing a MCC DAQ device.
 
@@ -47,12 +75,18 @@ class DAQ:
         connect DAQ board, rather than the Daq object.  In combination with self.boardnum,
         this contains all the information available for connnections.
     """
+    # Name of the backend, as selected in the DAQ config
+    backend = "hardware"
+
     def __init__(self, config=None, configFile=None, verbose=False, vverbose=False, autoConnect=True):
         """Create the DAQ device, and if autoConnect, automatically connect to
         board number 0"""
         self.verbose = verbose or vverbose
         self.vverbose = vverbose # Set to true to set config object to be verbose
 
+        # Scan buffers kept for reuse, keyed by (channel_count, samples_per_channel)
+        self._scanBuffers = {}
+
         # Load the default config
         self.config = None
         if self.verbose:
@@ -63,6 +97,7 @@ class DAQ:
         self.boardnum = None
         self.devices = None
         self.daq_device = None
+        self.handle = None
 
         self.interface_type = enums.InterfaceType.USB
 
@@ -123,12 +158,15 @@ class DAQ:
             self.DoPort = self.lookUpDioPort(self.config["DOutPort"])
             self.DiPort = self.lookUpDioPort(self.config["DInPort"])
             self.sleepTime = self.config["sleepTime"]
+            self.bufferPool = self.config["bufferPool"]
         except KeyError:
             if self.verbose:
                 print("DAQ._applyConfig: Got KeyError while applying DAQ config")
                 pprint.pprint(self.config)
             raise
 
+        if not self.bufferPool:
+            self.clearBufferPool()
 
     def lookUpMode(self, mode):
         """Look up an Analog Input Mode and return the enum value"""
@@ -152,7 +190,7 @@ class DAQ:
     def listDevices(self):
         """List DAQ devices connected to this machine"""
         try:
-            self.devices = get_daq_device_inventory(self.interface_type)
+            self.devices = DAQBroker.inventory("windows", lambda: get_daq_device_inventory(self.interface_type))
             self.number_of_devices = len(self.devices)
             if self.number_of_devices == 0:
                 raise RuntimeError('Error: No DAQ devices found')
@@ -165,7 +203,8 @@ class DAQ:
 
     def connect(self, boardnum=None):
         """Connects to DAQ device <boardnum>, or to boardnum in config.
-        If device is already connected, this will access that device.
+        If device is already connected, by this or another DAQ object, this
+        will share that device.
 
         Sets self.daq_device to the DaqDeviceDescriptor for that device."""
         if boardnum == None:
@@ -175,22 +214,19 @@ class DAQ:
             # Search for devices to get the DAQ ids
             if self.devices == None:
                 self.listDevices()
-            # Register the board with mcculw and store the descriptor internally
-            # if the board is already in use, just steal it...
-            try:
-                create_daq_device(boardnum, self.devices[boardnum])
-            except ULError as err:
-                if err.errorcode == enums.ErrorCode.BOARDNUMINUSE:
-                    pass
-            self.daq_device = self.devices[boardnum]
+            if self.handle != None:
+                self._release()
+            self.handle = DAQBroker.acquire("windows", boardnum, self._openDevice)
+            self.daq_device = self.handle.device
             self.boardnum = boardnum
             if self.verbose:
                 print("Connected to {:s} : {:s}".format(self.daq_device.dev_string, self.daq_device.unique_id))
         except (KeyboardInterrupt, ValueError):
             print("Could not connect to DAQ device {:d}.".format(boardnum))
 
-        # Get some basic info on the device
-        self.getAiInfo()
+        # Get some basic info on the device.  The AI info depends on the AI mode, so
+        # is read by setAiMode
+        self.capabilities = self.handle.cached("capabilities", self._loadCapabilities)
         self.getAoInfo()
         self.getDioInfo()
 
@@ -202,17 +238,37 @@ class DAQ:
         self.getAiRange()
         self.getAoRange()
 
+    def _openDevice(self, boardnum):
+        """Register board boardnum with mcculw and return its descriptor.  Called by
+        DAQBroker.acquire when no other DAQ object is connected to the board"""
+        # If the board is already in use, just steal it...
+        try:
+            create_daq_device(boardnum, self.devices[boardnum])
+        except ULError as err:
+            if err.errorcode == enums.ErrorCode.BOARDNUMINUSE:
+                pass
+        return self.devices[boardnum]
+
+    @staticmethod
+    def _closeDevice(device):
+        """Release the board with mcculw once no DAQ objects are using it"""
+        boardnum = get_board_number(device)
+        if boardnum >= 0:
+            release_daq_device(boardnum)
+
+    def _release(self):
+        """Release this object's handle on the shared device"""
+        DAQBroker.release(self.handle, self._closeDevice)
+        self.handle = None
+
     def disconnect(self):
-        """Disconnect DAQ device"""
-        if self.daq_device != None:
-            boardnum = get_board_number(self.daq_device)
-            if boardnum >=0:
-                release_daq_device(boardnum)
-                if self.verbose:
-                    print("DAQ device {:s} is disconnected.".format(self.devices[boardnum].product_name))
-            else:
-                if self.verbose:
-                    print("DAQ device {:s} not connected".format(self.devices[boardnum].product_name))
+        """Disconnect DAQ device.  The board is only released once all DAQ objects
+        sharing it have disconnected"""
+        self.clearBufferPool()
+        if self.handle != None:
+            self._release()
+            if self.verbose:
+                print("DAQ device {:s} is disconnected.".format(self.daq_device.product_name))
         self.daq_device = None
         self.boardnum = None
         self.number_of_channels = None
@@ -228,31 +284,92 @@ class DAQ:
         """Get the number of AI channels"""
         self.number_of_channels = self.AiInfo.num_ai_chans
 
+    def _loadCapabilities(self):
+        """Return the capabilities of the connected board from the capability
+        cache.  Any not in the cache are probed when first needed"""
+        cache = DAQCapabilities.cacheFor(self.config)
+        if cache != None:
+            capabilities = cache.get(self.daq_device)
+            if capabilities != None:
+                return capabilities
+        return {}
+
+    def _saveCapabilities(self):
+        """Store newly probed capabilities in the capability cache"""
+        cache = DAQCapabilities.cacheFor(self.config)
+        if cache != None:
+            cache.put(self.daq_device, self.capabilities)
+
     def getAiInfo(self):
-        """Get AI information using the mcculw examples/props/ai.AnalogInputProps class"""
+        """Get AI information for the current AiMode, from the capability cache or
+        using the mcculw examples/props/ai.AnalogInputProps class, which probes
+        each range on the board"""
         if self.daq_device == None:
             raise RuntimeError("DAQ device is not connected")
-        self.AiInfo = ai.AnalogInputProps(self.boardnum)
+        aiCapabilities = self.capabilities.setdefault("ai", {})
+        if self.AiMode.name not in aiCapabilities:
+            props = ai.AnalogInputProps(self.boardnum)
+            aiCapabilities[self.AiMode.name] = {
+                "resolution":props.resolution,
+                "num_ai_chans":props.num_ai_chans,
+                "available_ranges":[r.name for r in props.available_ranges],
+                "supports_scan":props.supports_scan,
+                "packet_size":props.packet_size,
+                "continuous_requires_packet_size_multiple":props.continuous_requires_packet_size_multiple,
+                "supports_gain_queue":props.supports_gain_queue,
+            }
+            self._saveCapabilities()
+        info = dict(aiCapabilities[self.AiMode.name])
+        info["available_ranges"] = [enums.ULRange[r] for r in info["available_ranges"]]
+        self.AiInfo = DAQCapabilities.CachedProps(**info)
 
     def getAoInfo(self):
-        """Get AO information using the mcculw examples/props/ao.AnalogOutputProps class"""
+        """Get AO information from the capability cache or using the mcculw
+        examples/props/ao.AnalogOutputProps class"""
         if self.daq_device == None:
             raise RuntimeError("DAQ device is not connected")
-        self.AoInfo = ao.AnalogOutputProps(self.boardnum)
+        if "ao" not in self.capabilities:
+            props = ao.AnalogOutputProps(self.boardnum)
+            self.capabilities["ao"] = {
+                "resolution":props.resolution,
+                "num_chans":props.num_chans,
+                "available_ranges":[r.name for r in props.available_ranges],
+                "supports_scan":props.supports_scan,
+            }
+            self._saveCapabilities()
+        info = dict(self.capabilities["ao"])
+        info["available_ranges"] = [enums.ULRange[r] for r in info["available_ranges"]]
+        self.AoInfo = DAQCapabilities.CachedProps(**info)
 
     def getDioInfo(self):
-        """Get DIO information using the mcculw examples/props/digital.DigitalProps class"""
+        """Get DIO information from the capability cache or using the mcculw
+        examples/props/digital.DigitalProps class"""
         if self.daq_device == None:
             raise RuntimeError("DAQ device is not connected")
-        self.DioInfo = digital.DigitalProps(self.boardnum)
+        if "dio" not in self.capabilities:
+            props = digital.DigitalProps(self.boardnum)
+            self.capabilities["dio"] = [{
+                "type":p.type.name,
+                "first_bit":p.first_bit,
+                "num_bits":p.num_bits,
+                "supports_input":p.supports_input,
+                "supports_output":p.supports_output,
+            } for p in props.port_info]
+            self._saveCapabilities()
+        ports = []
+        for p in self.capabilities["dio"]:
+            p = dict(p)
+            p["type"] = enums.DigitalPortType[p["type"]]
+            ports.append(DAQCapabilities.CachedProps(**p))
+        self.DioInfo = DAQCapabilities.CachedProps(num_ports=len(ports), port_info=ports)
 
     def setAiMode(self, mode):
         """Sets the AiMode to one of the modes in enums.AnalogInputMode"""
         if self.verbose:
             print("Setting AiMode to {:}".format(mode))
         a_input_mode(self.boardnum, mode)
-        self.getAiInfo()
         self.getAiMode()
+        self.getAiInfo()
         self.numChannels()
         self.setAiRange(self.AiRange)
         self.getAiRange()
@@ -321,7 +438,8 @@ class DAQ:
         if channel < 0:
             raise ValueError("channel index must be 0 or positive")
 
-        data = v_in(self.boardnum, channel, self.AiRange)
+        with self.handle.ai:
+            data = v_in(self.boardnum, channel, self.AiRange)
         return data
 
     def AOut(self, data, channel=0):
@@ -332,7 +450,8 @@ class DAQ:
             raise ValueError("channel index must be 0 or positive")
 
         # Write output analog data to specified channel
-        v_out(self.boardnum, channel, self.AoRange, data)
+        with self.handle.ao:
+            v_out(self.boardnum, channel, self.AoRange, data)
 
     def DOut(self, data, channel=0, port=None):
         """Write output digital data to specified channel.
@@ -354,15 +473,19 @@ class DAQ:
             port_n = 0
         port_info = self.DioInfo.port_info[port_n]
 
-        # Configure port
-        d_config_port(self.boardnum, port_info.type, enums.DigitalIODirection.OUT)
+        with self.handle.dio:
+            # Configure port
+            d_config_port(self.boardnum, port_info.type, enums.DigitalIODirection.OUT)
 
-        # Writes output for bit
-        d_bit_out(self.boardnum, port_info.type, channel, data)
+            # Writes output for bit
+            d_bit_out(self.boardnum, port_info.type, channel, data)
 
     def AInScan(self, low_channel, high_channel, rate, samples_per_channel, scan_time = None):
         """Runs a scan across multiple channels, with multiple samples per channel.  Returns a numpy array of
-        shape (samples_per_channel, channel_count)"""
+        shape (samples_per_channel, channel_count).
+
+        If bufferPool is set, the array is a view of the scan buffer and will be
+        overwritten by the next scan of the same shape.  Otherwise it is a copy."""
         # Verify that the specified device supports hardware pacing for analog input.
         if not self.AiInfo.supports_scan:
             raise Exception('Error: The specified DAQ device does not support scanning analog inputs')
@@ -376,43 +499,308 @@ class DAQ:
 
         channel_count = high_channel - low_channel + 1
 
-        # Allocate a buffer to receive the data.
-        total_count = samples_per_channel*channel_count
-        data = scaled_win_buf_alloc(total_count)
-        ctypes_array = memhandle_as_ctypes_array_scaled(data)
+        # Get a buffer to receive the data.
+        buf, d = self._getScanBuffer(channel_count, samples_per_channel)
+        try:
+            self._runAInScan(low_channel, high_channel, samples_per_channel*channel_count, rate, buf.memhandle)
+            return self._releaseScanBuffer(buf, d)
+        finally:
+            self._freeScanBuffer(buf)
 
+    def _runAInScan(self, low_channel, high_channel, total_count, rate, data):
+        """Runs an analog input scan of total_count samples into buffer data,
+        waiting until it is complete"""
         # Set up the scan options
         scan_options = (enums.ScanOptions.CONTINUOUS | enums.ScanOptions.SCALEDATA  | enums.ScanOptions.BACKGROUND)
+        with self.handle.ai:
+            try:
+                # Start the acquisition.
+                a_in_scan(self.boardnum, low_channel, high_channel, total_count,
+                                            rate, self.AiRange, data, scan_options)
+
+                status, curr_count, curr_index = get_status(
+                        self.boardnum, enums.FunctionType.AIFUNCTION)
+
+                while status != enums.Status.IDLE:
+                    sleep(self.sleepTime)
+                    # Get the status of the background operation
+                    status, curr_count, curr_index = get_status(
+                        self.boardnum, enums.FunctionType.AIFUNCTION)
+
+                    # Check to see if we are done
+                    if curr_count >= total_count:
+                        break
+
+            finally:
+                stop_background(self.boardnum, enums.FunctionType.AIFUNCTION)
+
+    def supportsChannelList(self, channels, ranges=None):
+        """Returns True if the device's gain queue can scan the list of channels,
+        with the list of ranges if given, in a single scan.
+
+        mcculw doesn't report the queue length or its limitations, so lists that
+        are longer than the number of channels or repeat a channel aren't queued"""
+        if not self.AiInfo.supports_gain_queue:
+            return False
+        if len(channels) > self.number_of_channels:
+            return False
+        if len(set(channels)) < len(channels):
+            return False
+        if ranges != None:
+            if len(ranges) != len(channels):
+                return False
+            if any(r not in self.AiInfo.available_ranges for r in ranges):
+                return False
+        return True
+
+    def AInScanList(self, channels, rate, samples_per_channel, ranges=None, scan_time=None):
+        """Runs a scan of the list of channels, with multiple samples per channel.
+        Returns a numpy array of shape (samples_per_channel, len(channels)), with
+        the columns in the order of channels.
+
+        ranges is an optional list of the range to use for each channel.  If the
+        device's gain queue can scan the list, only the listed channels are
+        sampled, so each gets a larger share of the aggregate sample rate.
+        Otherwise, or if the board rejects the queue, the contiguous block of
+        channels between the lowest and highest listed channels is scanned, at
+        the current AiRange"""
+        channels = list(channels)
+        for c in channels:
+            if c < 0 or c >= self.number_of_channels:
+                raise ValueError("channel {:d} is not a valid channel index".format(c))
+
+        if self.supportsChannelList(channels, ranges):
+            d = self._AInScanQueue(channels, rate, samples_per_channel, ranges)
+            if d is not None:
+                return d
+        elif self.vverbose:
+            print("DAQ.AInScanList: Can't queue {}, scanning contiguous channels".format(channels))
+
+        low_channel = min(channels)
+        d = self.AInScan(low_channel, max(channels), rate, samples_per_channel, scan_time)
+        return d[:, [c - low_channel for c in channels]]
+
+    def _AInScanQueue(self, channels, rate, samples_per_channel, ranges=None):
+        """Runs the scan for AInScanList() with the channels and ranges loaded
+        into the gain queue.  Returns None if the board rejects the queue"""
+        # Verify that the specified device supports hardware pacing for analog input.
+        if not self.AiInfo.supports_scan:
+            raise Exception('Error: The specified DAQ device does not support scanning analog inputs')
+
+        if ranges == None:
+            ranges = [self.AiRange]*len(channels)
+
+        # Get a buffer to receive the data.
+        buf, d = self._getScanBuffer(len(channels), samples_per_channel)
         try:
-            # Start the acquisition.
-            a_in_scan(self.boardnum, low_channel, high_channel, total_count,
-                                        rate, self.AiRange, data, scan_options)
+            with self.handle.ai:
+                try:
+                    a_load_queue(self.boardnum, channels, ranges, len(channels))
+                except ULError as err:
+                    if self.vverbose:
+                        print("DAQ.AInScanList: Board rejected the gain queue for {} ({}), scanning contiguous channels".format(channels, err))
+                    return None
+                try:
+                    # The channels scanned come from the gain queue
+                    self._runAInScan(min(channels), max(channels), samples_per_channel*len(channels), rate, buf.memhandle)
+                finally:
+                    # Clear the queue so that other scans use the channel range again
+                    a_load_queue(self.boardnum, [], [], 0)
+            return self._releaseScanBuffer(buf, d)
+        finally:
+            self._freeScanBuffer(buf)
+
+    def _getScanBuffer(self, channel_count, samples_per_channel):
+        """Returns a (buffer, array) pair, where buffer is a ScanBuffer for a scan
+        and array is a numpy view of its memory with shape
+        (samples_per_channel, channel_count).
+
+        If bufferPool is set, the buffer is kept and reused for later scans of
+        the same shape."""
+        key = (channel_count, samples_per_channel)
+        if self.bufferPool and key in self._scanBuffers:
+            return self._scanBuffers[key]
+
+        buf = ScanBuffer(samples_per_channel*channel_count)
+        d = np.asarray(buf).reshape((samples_per_channel, channel_count))
+
+        if self.bufferPool:
+            buf.pooled = True
+            self._scanBuffers[key] = (buf, d)
+        return buf, d
+
+    def _releaseScanBuffer(self, buf, d):
+        """Returns the scan data in array d after a scan into buffer buf.
+
+        For pooled buffers the view is returned as is.  Otherwise the data is
+        copied out in a single block, ready for the buffer to be freed."""
+        if buf.pooled:
+            return d
+        return d.copy()
+
+    def _freeScanBuffer(self, buf):
+        """Frees buf after a scan, whether or not it succeeded, unless it is pooled"""
+        if not buf.pooled:
+            buf.free()
+
+    def clearBufferPool(self):
+        """Drops all the scan buffers held for reuse.  Each buffer is freed once
+        no arrays returned by earlier scans are views of it"""
+        self._scanBuffers.clear()
+
+    def stream(self, low_channel, high_channel, rate, block_size, buffer_blocks=16, max_blocks=None, copy=False):
+        """Runs a continuous background scan across multiple channels into a
+        circular buffer holding buffer_blocks blocks of block_size samples per
+        channel, and yields (index, block) tuples as each block is filled.
+
+        index is the absolute sample number of the first sample in the block,
+        counted from the start of the stream.  block is a numpy array of shape
+        (block_size, channel_count).  Unless copy is True, block is a view into
+        the circular buffer, and is only valid until the next buffer_blocks - 1
+        blocks have been acquired.  Blocks kept after the stream ends hold the
+        buffer, and keep their last data.
+
+        The scan runs until max_blocks blocks have been yielded, or the
+        generator is closed.  Raises RuntimeError if the buffer overruns."""
+        # Verify that the specified device supports hardware pacing for analog input.
+        if not self.AiInfo.supports_scan:
+            raise Exception('Error: The specified DAQ device does not support scanning analog inputs')
+
+        # Verify the high channel does not exceed the number of channels, low channel is
+        #0 or positive and set the channel count.
+        if high_channel >= self.number_of_channels:
+            high_channel = self.number_of_channels - 1
+        if low_channel < 0:
+            low_channel = 0
 
-            status, curr_count, curr_index = get_status(
-                    self.boardnum, enums.FunctionType.AIFUNCTION)
+        channel_count = high_channel - low_channel + 1
 
-            while status != enums.Status.IDLE:
-                sleep(self.sleepTime)
-                # Get the status of the background operation
-                status, curr_count, curr_index = get_status(
-                    self.boardnum, enums.FunctionType.AIFUNCTION)
+        # Continuous scans on some hardware need a buffer that is a multiple of
+        # the packet size, so round buffer_blocks up to satisfy that
+        if self.AiInfo.continuous_requires_packet_size_multiple:
+            block_count = block_size*channel_count
+            step = self.AiInfo.packet_size // gcd(self.AiInfo.packet_size, block_count)
+            buffer_blocks = -(-buffer_blocks // step) * step
 
-                # Check to see if we are done
-                if curr_count >= total_count:
-                    break
+        # Allocate the circular buffer once for the whole stream
+        buffer_samples = block_size*buffer_blocks
+        total_count = buffer_samples*channel_count
+        buf = ScanBuffer(total_count)
+        ring = np.asarray(buf).reshape((buffer_blocks, block_size, channel_count))
 
+        # Set up the scan options
+        scan_options = (enums.ScanOptions.CONTINUOUS | enums.ScanOptions.SCALEDATA  | enums.ScanOptions.BACKGROUND)
+        with self.handle.ai:
+            try:
+                # Start the acquisition.
+                a_in_scan(self.boardnum, low_channel, high_channel, total_count,
+                                            rate, self.AiRange, buf.memhandle, scan_options)
+
+                block = 0
+                while max_blocks == None or block < max_blocks:
+                    # Get the status of the background operation
+                    status, curr_count, curr_index = get_status(
+                        self.boardnum, enums.FunctionType.AIFUNCTION)
+                    if status != enums.Status.RUNNING:
+                        raise RuntimeError("DAQ stream stopped unexpectedly")
+
+                    acquired = curr_count // channel_count
+                    if acquired > (max(block - 1, 0) + buffer_blocks)*block_size:
+                        raise RuntimeError("DAQ stream buffer overrun at sample {:d}".format(block*block_size))
+
+                    if acquired < (block + 1)*block_size:
+                        sleep(self.sleepTime)
+                        continue
+
+                    # Yield one block per status check, so that overruns are caught
+                    # even if the consumer is slow
+                    d = ring[block % buffer_blocks]
+                    if copy:
+                        d = d.copy()
+                    yield block*block_size, d
+                    block += 1
+            finally:
+                # The buffer is freed once the blocks yielded from it are released
+                stop_background(self.boardnum, enums.FunctionType.AIFUNCTION)
+
+    def streamTo(self, callback, low_channel, high_channel, rate, block_size, buffer_blocks=16, max_blocks=None, copy=False):
+        """Runs stream(), passing each (index, block) to callback(index, block).
+
+        The stream stops when callback returns False, or after max_blocks blocks"""
+        blocks = self.stream(low_channel, high_channel, rate, block_size, buffer_blocks, max_blocks, copy)
+        try:
+            for index, block in blocks:
+                if callback(index, block) == False:
+                    break
         finally:
-            stop_background(self.boardnum, enums.FunctionType.AIFUNCTION)
+            blocks.close()
+
+    def supportsAOutScan(self):
+        """Returns True if the device supports hardware paced analog output"""
+        return self.AoInfo.supports_scan
+
+    def AOutAInScan(self, aout_data, ao_channel, low_channel, high_channel, rate, scan_time = None):
+        """Runs a hardware paced analog output scan of aout_data on ao_channel,
+        clocked at rate in lockstep with an analog input scan across multiple
+        channels.  One sample is taken on each input channel for each output
+        sample.
+
+        The input scan is started before the output scan, so any offset between
+        the start of the two scans appears as a short delay at the start of the
+        output waveform.  Returns a numpy array of shape
+        (len(aout_data), channel_count)"""
+        # Verify that the specified device supports hardware pacing for analog input and output.
+        if not self.AiInfo.supports_scan:
+            raise Exception('Error: The specified DAQ device does not support scanning analog inputs')
+        if not self.supportsAOutScan():
+            raise Exception('Error: The specified DAQ device does not support scanning analog outputs')
+
+        # Verify the high channel does not exceed the number of channels, low channel is
+        #0 or positive and set the channel count.
+        if high_channel >= self.number_of_channels:
+            high_channel = self.number_of_channels - 1
+        if low_channel < 0:
+            low_channel = 0
+
+        channel_count = high_channel - low_channel + 1
+        samples_per_channel = len(aout_data)
 
-        eng_values = []
-        for i in range(total_count):
-            eng_values.append(ctypes_array[i])
-        d = np.array(eng_values)
-        d = d.reshape((samples_per_channel, channel_count))
+        # Allocate buffers for the output waveform and the input data
+        out_buf = ScanBuffer(samples_per_channel)
+        np.asarray(out_buf)[:] = aout_data
 
-        win_buf_free(data)
+        total_count = samples_per_channel*channel_count
+        buf, d = self._getScanBuffer(channel_count, samples_per_channel)
 
-        return d
+        # Set up the scan options - these are finite length scans
+        scan_options = (enums.ScanOptions.SCALEDATA | enums.ScanOptions.BACKGROUND)
+        with self.handle.ai, self.handle.ao:
+            try:
+                # Start the acquisition, then the output waveform
+                a_in_scan(self.boardnum, low_channel, high_channel, total_count,
+                                            rate, self.AiRange, buf.memhandle, scan_options)
+                a_out_scan(self.boardnum, ao_channel, ao_channel, samples_per_channel,
+                                            rate, self.AoRange, out_buf.memhandle, scan_options)
+
+                status, curr_count, curr_index = get_status(
+                        self.boardnum, enums.FunctionType.AIFUNCTION)
+
+                while status != enums.Status.IDLE:
+                    sleep(self.sleepTime)
+                    # Get the status of the background operation
+                    status, curr_count, curr_index = get_status(
+                        self.boardnum, enums.FunctionType.AIFUNCTION)
+
+                    # Check to see if we are done
+                    if curr_count >= total_count:
+                        break
+
+                return self._releaseScanBuffer(buf, d)
+            finally:
+                stop_background(self.boardnum, enums.FunctionType.AIFUNCTION)
+                stop_background(self.boardnum, enums.FunctionType.AOFUNCTION)
+                out_buf.free()
+                self._freeScanBuffer(buf)
 
 
 if __name__ == "__main__":
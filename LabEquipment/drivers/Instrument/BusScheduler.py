@@ -0,0 +1,81 @@
+#! /usr/bin/env python
+##################################################
+#                                                #
+# Runs instrument I/O on one worker thread per   #
+# bus, so that commands to instruments on        #
+# different buses run concurrently while those   #
+# on the same bus stay in order                  #
+#                                                #
+##################################################
+
+from __future__ import print_function, division
+
+import threading
+import concurrent.futures
+
+
+def busName(resourceName):
+    """Return the name of the bus that the resource named resourceName is on.
+
+    All instruments on a GPIB interface share a bus, as do all parties on a serial
+    port and all resources on a TCPIP host.  Anything else is its own bus"""
+    fields = resourceName.split("::")
+    if fields[0].upper().startswith("GPIB"):
+        return fields[0].upper()
+    if fields[0].upper().startswith("TCPIP") and len(fields) > 1:
+        return "::".join(fields[:2]).upper()
+    return fields[0]
+
+
+def gather(*futures):
+    """Wait for each of futures, returning their results in order"""
+    return [f.result() for f in futures]
+
+
+class BusScheduler(object):
+    """Queues calls to instruments on a worker thread for each bus.
+
+    Calls to instruments on the same bus run one at a time in the order they were
+    submitted, so the ordering of commands to each instrument is kept.  Use as a
+    context manager to stop the workers on exit:
+
+        with BusScheduler() as sched:
+            trans = sched.submit(vvm, vvm.getTransmission)
+            x = sched.submit(msl_x, msl_x.getPos)
+            trans, x = gather(trans, x)"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.workers = {}
+
+    def bus(self, instrument):
+        """Return the name of the bus that instrument is on"""
+        return busName(getattr(instrument.resource, "resource_name", str(id(instrument))))
+
+    def worker(self, bus):
+        """Return the executor running calls on bus, starting it if needed"""
+        with self.lock:
+            try:
+                return self.workers[bus]
+            except KeyError:
+                w = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="bus-"+bus)
+                self.workers[bus] = w
+                return w
+
+    def submit(self, instrument, call, *args, **kwargs):
+        """Queue call(*args, **kwargs) on the worker for instrument's bus, returning a Future"""
+        return self.worker(self.bus(instrument)).submit(call, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        """Stop all of the workers once their queued calls are done"""
+        with self.lock:
+            workers = list(self.workers.values())
+            self.workers = {}
+        for w in workers:
+            w.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
@@ -119,7 +119,7 @@ class PowerMeter(Instrument.Instrument):
         #   R : Free-run at maximum rate
         #   V : Free-run with settling timeout
 
-        return self.resource.query("{}{}{}{}".format(range, mode, calFactor, rate))
+        return self.query("{}{}{}{}".format(range, mode, calFactor, rate))
 
     def unpackDataStr(self, dataStr):
         """Unpack the data string, returning the value in whatever mode we're in"""
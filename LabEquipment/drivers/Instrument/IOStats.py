@@ -0,0 +1,176 @@
+#! /usr/bin/env python
+##################################################
+#                                                #
+# Statistics on instrument I/O, collected by     #
+# Instrument.write, read and query when enabled  #
+# with Instrument.enableStats() or by setting    #
+# LABEQUIPMENT_IOSTATS=<file> in the environment #
+#                                                #
+##################################################
+
+from __future__ import print_function, division
+
+import re
+import json
+import bisect
+import threading
+import collections
+
+# Latency histogram bucket upper edges in seconds, four per decade from 10 us to 10 s
+bucketEdges = [1e-5*10**(i/4) for i in range(25)]
+
+_number = re.compile(r"(?<![A-Za-z])[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?")
+
+
+def commandKey(cmd):
+    """Reduce a command string to a key shared by all calls of the same command,
+    by replacing numeric arguments with #.  e.g. "X MA 1200" -> "X MA #" """
+    return _number.sub("#", cmd.strip())
+
+
+class CommandStats(object):
+    """Counts, latency histogram and bytes transferred for one command on one instrument"""
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.bytesOut = 0
+        self.bytesIn = 0
+        self.buckets = [0]*(len(bucketEdges) + 1)
+
+    def add(self, latency, bytesOut, bytesIn, error=False):
+        self.count += 1
+        self.errors += int(error)
+        self.total += latency
+        self.min = min(self.min, latency)
+        self.max = max(self.max, latency)
+        self.bytesOut += bytesOut
+        self.bytesIn += bytesIn
+        self.buckets[bisect.bisect_left(bucketEdges, latency)] += 1
+
+    @property
+    def mean(self):
+        return self.total/self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """Estimate the q'th percentile latency by interpolating within the histogram"""
+        if self.count == 0:
+            return 0.0
+        target = q/100*self.count
+        cumulative = 0
+        for i, n in enumerate(self.buckets):
+            if n and cumulative + n >= target:
+                lower = bucketEdges[i-1] if i > 0 else self.min
+                upper = bucketEdges[i] if i < len(bucketEdges) else self.max
+                lower = max(lower, self.min)
+                upper = min(upper, self.max)
+                return lower + (upper - lower)*(target - cumulative)/n
+            cumulative += n
+        return self.max
+
+    def toDict(self):
+        return {
+            "count":self.count,
+            "errors":self.errors,
+            "total_s":self.total,
+            "mean_s":self.mean,
+            "min_s":self.min if self.count else 0.0,
+            "max_s":self.max,
+            "p50_s":self.percentile(50),
+            "p90_s":self.percentile(90),
+            "p99_s":self.percentile(99),
+            "bytes_out":self.bytesOut,
+            "bytes_in":self.bytesIn,
+            "buckets":{"{:.3g}".format(e):n for e, n in zip(bucketEdges + [float("inf")], self.buckets)},
+        }
+
+
+class IOStats(object):
+    """Collects CommandStats by instrument and command"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = collections.OrderedDict()
+
+    def add(self, instrument, command, latency, bytesOut=0, bytesIn=0, error=False):
+        key = (instrument, commandKey(command))
+        with self.lock:
+            try:
+                s = self.stats[key]
+            except KeyError:
+                s = self.stats[key] = CommandStats()
+            s.add(latency, bytesOut, bytesIn, error)
+
+    def toDict(self):
+        """Return the statistics as nested dictionaries of instrument and command"""
+        out = collections.OrderedDict()
+        with self.lock:
+            for (instrument, command), s in self.stats.items():
+                out.setdefault(instrument, collections.OrderedDict())[command] = s.toDict()
+        return out
+
+    def table(self):
+        """Return the statistics formatted as a text table, slowest total time first"""
+        lines = ["{:32s} {:24s} {:>7s} {:>6s} {:>9s} {:>9s} {:>9s} {:>9s} {:>9s} {:>9s} {:>9s}".format(
+            "instrument", "command", "count", "errors", "total s", "mean ms", "p50 ms", "p99 ms", "max ms", "bytes out", "bytes in")]
+        with self.lock:
+            items = sorted(self.stats.items(), key=lambda i: -i[1].total)
+            for (instrument, command), s in items:
+                lines.append("{:32s} {:24s} {:7d} {:6d} {:9.3f} {:9.3f} {:9.3f} {:9.3f} {:9.3f} {:9d} {:9d}".format(
+                    instrument[:32], command[:24], s.count, s.errors, s.total, s.mean*1e3, s.percentile(50)*1e3,
+                    s.percentile(99)*1e3, s.max*1e3, s.bytesOut, s.bytesIn))
+        return "\n".join(lines)
+
+    def prometheus(self, prefix="labequipment_instrument"):
+        """Return the statistics in the Prometheus text exposition format"""
+        def labels(instrument, command, **extra):
+            items = [("instrument", instrument), ("command", command)] + list(extra.items())
+            return ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in items)
+
+        lines = [
+            "# HELP {}_command_seconds Latency of instrument commands".format(prefix),
+            "# TYPE {}_command_seconds histogram".format(prefix),
+        ]
+        with self.lock:
+            items = list(self.stats.items())
+        for (instrument, command), s in items:
+            cumulative = 0
+            for edge, n in zip(bucketEdges + [float("inf")], s.buckets):
+                cumulative += n
+                le = "+Inf" if edge == float("inf") else "{:.3g}".format(edge)
+                lines.append("{}_command_seconds_bucket{{{}}} {:d}".format(prefix, labels(instrument, command, le=le), cumulative))
+            lines.append("{}_command_seconds_sum{{{}}} {:.9g}".format(prefix, labels(instrument, command), s.total))
+            lines.append("{}_command_seconds_count{{{}}} {:d}".format(prefix, labels(instrument, command), s.count))
+
+        lines.append("# HELP {}_command_errors_total Instrument commands that raised an exception".format(prefix))
+        lines.append("# TYPE {}_command_errors_total counter".format(prefix))
+        for (instrument, command), s in items:
+            lines.append("{}_command_errors_total{{{}}} {:d}".format(prefix, labels(instrument, command), s.errors))
+
+        lines.append("# HELP {}_bytes_total Bytes transferred to and from instruments".format(prefix))
+        lines.append("# TYPE {}_bytes_total counter".format(prefix))
+        for (instrument, command), s in items:
+            lines.append("{}_bytes_total{{{}}} {:d}".format(prefix, labels(instrument, command, direction="out"), s.bytesOut))
+            lines.append("{}_bytes_total{{{}}} {:d}".format(prefix, labels(instrument, command, direction="in"), s.bytesIn))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, filename=None):
+        """Write the statistics to filename, as JSON for .json files, in the
+        Prometheus text format for .prom files, or as a table otherwise.
+
+        With no filename, print the table"""
+        if filename == None:
+            print(self.table())
+            return
+        with open(filename, "w") as f:
+            if filename.endswith(".json"):
+                json.dump(self.toDict(), f, indent=2)
+            elif filename.endswith(".prom"):
+                f.write(self.prometheus())
+            else:
+                f.write(self.table() + "\n")
@@ -1,3 +1,50 @@
+import os
+import time
+import atexit
+
+from . import IOStats
+
+# IOStats collector for all instruments, or None when statistics are disabled
+stats = None
+
+
+def enableStats(filename=None):
+    """Start collecting I/O statistics for all instruments, returning the
+    IOStats collector.
+
+    If filename is given, the statistics are written to it when Python exits,
+    as JSON (.json), Prometheus text (.prom) or a table (anything else)"""
+    global stats
+    if stats == None:
+        stats = IOStats.IOStats()
+    if filename:
+        atexit.register(stats.dump, filename)
+    return stats
+
+
+def disableStats():
+    """Stop collecting I/O statistics, returning the collector with the statistics so far"""
+    global stats
+    s = stats
+    stats = None
+    return s
+
+
+def ResourceManager(backend=None):
+    """Return a pyvisa ResourceManager for backend.
+
+    backend "@sim", or LABEQUIPMENT_VISA=sim in the environment, returns the
+    simulated instruments from VisaSim instead"""
+    if backend == "@sim" or os.environ.get("LABEQUIPMENT_VISA", "").lower() == "sim":
+        from . import VisaSim
+        return VisaSim.ResourceManager()
+
+    import visa
+    if backend == None:
+        return visa.ResourceManager()
+    return visa.ResourceManager(backend)
+
+
 class Instrument(object):
     """Base class for pyvisa based instruments
 
@@ -12,16 +59,53 @@ class Instrument(object):
 
     def write(self, *args, **kwargs):
         """Writes a command string to the instrument"""
-        return self.resource.write(*args, **kwargs)
+        if stats == None:
+            return self.resource.write(*args, **kwargs)
+        return self._timed(stats, self._command(args, kwargs), True, False, self.resource.write, *args, **kwargs)
 
     def read(self, *args, **kwargs):
         """Reads a string from the instrument"""
-        return self.resource.read(*args, **kwargs)
+        if stats == None:
+            return self.resource.read(*args, **kwargs)
+        return self._timed(stats, "<read>", False, True, self.resource.read, *args, **kwargs)
 
     def query(self, *args, **kwargs):
         """Writes a command string to the instrument and reads the response"""
-        return self.resource.query(*args, **kwargs)
+        if stats == None:
+            return self.resource.query(*args, **kwargs)
+        return self._timed(stats, self._command(args, kwargs), True, True, self.resource.query, *args, **kwargs)
+
+    def statsName(self):
+        """Name used for this instrument in I/O statistics"""
+        return "{}({})".format(type(self).__name__, getattr(self.resource, "resource_name", "?"))
+
+    @staticmethod
+    def _command(args, kwargs):
+        """Return the command string passed to write() or query(), positionally or
+        as pyvisa's message keyword argument"""
+        if args:
+            return args[0]
+        return kwargs.get("message", "")
+
+    def _timed(self, collector, command, written, read, call, *args, **kwargs):
+        """Make an I/O call, recording its latency and size in collector"""
+        t0 = time.perf_counter()
+        try:
+            result = call(*args, **kwargs)
+        except Exception:
+            collector.add(self.statsName(), command, time.perf_counter() - t0, error=True)
+            raise
+        latency = time.perf_counter() - t0
+
+        bytesOut = len(command) + len(self.resource.write_termination or "") if written else 0
+        bytesIn = len(result) + len(self.resource.read_termination or "") if read else 0
+        collector.add(self.statsName(), command, latency, bytesOut, bytesIn)
+        return result
 
     def idn(self):
         """Read the return value from the semi-standard "*IDN?" VISA command"""
         return self.query("*IDN?")
+
+
+if os.environ.get("LABEQUIPMENT_IOSTATS"):
+    enableStats(os.environ["LABEQUIPMENT_IOSTATS"])
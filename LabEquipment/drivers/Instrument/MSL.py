@@ -7,12 +7,61 @@
 #
 
 
+import time
+
 from ..Instrument import Instrument
+from LabEquipment.lib.motionProfile import TrapezoidProfile
+
+
+def waitForStop(items, isMoving, pollFrom=None, pollMin=0.002, pollMax=0.05, timeout=None):
+    """Wait until isMoving(item) is False for all of items, and return the time
+    they were all known to have stopped.
+
+    If pollFrom is given, sleeps until that time.monotonic() time first.  Then
+    polls each item that is still moving, backing off from pollMin to pollMax
+    between polls.  Raises RuntimeError if they are still moving after timeout
+    seconds."""
+    start = time.monotonic()
+    if pollFrom != None and pollFrom > start:
+        time.sleep(pollFrom - start)
+
+    moving = list(items)
+    interval = pollMin
+    while True:
+        moving = [i for i in moving if isMoving(i)]
+        if not moving:
+            return time.monotonic()
+        if timeout != None and time.monotonic() - start > timeout:
+            raise RuntimeError("MSL: Timed out after {:.1f} s waiting for motion to stop".format(timeout))
+        time.sleep(interval)
+        interval = min(2*interval, pollMax)
+
+
+def holdAll(*axes, timeout=None, predict=True):
+    """Wait until all of the MSL axes have stopped moving.
+
+    If predict, sleeps until shortly before the latest predicted end of the
+    axes' last moves, then polls each axis that is still moving - see
+    waitForStop()"""
+    pollFrom = max(a._moveEnd - a.holdMargin for a in axes) if predict else None
+    now = waitForStop(axes, lambda a: a.isMoving().strip() == '1', pollFrom,
+                      min(a.pollMin for a in axes), max(a.pollMax for a in axes), timeout)
+
+    # All of the axes are known to be stopped now
+    for a in axes:
+        a._moveEnd = min(a._moveEnd, now)
+
 
 class MSL(Instrument.Instrument):
     ''' Class for communicating with a Newmark Systems MSL Linear Stage
         with MDrive Motor'''
 
+    # Polling of "PR MV" in hold() starts holdMargin seconds before the predicted
+    # end of a move, at intervals backing off from pollMin to pollMax seconds
+    holdMargin = 0.005
+    pollMin = 0.002
+    pollMax = 0.05
+
     def __init__(self, resource, partyName=None, strict=False, softLimits=True):
         super().__init__(resource)
 
@@ -32,6 +81,12 @@ class MSL(Instrument.Instrument):
         self.negLimit = None
         self.softLimits = softLimits
 
+        # Motion parameters, read from the motor when first needed to predict moves
+        self._clearMotionParams()
+        # Position at the end of the last move, if known, and predicted end time of the move
+        self._target = None
+        self._moveEnd = 0.0
+
 
     def write(self, cmd):
         super().write(self.prefix+cmd)
@@ -39,22 +94,37 @@ class MSL(Instrument.Instrument):
     def query(self, cmd):
         return super().query(self.prefix+cmd)
 
+    def statsName(self):
+        if self.prefix:
+            return "{} {}".format(super().statsName(), self.prefix.strip())
+        return super().statsName()
+
+    def _clearMotionParams(self):
+        self._velInit = None
+        self._velMax = None
+        self._accel = None
+        self._decel = None
+
     def setVelInit(self, vel):
         'Set Initial Velocity'
         self.write("VI=" +str(vel))
+        self._velInit = vel
 
     def setVelMax(self, vel):
         'Set max velocity'
         self.write("VM="+str(vel))
+        self._velMax = vel
 
     def getVelInit(self):
         'Returns Initial Velocity'
         self.VelInit = int(self.query("PR VI"))
+        self._velInit = self.VelInit
         return self.VelInit
 
     def getVelMax(self):
         'Returns Max Velocity'
         self.VelMax = int(self.query("PR VM"))
+        self._velMax = self.VelMax
         return self.VelMax
 
     def getVel(self):
@@ -65,16 +135,53 @@ class MSL(Instrument.Instrument):
     def setAccel(self, acl):
         'Sets acceleration'
         self.write("A="+str(acl))
+        self._accel = acl
 
     def setDecel(self, dec):
         'Sets deceleration'
         self.write("D="+str(dec))
+        self._decel = dec
 
     def getAccel(self):
         'Returns acceleration'
         self.accel = int(self.query("PR A"))
+        self._accel = self.accel
         return self.accel
 
+    def getDecel(self):
+        'Returns deceleration'
+        self.decel = int(self.query("PR D"))
+        self._decel = self.decel
+        return self.decel
+
+    def moveProfile(self, distance):
+        """Return the TrapezoidProfile of a move of distance steps, from the motion
+        parameters, reading any that aren't known from the motor"""
+        if self._velInit == None:
+            self.getVelInit()
+        if self._velMax == None:
+            self.getVelMax()
+        if self._accel == None:
+            self.getAccel()
+        if self._decel == None:
+            self.getDecel()
+        return TrapezoidProfile(distance, self._velMax, self._accel, self._decel, self._velInit)
+
+    def predictMoveTime(self, distance):
+        """Predict the time in seconds to move distance steps"""
+        return self.moveProfile(distance).duration
+
+    def _expectedPos(self):
+        """Return the position at the end of the last move, reading it if unknown"""
+        if self._target == None:
+            return self.getPos()
+        return self._target
+
+    def _startMove(self, start, target):
+        """Record the target and predicted end time of a move that has just been started"""
+        self._moveEnd = time.monotonic() + self.predictMoveTime(target - start)
+        self._target = target
+
     def getParam(self):
         'Returns all parameters'
         self.param = self.query("PR AL")
@@ -89,7 +196,9 @@ class MSL(Instrument.Instrument):
             if self.negLimit:
                 if self.negLimit > pos:
                     raise ValueError("Requested position {:f} beyond negative limit {:f} of motion of MSL {}".format(pos, self.prefix[:-1], self.negLimit))
+        start = self._expectedPos()
         self.write("MA {:d}".format(int(pos)))
+        self._startMove(start, int(pos))
 
     def moveRel(self, pos):
         """Moves distance from current position"""
@@ -101,12 +210,17 @@ class MSL(Instrument.Instrument):
             if self.negLimit:
                 if self.negLimit > pos+currPos:
                     raise ValueError("Requested position {:f} beyond negative limit {:f} of motion of MSL {}".format(pos, self.prefix[:-1], self.negLimit))
+            start = currPos
+        else:
+            start = self._expectedPos()
         self.write("MR {:d}".format(int(pos)))
+        self._startMove(start, start + int(pos))
 
     def setHome(self, pos):
         """Set a specific position to home"""
         currPos = self.getPos()
-        self.write("P={d}".format(int(currPos-pos)))
+        self.write("P={:d}".format(int(currPos-pos)))
+        self._target = int(currPos-pos)
 
     def home(self):
         """Move to the home position
@@ -118,16 +232,21 @@ class MSL(Instrument.Instrument):
     def getPos(self):
         'Returns position relative to 0'
         self.position = int(self.query("PR P"))
+        if time.monotonic() >= self._moveEnd:
+            # Not moving, unless the prediction was wrong
+            self._target = self.position
         return self.position
 
     def isMoving(self):
         self.moving = self.query("PR MV")
         return self.moving
 
-    def hold(self):
-        'Holds instruction till motion has stopped'
-        while self.isMoving() == '1':
-            None
+    def hold(self, timeout=None, predict=True):
+        """Holds instruction till motion has stopped.
+
+        Sleeps until shortly before the predicted end of the move, then polls
+        with backoff - see holdAll()"""
+        holdAll(self, timeout=timeout, predict=predict)
 
     def zero(self):
         """Sets current position to home (0 position)
@@ -135,6 +254,7 @@ class MSL(Instrument.Instrument):
         Also updates stored limits if any"""
         oldPos = self.getPos()
         self.write("P=0")
+        self._target = 0
         if self.posLimit:
             self.posLimit = self.posLimit - oldPos
         if self.negLimit:
@@ -148,14 +268,15 @@ class MSL(Instrument.Instrument):
     def findLimits(self):
         """Find the limits of travel of the stage, using the built in limit
         switches"""
-        # Run forward until we run into the limit switch
+        # Run forward until we run into the limit switch.  The move stops
+        # well short of its target, so don't wait for the predicted end of it
         self.moveRel(10000000)
-        self.hold()
+        self.hold(predict=False)
         self.posLimit = self.getPos()
 
         # Step backward until we run into the limit switch
         self.moveRel(-10000000)
-        self.hold()
+        self.hold(predict=False)
         self.negLimit = self.getPos()
 
     def center(self):
@@ -173,6 +294,7 @@ class MSL(Instrument.Instrument):
         'Returns all variables to default'
         self.write("IP")
         self.read()
+        self._clearMotionParams()
         'Turns off echo for each command'
         self.write("EM = 2")
 
@@ -4,7 +4,11 @@
 # from code by Larry Gardner, Jul 2018
 #
 
+import time
+
 from ..Instrument import Instrument
+from . import MSL
+from LabEquipment.lib.motionProfile import TrapezoidProfile
 
 class MSL_XY(Instrument.Instrument):
     ''' Class for communicating with two Newmark Systems MSL Linear Stages
@@ -19,6 +23,12 @@ class MSL_XY(Instrument.Instrument):
         Default device names for the X and Y drives are built into the
         object as msl.X and msl.Y'''
 
+    # Polling of "PR MV" in hold() starts holdMargin seconds before the predicted
+    # end of a move, at intervals backing off from pollMin to pollMax seconds
+    holdMargin = 0.005
+    pollMin = 0.002
+    pollMax = 0.05
+
     def __init__(self, resource, strict=False):
 
         super().__init__(resource)
@@ -29,21 +39,59 @@ class MSL_XY(Instrument.Instrument):
         self.X = "X"
         self.Y = "Y"
 
+        # Motion parameters of each drive, read when first needed to predict moves,
+        # position at the end of the last move if known, and predicted end time of the move
+        self._params = {d:{} for d in self._drives("*")}
+        self._target = {d:None for d in self._drives("*")}
+        self._moveEnd = {d:0.0 for d in self._drives("*")}
+
+    def _drives(self, drv):
+        """List of drive names addressed by drv"""
+        if drv == "*":
+            return [self.X, self.Y]
+        return [drv]
+
+    def _setParam(self, param, value, drv):
+        for d in self._drives(drv):
+            self._params[d][param] = value
+
+    def _getParam(self, param, drv):
+        value = int(self.query("{} PR {}".format(drv, param)))
+        self._setParam(param, value, drv)
+        return value
+
+    def predictMoveTime(self, distance, drv):
+        """Predict the time in seconds for drive drv to move distance steps, from
+        the motion parameters, reading any that aren't known from the drive"""
+        params = self._params[drv]
+        for p in ["VI", "VM", "A", "D"]:
+            if p not in params:
+                self._getParam(p, drv)
+        return TrapezoidProfile(distance, params["VM"], params["A"], params["D"], params["VI"]).duration
+
+    def _expectedPos(self, drv):
+        """Return the position of drive drv at the end of the last move, reading it if unknown"""
+        if self._target[drv] == None:
+            self.getPos(drv)
+        return self._target[drv]
+
     def setVelInit(self, vel, drv="*"):
         'Set Initial Velocity'
         self.write("{} VI={:d}".format(drv, vel))
+        self._setParam("VI", vel, drv)
 
     def setVelMax(self, vel, drv="*"):
         'Set max velocity'
         self.write("{} VM={:d}".format(drv, vel))
+        self._setParam("VM", vel, drv)
 
     def getVelInit(self, drv="*"):
         'Returns Initial Velocity'
-        return int(self.query("{} PR VI".format(drv)))
+        return self._getParam("VI", drv)
 
     def getVelMax(self, drv="*"):
         'Returns Max Velocity'
-        return int(self.query("{} PR VM".format(drv)))
+        return self._getParam("VM", drv)
 
     def getVel(self, drv="*"):
         'Returns current velocity'
@@ -52,14 +100,20 @@ class MSL_XY(Instrument.Instrument):
     def setAccel(self, acl, drv="*"):
         'Sets acceleration'
         self.write("{} A={:d}".format(drv, acl))
+        self._setParam("A", acl, drv)
 
     def setDecel(self, dec, drv="*"):
         'Sets deceleration'
         self.write("{} D={:d}".format(drv, dec))
+        self._setParam("D", dec, drv)
 
     def getAccel(self, drv="*"):
         'Returns acceleration'
-        return int(self.query("{} PR A".format(drv)))
+        return self._getParam("A", drv)
+
+    def getDecel(self, drv="*"):
+        'Returns deceleration'
+        return self._getParam("D", drv)
 
     def getParams(self, drv="*"):
         'Returns all parameters'
@@ -75,32 +129,57 @@ class MSL_XY(Instrument.Instrument):
 
     def moveAbs(self, pos, drv="*"):
         'Moves to an absolute position from 0'
+        starts = {d:self._expectedPos(d) for d in self._drives(drv)}
         self.write("{} MA {:d}".format(drv, pos))
+        for d, start in starts.items():
+            self._startMove(d, start, pos)
 
     def moveRel(self, pos, drv="*"):
         'Moves distance from current position'
+        starts = {d:self._expectedPos(d) for d in self._drives(drv)}
         self.write("{} MR {:d}".format(drv, pos))
+        for d, start in starts.items():
+            self._startMove(d, start, start + pos)
+
+    def _startMove(self, drv, start, target):
+        """Record the target and predicted end time of a move that has just been started"""
+        self._moveEnd[drv] = time.monotonic() + self.predictMoveTime(target - start, drv)
+        self._target[drv] = target
 
     def setHome(self, drv="*"):
         'Sets current position to home (0 position)'
         self.write("{} P=0".format(drv))
+        for d in self._drives(drv):
+            self._target[d] = 0
 
     def getPos(self, drv="*"):
         'Returns position relative to 0'
-        return int(self.query("{} PR P".format(drv)))
+        pos = int(self.query("{} PR P".format(drv)))
+        for d in self._drives(drv):
+            if time.monotonic() >= self._moveEnd[d]:
+                # Not moving, unless the prediction was wrong
+                self._target[d] = pos
+        return pos
 
     def isMoving(self, drv="*"):
         return bool(int(self.query("{} PR MV".format(drv))))
 
-    def hold(self, drv="*"):
-        'Holds instruction till motion has stopped'
-        while self.isMoving(drv):
-            None
+    def hold(self, drv="*", timeout=None, predict=True):
+        """Holds instruction till motion has stopped on drv, or on both drives for "*".
+
+        If predict, sleeps until shortly before the predicted end of the last
+        moves, then polls each drive that is still moving - see MSL.waitForStop()"""
+        drives = self._drives(drv)
+        pollFrom = max(self._moveEnd[d] for d in drives) - self.holdMargin if predict else None
+        now = MSL.waitForStop(drives, self.isMoving, pollFrom, self.pollMin, self.pollMax, timeout)
+
+        for d in drives:
+            self._moveEnd[d] = min(self._moveEnd[d], now)
 
     def zero(self, drv="*"):
         'Makes the minimum position the home'
         self.moveAbs(-550000, drv)
-        self.hold(drv)
+        self.hold(drv, predict=False)
         while self.getPos(drv) != '0':
             self.setHome(drv)
 
@@ -111,6 +190,8 @@ class MSL_XY(Instrument.Instrument):
     def initialize(self, drv="*"):
         'Returns all variables to values stored in NVM'
         self.write("{} IP".format(drv))
+        for d in self._drives(drv):
+            self._params[d] = {}
 
 if __name__ == "__main__":
     import visa
@@ -0,0 +1,668 @@
+#! /usr/bin/env python
+##################################################
+#                                                #
+# Simulated VISA instruments, for running,       #
+# profiling and benchmarking the Beamscanner     #
+# and mixer applications without lab hardware.   #
+#                                                #
+# ResourceManager() stands in for a pyvisa       #
+# ResourceManager, opening resources that        #
+# answer the commands used by the HP8508A, MSL,  #
+# MSL_XY, HP436A, HP83630A and HMCT2240          #
+# drivers.  The same instruments can be served   #
+# over TCP sockets by running this module.       #
+#                                                #
+##################################################
+
+from __future__ import print_function, division
+
+import re
+import sys
+import time
+import threading
+import socketserver
+import collections
+import argparse
+
+import numpy as np
+
+from LabEquipment.lib import hjsonConfig
+from LabEquipment.lib.motionProfile import TrapezoidProfile
+
+from . import _default_VisaSim_config
+
+try:
+    import pyvisa as visa
+except ImportError:
+    try:
+        import visa
+    except ImportError:
+        visa = None
+
+
+class SimIOError(Exception):
+    """Raised by simulated resources when pyvisa isn't available to supply VisaIOError"""
+    pass
+
+
+def _ioError(message):
+    """Return the exception to raise for a failed read or open.
+
+    Uses pyvisa's VisaIOError where possible, so that application code catching
+    visa.VisaIOError behaves the same with the simulated instruments"""
+    if visa != None:
+        if "timeout" in message.lower():
+            return visa.VisaIOError(visa.constants.StatusCode.error_timeout)
+        return visa.VisaIOError(visa.constants.StatusCode.error_resource_not_found)
+    return SimIOError(message)
+
+
+def _resourceKey(name):
+    """Strip the ::INSTR suffix from a resource name, so that "GPIB0::13::INST"
+    and "GPIB0::13::INSTR" refer to the same instrument"""
+    return re.sub(r"::INSTR?$", "", name.strip(), flags=re.IGNORECASE)
+
+
+class SimInstrument(object):
+    """Base class for simulated instruments.
+
+    Subclasses implement handle(), which takes a single command string and
+    returns a list of response lines to queue for reading"""
+    idn = "LabEquipment,SimInstrument,0,0"
+
+    def __init__(self, bench, config):
+        self.bench = bench
+        self.config = config
+        self.lock = threading.RLock()
+        try:
+            self.latencies = dict(config["latency"])
+        except KeyError:
+            self.latencies = {}
+        try:
+            self.termination = config["termination"]
+        except KeyError:
+            self.termination = "\n"
+
+    def keyword(self, cmd):
+        """Return the keyword of cmd used to look up the command latency"""
+        return cmd.split()[0].upper() if cmd.split() else ""
+
+    def latency(self, cmd):
+        """Return the time taken by the instrument to process cmd"""
+        try:
+            return self.latencies[self.keyword(cmd)]
+        except KeyError:
+            return self.latencies.get("default", 0.0)
+
+    def handle(self, cmd):
+        """Process a command, returning a list of response lines"""
+        raise NotImplementedError
+
+
+class SimStage(object):
+    """A simulated MDrive motor and linear slide.
+
+    Motion follows a trapezoidal velocity profile in real time, and stops at the
+    limit switches at +/- limit steps from the center of travel"""
+    def __init__(self, config):
+        self.config = config
+        self.limit = config["limit"]
+        self.lock = threading.RLock()
+        self.reset()
+        self._mech = float(config["position"])
+        self._offset = 0.0
+        self._move = None
+
+    def reset(self):
+        """Restore the power on motion parameters"""
+        self.velInit = self.config["velInit"]
+        self.velMax = self.config["velMax"]
+        self.accel = self.config["accel"]
+        self.decel = self.config["decel"]
+        self.echo = 0
+
+    def _update(self, t):
+        """Finish the current move if it has completed by time t"""
+        if self._move != None:
+            profile, t0, start = self._move
+            if t - t0 >= profile.duration:
+                self._mech = start + profile.distance
+                self._move = None
+
+    def mechanical(self, t=None):
+        """Position in steps from the center of travel at time t"""
+        if t == None:
+            t = time.monotonic()
+        with self.lock:
+            self._update(t)
+            if self._move == None:
+                return self._mech
+            profile, t0, start = self._move
+            return start + float(profile.position(t - t0))
+
+    def position(self, t=None):
+        """Position counter reading at time t"""
+        return self.mechanical(t) + self._offset
+
+    def velocity(self, t=None):
+        if t == None:
+            t = time.monotonic()
+        with self.lock:
+            self._update(t)
+            if self._move == None:
+                return 0.0
+            profile, t0, start = self._move
+            return float(profile.velocity(t - t0))
+
+    def moving(self, t=None):
+        if t == None:
+            t = time.monotonic()
+        with self.lock:
+            self._update(t)
+            return self._move != None
+
+    def moveTo(self, counter):
+        """Start a move to the counter position, stopping at the limit switches"""
+        t = time.monotonic()
+        with self.lock:
+            start = self.mechanical(t)
+            target = np.clip(counter - self._offset, -self.limit, self.limit)
+            profile = TrapezoidProfile(target - start, self.velMax, self.accel, self.decel, self.velInit)
+            self._move = (profile, t, start)
+
+    def moveBy(self, steps):
+        self.moveTo(self.position() + steps)
+
+    def setPosition(self, counter):
+        """Set the position counter to read counter at the current position"""
+        with self.lock:
+            self._offset = counter - self.mechanical()
+
+
+class SimMSL(SimInstrument):
+    """RS-485 bus of MDrive motors in party mode, or a single motor.
+
+    Commands may be prefixed by a party name or "*" for all motors on the bus.
+    Unprefixed commands go to every motor, with only the first motor answering."""
+    idn = None
+
+    def __init__(self, bench, config):
+        super().__init__(bench, config)
+        self.axes = collections.OrderedDict((name, bench.stages[name]) for name in config["axes"])
+
+    def keyword(self, cmd):
+        words = cmd.split()
+        if words and (words[0] in self.axes or words[0] == "*"):
+            words = words[1:]
+        return words[0].split("=")[0].upper() if words else ""
+
+    def handle(self, cmd):
+        words = cmd.split(None, 1)
+        if not words:
+            return []
+        if words[0] in self.axes:
+            stages = [self.axes[words[0]]]
+            cmd = words[1] if len(words) > 1 else ""
+        elif words[0] == "*":
+            stages = list(self.axes.values())
+            cmd = words[1] if len(words) > 1 else ""
+        else:
+            stages = list(self.axes.values())
+        cmd = re.sub(r"\s*=\s*", "=", cmd.strip()).upper()
+
+        responses = []
+        for stage in stages:
+            r = self._handleStage(stage, cmd)
+            if r != None and responses == []:
+                # Only one motor gets to answer on a shared bus
+                responses = r
+        return responses
+
+    def _handleStage(self, stage, cmd):
+        """Process a command for a single stage"""
+        params = {"VI":"velInit", "VM":"velMax", "A":"accel", "D":"decel", "EM":"echo"}
+
+        m = re.match(r"^([A-Z]+)=(-?[0-9.]+)$", cmd)
+        if m:
+            var, value = m.group(1), int(float(m.group(2)))
+            if var == "P":
+                stage.setPosition(value)
+            elif var in params:
+                setattr(stage, params[var], value)
+            return None
+
+        m = re.match(r"^(MA|MR) (-?[0-9.]+)$", cmd)
+        if m:
+            if m.group(1) == "MA":
+                stage.moveTo(float(m.group(2)))
+            else:
+                stage.moveBy(float(m.group(2)))
+            return None
+
+        m = re.match(r"^PR (\w+)$", cmd)
+        if m:
+            var = m.group(1)
+            if var == "P":
+                return ["{:d}".format(int(round(stage.position())))]
+            elif var == "V":
+                return ["{:d}".format(int(round(stage.velocity())))]
+            elif var == "MV":
+                return ["{:d}".format(int(stage.moving()))]
+            elif var in params:
+                return ["{:d}".format(int(getattr(stage, params[var])))]
+            elif var == "AL":
+                lines = ["{}={:d}".format(k, int(getattr(stage, v))) for k, v in params.items()]
+                lines.append("P={:d}".format(int(round(stage.position()))))
+                return lines + [""]
+            return None
+
+        if cmd == "IP":
+            stage.reset()
+            return [""]
+
+        # SC and anything else is accepted without effect
+        return None
+
+
+class SimHP8508A(SimInstrument):
+    """HP 8508A Vector Voltmeter, measuring the transmission of a Gaussian beam
+    at the position of the scanner stages"""
+    idn = "HEWLETT-PACKARD,8508A-050,0,SIM"
+
+    def __init__(self, bench, config):
+        super().__init__(bench, config)
+        self.sense = "TRANSMISSION"
+        self.scale = "LOGARITHMIC"
+        self.coords = "POLAR"
+        self.averaging = 0
+        self.triggerSource = "FREE"
+        self.triggered = False
+        try:
+            self.sampleTime = config["sample-time"]
+        except KeyError:
+            self.sampleTime = 0.0
+
+    def latency(self, cmd):
+        delay = super().latency(cmd)
+        if self.keyword(cmd) == "MEAS?":
+            delay += self.sampleTime * 2**self.averaging
+        return delay
+
+    def _format(self, value):
+        """Format a complex voltage ratio in the current output format"""
+        if self.coords == "POLAR":
+            amp = np.abs(value)
+            if self.scale == "LOGARITHMIC":
+                amp = 20*np.log10(amp)
+            return "{:.4f},{:.3f}".format(amp, np.degrees(np.angle(value)))
+        return "{:.6e},{:.6e}".format(value.real, value.imag)
+
+    def handle(self, cmd):
+        words = cmd.upper().split(None, 1)
+        if not words:
+            return []
+        key = words[0]
+        arg = words[1].strip() if len(words) > 1 else ""
+
+        if key == "*IDN?":
+            return [self.idn]
+        elif key == "*TRG":
+            self.triggered = True
+        elif key.startswith("SENS"):
+            self.sense = arg
+        elif key == "FORMAT?":
+            return ["{},{}".format(self.scale, self.coords)]
+        elif key.startswith("FORM"):
+            for a in arg.split(","):
+                if a.startswith("LIN"):
+                    self.scale = "LINEAR"
+                elif a.startswith("LOG"):
+                    self.scale = "LOGARITHMIC"
+                elif a.startswith("POL"):
+                    self.coords = "POLAR"
+                elif a.startswith("RECT") or a.startswith("CART"):
+                    self.coords = "RECTANGULAR"
+        elif key == "AVER:COUN?":
+            return ["{:d}".format(self.averaging)]
+        elif key == "AVER:COUN":
+            self.averaging = int(arg)
+        elif key == "TRIG:SOUR":
+            self.triggerSource = arg
+        elif key == "MEAS?":
+            if self.triggerSource == "BUS" and not self.triggered:
+                # Waits for a trigger that never comes
+                return []
+            self.triggered = False
+            value = self.bench.transmission(2**self.averaging)
+            if arg.startswith("TRAN") or arg == "":
+                return [self._format(value)]
+            elif arg.startswith("APOW"):
+                return ["{:.4f}".format(20*np.log10(np.abs(value)))]
+            elif arg.startswith("BPOW"):
+                return ["{:.4f}".format(0.0)]
+            elif arg.startswith("PHAS"):
+                return ["{:.3f}".format(np.degrees(np.angle(value)))]
+            return ["{:.4f}".format(0.0)]
+        return []
+
+
+class SimHP436A(SimInstrument):
+    """HP 436A Power Meter, returning its packed data strings"""
+    idn = None
+    _ranges = " IJKLM"
+
+    def __init__(self, bench, config):
+        super().__init__(bench, config)
+        self.power = config["power"]
+        self.noise = config["noise"]
+        self.last = self.power
+
+    def keyword(self, cmd):
+        """Latency depends on the measurement rate, the last character of the query"""
+        return cmd.strip()[-1:].upper()
+
+    def handle(self, cmd):
+        m = re.match(r"^([1-59])([A-D])([+-])([HTIRV])$", cmd.strip().upper())
+        if m == None:
+            return []
+        rng, mode, cal, rate = m.groups()
+
+        if rate != "H":
+            self.last = self.power * (1.0 + self.noise*self.bench.rng.standard_normal())
+        value = self.last
+
+        if rng == "9":
+            # Auto range, with full scale at 10 uW on range 1 and a decade per range
+            r = int(np.clip(np.ceil(np.log10(max(value, 1e-12)/1e-5)) + 1, 1, 5))
+        else:
+            r = int(rng)
+
+        if mode == "A":
+            status = "P" if value > 0 else "Q"
+            valueStr = "{:.2E}".format(abs(value))
+        else:
+            dBm = 10*np.log10(max(value, 1e-12)/1e-3)
+            status = "P"
+            valueStr = "{:08.2f}".format(abs(dBm))
+            value = dBm
+        sign = "-" if value < 0 else " "
+        return ["{}{}{}{}{}".format(status, self._ranges[r], mode, sign, valueStr)]
+
+
+class SimSource(SimInstrument):
+    """SCPI signal source, covering the commands used by the HP83630A and HMCT2240 drivers"""
+    idn = "LabEquipment,SimSource,0,SIM"
+
+    def __init__(self, bench, config):
+        super().__init__(bench, config)
+        self.settings = {
+            "FREQ":1.0e10,
+            "FREQ:STAR":2.0e9,
+            "FREQ:STOP":2.0e10,
+            "FREQ:CENT":1.1e10,
+            "FREQ:SPAN":1.8e10,
+            "FREQ:STEP":1.0e6,
+            "FREQ:MODE":"CW",
+            "POW":0.0,
+            "POW:STAT":0,
+        }
+
+    def output(self):
+        """Return True if the RF output is on"""
+        return bool(self.settings["POW:STAT"])
+
+    def handle(self, cmd):
+        words = cmd.split(None, 1)
+        if not words:
+            return []
+        key = words[0].upper()
+        arg = words[1].strip() if len(words) > 1 else ""
+
+        if key == "*IDN?":
+            return [self.idn]
+        if key in ["OUTP", "OUTP:STAT"]:
+            key = "POW:STAT"
+        elif key in ["OUTP?", "OUTP:STAT?"]:
+            key = "POW:STAT?"
+
+        if key.endswith("?"):
+            key = key[:-1]
+            if key not in self.settings:
+                return []
+            value = self.settings[key]
+            if key == "POW:STAT":
+                return ["{:d}".format(int(value))]
+            elif isinstance(value, str):
+                return [value]
+            return ["{:.10g}".format(value)]
+
+        if key == "POW:STAT":
+            self.settings[key] = int(arg.upper() in ["1", "ON"])
+        elif key == "FREQ:MODE":
+            self.settings[key] = arg.upper()
+        elif key in self.settings:
+            self.settings[key] = float(arg)
+        # SYST:COMM:GTL etc. are accepted without effect
+        return []
+
+
+class SimHP83630A(SimSource):
+    idn = "HEWLETT-PACKARD,83630A,0,SIM"
+
+
+class SimHMCT2240(SimSource):
+    idn = "Hittite,HMC-T2240,0,SIM"
+
+
+models = {
+    "HP8508A":SimHP8508A,
+    "HP436A":SimHP436A,
+    "HP83630A":SimHP83630A,
+    "HMCT2240":SimHMCT2240,
+    "MSL":SimMSL,
+}
+
+
+class SimBench(object):
+    """The simulated instruments and stages, with the beam that couples them"""
+    def __init__(self, config=None, configFile=None, verbose=False):
+        self.verbose = verbose
+
+        self.config = None
+        self.setConfig(_default_VisaSim_config.defaultConfig)
+
+        if configFile != None:
+            self.setConfig(hjsonConfig.hjsonConfig(filename=configFile, verbose=verbose))
+
+        if config != None:
+            self.setConfig(config)
+
+    def setConfig(self, config):
+        """Merge a new config into the existing config, and rebuild the instruments"""
+        self.config = hjsonConfig.merge(self.config, config)
+        self._applyConfig()
+
+    def _applyConfig(self):
+        self.rng = np.random.default_rng(self.config["seed"])
+        self.timeoutWait = self.config["timeout-wait"]
+        self.stages = {name:SimStage(c) for name, c in self.config["stages"].items()}
+
+        self.instruments = collections.OrderedDict()
+        self.names = {}
+        for name, c in self.config["instruments"].items():
+            try:
+                model = models[c["model"]]
+            except KeyError:
+                raise ValueError("VisaSim: Unknown instrument model {} for {}".format(c["model"], name))
+            self.instruments[_resourceKey(name)] = model(self, c)
+            self.names[_resourceKey(name)] = name
+            if self.verbose:
+                print("VisaSim: {} on {}".format(c["model"], name))
+
+        beam = self.config["beam"]
+        self.beamStages = (self.stages[beam["x-stage"]], self.stages[beam["y-stage"]])
+        self.beamCenter = np.array(beam["center"], dtype=float)
+        self.beamWaist = beam["waist"]
+        self.beamPeak = 10**(beam["peak"]/20)
+        self.beamPhase = np.radians(beam["phase"])
+        self.beamCurvature = np.radians(beam["curvature"])
+        self.beamNoise = beam["noise"]
+
+    def instrument(self, name):
+        """Return the instrument for resource name"""
+        try:
+            return self.instruments[_resourceKey(name)]
+        except KeyError:
+            raise _ioError("VisaSim: No instrument at {}".format(name))
+
+    def transmission(self, samples=1):
+        """Complex transmission through the beam at the current stage positions,
+        averaged over samples readings"""
+        t = time.monotonic()
+        pos = np.array([s.mechanical(t) for s in self.beamStages])
+        r2 = np.sum((pos - self.beamCenter)**2)/self.beamWaist**2
+        value = self.beamPeak*np.exp(-r2)*np.exp(1j*(self.beamPhase + self.beamCurvature*r2))
+
+        noise = self.beamNoise*self.beamPeak/np.sqrt(2*samples)
+        return value + noise*complex(self.rng.standard_normal(), self.rng.standard_normal())
+
+
+class SimResource(object):
+    """A simulated pyvisa message based resource, connected to a SimInstrument"""
+    def __init__(self, resource_name, instrument, bench, **kwargs):
+        self.resource_name = resource_name
+        self.instrument = instrument
+        self.bench = bench
+        self.read_termination = None
+        self.write_termination = "\r\n"
+        self.timeout = 2000
+        # Accept serial settings etc. as attributes, as pyvisa would
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+        self._responses = collections.deque()
+
+    def write(self, message, termination=None, encoding=None):
+        """Send message to the instrument, waiting for the command latency.
+
+        Responses not yet read are discarded, as they would otherwise be
+        returned for the wrong command"""
+        message = message.strip()
+        delay = self.instrument.latency(message)
+        with self.instrument.lock:
+            responses = self.instrument.handle(message)
+        if delay > 0:
+            time.sleep(delay)
+        self._responses.clear()
+        self._responses.extend(responses)
+        if termination == None:
+            termination = self.write_termination or ""
+        return len(message) + len(termination)
+
+    def read(self, termination=None, encoding=None):
+        """Return the next response line from the instrument"""
+        try:
+            return self._responses.popleft()
+        except IndexError:
+            if self.bench.timeoutWait and self.timeout != None:
+                time.sleep(self.timeout/1000)
+            raise _ioError("VisaSim: Timeout reading from {}".format(self.resource_name))
+
+    def query(self, message, delay=None):
+        self.write(message)
+        if delay:
+            time.sleep(delay)
+        return self.read()
+
+    def clear(self):
+        self._responses.clear()
+
+    def close(self):
+        self._responses.clear()
+
+
+class ResourceManager(object):
+    """Stand in for pyvisa.ResourceManager that opens simulated resources"""
+    def __init__(self, bench=None, config=None, verbose=False):
+        if bench == None:
+            bench = defaultBench(config=config, verbose=verbose)
+        self.bench = bench
+
+    def list_resources(self, query="?*::INSTR"):
+        return tuple(self.bench.names.values())
+
+    def open_resource(self, resource_name, **kwargs):
+        instrument = self.bench.instrument(resource_name)
+        return SimResource(resource_name, instrument, self.bench, **kwargs)
+
+    def close(self):
+        pass
+
+
+_bench = None
+
+def defaultBench(config=None, verbose=False):
+    """Return the bench shared by ResourceManagers in this process, creating it if needed"""
+    global _bench
+    if _bench == None:
+        _bench = SimBench(config=config, verbose=verbose)
+    elif config != None:
+        _bench.setConfig(config)
+    return _bench
+
+
+class _SocketHandler(socketserver.StreamRequestHandler):
+    """Pass lines from a socket connection to a simulated resource, and write back the responses"""
+    def handle(self):
+        res = SimResource(self.server.resource_name, self.server.instrument, self.server.bench, timeout=None)
+        term = self.server.instrument.termination.encode()
+        for line in self.rfile:
+            line = line.decode(errors="replace").strip()
+            if line == "":
+                continue
+            res.write(line)
+            while res._responses:
+                self.wfile.write(res._responses.popleft().encode() + term)
+            self.wfile.flush()
+
+
+class _SocketServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(bench=None, host="localhost", port=5025, verbose=True):
+    """Serve each instrument on the bench as a TCP socket resource, on consecutive ports from port.
+
+    Returns the list of servers, each running in a daemon thread"""
+    if bench == None:
+        bench = defaultBench()
+    servers = []
+    for i, (key, instrument) in enumerate(bench.instruments.items()):
+        server = _SocketServer((host, port+i), _SocketHandler)
+        server.resource_name = bench.names[key]
+        server.instrument = instrument
+        server.bench = bench
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        if verbose:
+            print("{:s} ({:s}) on TCPIP0::{:s}::{:d}::SOCKET".format(bench.names[key], instrument.config["model"], host, port+i))
+    return servers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve simulated VISA instruments over TCP sockets")
+    parser.add_argument("--host", default="localhost", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=5025, help="Port for the first instrument")
+    parser.add_argument("--config", default=None, help="hjson file overriding the VisaSim-default config")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    bench = SimBench(configFile=args.config, verbose=args.verbose)
+    servers = serve(bench, args.host, args.port)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for s in servers:
+            s.shutdown()
+        sys.exit(0)
@@ -0,0 +1,17 @@
+# creates a default configuration for the simulated VISA instruments
+
+from LabEquipment.lib import hjsonConfig
+from pkg_resources import resource_filename
+from pprint import pprint
+
+verbose=False
+
+filename = resource_filename("LabEquipment", "config/VisaSim-default.hjson")
+
+if verbose:
+    print("_default_VisaSim_config: reading defaultConfig from {:s}".format(filename))
+defaultConfig = hjsonConfig.hjsonConfig(filename=filename, verbose=verbose)
+
+if verbose:
+    print("_default_VisaSim_config: Got defaultConfig:")
+    pprint(defaultConfig)
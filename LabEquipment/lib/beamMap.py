@@ -0,0 +1,240 @@
+#! /usr/bin/env python
+"""Loading of Beamscanner maps for plotting and post processing, from the CSV,
+NPZ and HDF5 files written by Beamscanner.spreadsheet(), the older text files
+of time, position, amplitude and phase, or a MapStore directory.
+
+Text files are parsed in one pass into a structured array of points, which is
+cached in a .npy file next to the data file, so that they are only parsed again
+when they change.  MapGrid puts the values of a map onto a regular grid for
+contour plots"""
+from __future__ import print_function, division
+
+import os
+
+import numpy as np
+from scipy.spatial import Delaunay
+
+from LabEquipment.lib import dataFile
+from LabEquipment.lib import mapStore
+
+# Fields of the points of a map.  x and y are in mm, amp in dB and phase in degrees
+dtype = np.dtype([("x", float), ("y", float), ("amp", float), ("phase", float), ("time", float),
+                  ("trans", complex), ("cal", complex)])
+
+# Extension added to the name of a text file for its cache of parsed points
+cacheExtension = ".npy"
+
+
+def load(filename, cache=True):
+    """Load the map in filename, a Beamscanner data file or MapStore directory,
+    and return it as a BeamMap.
+
+    If cache is True, the points of a text file are kept in the file
+    filename + cacheExtension, which is used instead of parsing the file again
+    while the file's modification time is unchanged"""
+    if os.path.isdir(filename):
+        return BeamMap(readStore(filename))
+    if dataFile.formatFor(filename) != "csv":
+        columns, attrs = dataFile.read(filename)
+        return BeamMap(fromColumns(columns))
+    if not cache:
+        return BeamMap(readText(filename))
+
+    mtime = os.stat(filename).st_mtime_ns
+    cacheFile = filename + cacheExtension
+    try:
+        if os.stat(cacheFile).st_mtime_ns == mtime:
+            points = np.load(cacheFile, mmap_mode="r")
+            if points.dtype == dtype:
+                return BeamMap(points)
+    except (OSError, ValueError):
+        pass
+
+    points = readText(filename)
+    try:
+        np.save(cacheFile, points)
+        # Key the cache by giving it the modification time of the data file
+        os.utime(cacheFile, ns=(os.stat(cacheFile).st_atime_ns, mtime))
+    except OSError:
+        pass
+    return BeamMap(points)
+
+
+def readText(filename):
+    """Parse a Beamscanner text file, and return a structured array of its points.
+
+    Files written by Beamscanner.spreadsheet() have the columns x, y, the real
+    and imaginary parts of trans and cal, and time.  Older files have a line of
+    headings, then the columns time, x, y, amplitude in dB and phase in degrees"""
+    with open(filename, "r") as f:
+        text = f.read().replace(",", " ")
+    # Skip comments, headings and blank lines before the data
+    start = 0
+    columns = 0
+    while start < len(text):
+        end = text.find("\n", start)
+        if end < 0:
+            end = len(text)
+        try:
+            columns = len([float(v) for v in text[start:end].split()])
+        except ValueError:
+            columns = 0
+        if columns > 0:
+            break
+        start = end + 1
+    values = np.fromstring(text[start:], sep=" ") if columns > 0 else np.empty(0)
+    if columns == 0 or values.size % columns != 0:
+        raise ValueError("beamMap: {:s} isn't a table of numbers".format(filename))
+    values = values.reshape(-1, columns)
+
+    if columns == 7:
+        return fromColumns({"x":values[:,0], "y":values[:,1], "trans":values[:,2] + 1j*values[:,3],
+                            "cal":values[:,4] + 1j*values[:,5], "time":values[:,6]})
+    if columns == 5:
+        return fromColumns({"time":values[:,0], "x":values[:,1], "y":values[:,2],
+                            "amp":values[:,3], "phase":values[:,4]})
+    raise ValueError("beamMap: {:s} has {:d} columns, expected 5 or 7".format(filename, columns))
+
+
+def readStore(path):
+    """Return a structured array of the measured points of the MapStore in the
+    directory path"""
+    store = mapStore.MapStore.open(path, mode="r")
+    try:
+        done = np.asarray(store.done, dtype=bool)
+        convFactor = store.attrs.get("config", {}).get("conv_factor") or 1.0
+        return fromColumns({"x":store["x"][done]/convFactor, "y":store["y"][done]/convFactor,
+                            "trans":store["trans"][done], "cal":store["cal"][done], "time":store["time"][done]})
+    finally:
+        store.close()
+
+
+def fromColumns(columns):
+    """Return a structured array of points from a dict of columns of x, y, time
+    and either trans, as complex values, or amp and phase.  cal is optional"""
+    x = np.ravel(columns["x"])
+    points = np.empty(len(x), dtype=dtype)
+    points["x"] = x
+    points["y"] = np.ravel(columns["y"])
+    points["time"] = np.ravel(columns["time"])
+    if "trans" in columns:
+        points["trans"] = np.ravel(columns["trans"])
+        with np.errstate(divide="ignore"):
+            points["amp"] = 20*np.log10(np.abs(points["trans"]))
+        points["phase"] = np.rad2deg(np.angle(points["trans"]))
+    else:
+        points["amp"] = np.ravel(columns["amp"])
+        points["phase"] = np.ravel(columns["phase"])
+        points["trans"] = 10**(points["amp"]/20)*np.exp(1j*np.deg2rad(points["phase"]))
+    points["cal"] = np.ravel(columns["cal"]) if "cal" in columns else np.nan
+    return points
+
+
+def group(key, along):
+    """Returns the distinct values of key, the order of the points sorted by key
+    and then along, and the index in the order of the first point with each
+    value of key, followed by the number of points"""
+    order = np.lexsort((along, key))
+    values, start = np.unique(key[order], return_index=True)
+    return values, order, np.append(start, len(order))
+
+
+class BeamMap(object):
+    """The points of a map, as the structured array points with the fields in
+    dtype, and the rows and columns of the points that share a y or x position.
+
+    Each field is also available as map[name].  Rows and columns are indexed
+    from the lowest position, and their points are sorted along them"""
+    def __init__(self, points):
+        self.points = points
+        self.yPos, self._rowOrder, self._rowStart = group(points["y"], points["x"])
+        self.xPos, self._columnOrder, self._columnStart = group(points["x"], points["y"])
+        self._grid = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def __getitem__(self, name):
+        return self.points[name]
+
+    def row(self, j):
+        """Returns the points of row j, at y position yPos[j], sorted by x"""
+        return self.points[self._rowOrder[self._rowStart[j]:self._rowStart[j+1]]]
+
+    def column(self, i):
+        """Returns the points of column i, at x position xPos[i], sorted by y"""
+        return self.points[self._columnOrder[self._columnStart[i]:self._columnStart[i+1]]]
+
+    def nearestRow(self, y):
+        """Returns the points of the row nearest to the y position y"""
+        return self.row(int(np.argmin(np.abs(self.yPos - y))))
+
+    def nearestColumn(self, x):
+        """Returns the points of the column nearest to the x position x"""
+        return self.column(int(np.argmin(np.abs(self.xPos - x))))
+
+    def byTime(self):
+        """Returns the points in the order they were measured"""
+        return self.points[np.argsort(self.points["time"], kind="stable")]
+
+    def grid(self):
+        """Returns the MapGrid of the positions of the points"""
+        if self._grid == None:
+            self._grid = MapGrid(self.points["x"], self.points["y"])
+        return self._grid
+
+
+class MapGrid(object):
+    """Places the values of a map, measured at the positions x, y, onto a regular
+    grid, for contour plots of any number of quantities measured at the same
+    positions.
+
+    If the positions are a complete raster, with every x position at every y
+    position, the values are just reordered onto it.  Otherwise the positions
+    are triangulated once, and the values interpolated linearly, as by
+    scipy.interpolate.griddata, onto a grid with about oversample*sqrt(points)
+    points on each side, and no more than maxSide.  Grid points outside the
+    positions are NaN"""
+    def __init__(self, x, y, oversample=4, maxSide=1000):
+        x = np.array(x, dtype=float).ravel()
+        y = np.array(y, dtype=float).ravel()
+        self.x = x
+        self.y = y
+        self.size = len(x)
+        yPos, order, start = group(y, x)
+        xPos = np.unique(x)
+
+        self.regular = len(xPos)*len(yPos) == len(x) and np.array_equal(x[order], np.tile(xPos, len(yPos)))
+        if self.regular:
+            # Sorted by y then x, a complete raster is the grid in row order
+            self.index = order.reshape(len(yPos), len(xPos))
+            self.xi, self.yi = np.meshgrid(xPos, yPos)
+            return
+
+        side = int(np.clip(oversample*np.sqrt(len(x)), 2, maxSide))
+        self.xi, self.yi = np.meshgrid(np.linspace(x.min(), x.max(), side), np.linspace(y.min(), y.max(), side))
+        gridPts = np.column_stack((self.xi.ravel(), self.yi.ravel()))
+
+        # Find the triangle each grid point is in, and its barycentric weights
+        tri = Delaunay(np.column_stack((x, y)))
+        simplex = tri.find_simplex(gridPts)
+        self.outside = simplex < 0
+        transform = tri.transform[simplex]
+        b = np.einsum("ijk,ik->ij", transform[:,:2], gridPts - transform[:,2])
+        self.vertices = tri.simplices[simplex]
+        self.weights = np.column_stack((b, 1 - b.sum(axis=1)))
+
+    def matches(self, x, y):
+        """Returns True if the grid was made for the positions x, y"""
+        return np.size(x) == self.size and np.array_equal(np.ravel(x), self.x) and np.array_equal(np.ravel(y), self.y)
+
+    def __call__(self, values):
+        """Returns the values, given in the order of the positions, on the grid"""
+        values = np.ravel(values)
+        if len(values) != self.size:
+            raise ValueError("beamMap: Expected {:d} values, got {:d}".format(self.size, len(values)))
+        if self.regular:
+            return values[self.index]
+        zi = np.einsum("ij,ij->i", values[self.vertices], self.weights)
+        zi[self.outside] = np.nan
+        return zi.reshape(self.xi.shape)
@@ -0,0 +1,183 @@
+#! /usr/bin/env python
+"""Columnar output of sweep and scan results, to CSV text files, or to NPZ or
+HDF5 files that keep each result array as a typed column, along with the
+config and instruments that produced it"""
+from __future__ import print_function, division
+
+import os
+import json
+import time
+import collections
+
+import numpy as np
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+# The formats that can be written, and the file extensions that select them
+formats = ("csv", "npz", "hdf5")
+extensions = {".npz":"npz", ".h5":"hdf5", ".hdf5":"hdf5", ".hdf":"hdf5"}
+
+# Name of the NPZ entry that holds the attributes
+_npzAttrs = "__attrs__"
+# Name of the HDF5 attribute listing the attributes stored as JSON text
+_jsonAttrs = "__json__"
+
+
+def formatFor(filename, fmt=None):
+    """Return the format to write filename in - fmt if it is given, otherwise
+    the format selected by the file extension, or "csv" for any other extension"""
+    if fmt == None:
+        fmt = extensions.get(os.path.splitext(filename)[1].lower(), "csv")
+    if fmt not in formats:
+        raise ValueError("dataFile: Unknown format {}, expected one of {}".format(fmt, ", ".join(formats)))
+    return fmt
+
+
+def timestamp(t=None):
+    """Return the time t in seconds since the epoch, or now, as an ISO 8601 string"""
+    if t == None:
+        t = time.time()
+    return time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(t))
+
+
+def jsonDefault(value):
+    """Convert the numpy values found in configs to JSON types"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError("dataFile: Can't store {!r} as JSON".format(value))
+
+
+def write(filename, columns, attrs=None, fmt=None, compress=True, header=None, csvFormat="%.6g", delimiter=",\t"):
+    """Write the columns, a list of (name, array) pairs or a dict, to filename.
+
+    fmt selects the format, as for formatFor().  In NPZ and HDF5 files each
+    array is kept with its own dtype and shape, compressed if compress is set,
+    and attrs, a dict of the config, instrument IDs, timestamps etc., is stored
+    with the data.  Values of attrs that are dicts or lists are stored as JSON.
+
+    CSV files are written with np.savetxt, with one line of header, in
+    csvFormat.  Arrays are flattened, and complex arrays written as real and
+    imaginary columns.  attrs is not written to CSV files"""
+    columns = collections.OrderedDict(columns)
+    attrs = attrs or {}
+    fmt = formatFor(filename, fmt)
+    if fmt == "csv":
+        writeCSV(filename, columns, header, csvFormat, delimiter)
+    elif fmt == "npz":
+        writeNPZ(filename, columns, attrs, compress)
+    else:
+        writeHDF5(filename, columns, attrs, compress)
+
+
+def writeCSV(filename, columns, header=None, csvFormat="%.6g", delimiter=",\t"):
+    """Write the columns to a CSV file.  filename may also be a file opened for
+    writing, to append the columns to"""
+    data = []
+    for name, column in collections.OrderedDict(columns).items():
+        column = np.ravel(column)
+        if np.iscomplexobj(column):
+            data.extend((column.real, column.imag))
+        else:
+            data.append(column)
+    if header == None:
+        header = ""
+    np.savetxt(filename, np.transpose(data), fmt=csvFormat, delimiter=delimiter, header=header)
+
+
+def writeNPZ(filename, columns, attrs, compress=True):
+    """Write the columns to an NPZ file, with attrs as JSON text in the
+    __attrs__ entry"""
+    arrays = {name:np.asarray(column) for name, column in columns.items()}
+    arrays[_npzAttrs] = np.array(json.dumps(attrs, default=jsonDefault))
+    # Write through a file object, so that np.savez doesn't add a .npz extension
+    with open(filename, "wb") as f:
+        if compress:
+            np.savez_compressed(f, **arrays)
+        else:
+            np.savez(f, **arrays)
+
+
+def writeHDF5(filename, columns, attrs, compress=True):
+    """Write the columns to an HDF5 file, as chunked datasets in the root group,
+    with attrs as attributes of the file"""
+    if h5py == None:
+        raise RuntimeError("dataFile: h5py is needed to write HDF5 files")
+    with h5py.File(filename, "w", track_order=True) as f:
+        for name, column in columns.items():
+            column = np.asarray(column)
+            if column.size > 1 and compress:
+                f.create_dataset(name, data=column, chunks=True, compression="gzip", shuffle=True)
+            else:
+                f.create_dataset(name, data=column)
+        jsonNames = []
+        for name, value in attrs.items():
+            if isinstance(value, (dict, list, tuple)) or value is None:
+                value = json.dumps(value, default=jsonDefault)
+                jsonNames.append(name)
+            f.attrs[name] = value
+        f.attrs[_jsonAttrs] = json.dumps(jsonNames)
+
+
+def read(filename, fmt=None):
+    """Read an NPZ or HDF5 file written by write(), and return its columns, as
+    an ordered dict of arrays, and its attrs"""
+    fmt = formatFor(filename, fmt)
+    if fmt == "npz":
+        return readNPZ(filename)
+    if fmt == "hdf5":
+        return readHDF5(filename)
+    raise ValueError("dataFile: Can only read npz and hdf5 files, not {}".format(fmt))
+
+
+def readNPZ(filename):
+    """Read the columns and attrs of an NPZ file"""
+    columns = collections.OrderedDict()
+    attrs = {}
+    with np.load(filename, allow_pickle=False) as f:
+        for name in f.files:
+            if name == _npzAttrs:
+                attrs = json.loads(f[name][()])
+            else:
+                columns[name] = f[name]
+    return columns, attrs
+
+
+def readHDF5(filename):
+    """Read the columns and attrs of an HDF5 file"""
+    if h5py == None:
+        raise RuntimeError("dataFile: h5py is needed to read HDF5 files")
+    columns = collections.OrderedDict()
+    with h5py.File(filename, "r") as f:
+        for name in f:
+            columns[name] = f[name][()]
+        attrs = dict(f.attrs)
+    jsonNames = json.loads(attrs.pop(_jsonAttrs, "[]"))
+    for name in jsonNames:
+        attrs[name] = json.loads(attrs[name])
+    return columns, attrs
+
+
+def exportCSV(filename, csvFilename, header=None, csvFormat="%.6g", delimiter=",\t"):
+    """Export the columns of an NPZ or HDF5 file to a CSV file"""
+    columns, attrs = read(filename)
+    writeCSV(csvFilename, columns, header, csvFormat, delimiter)
+
+
+def instrumentID(instrument):
+    """Return a description of instrument to store with the data, made without
+    talking to it - its class and VISA resource name, and its model and serial
+    number where the driver has already read them"""
+    ident = type(instrument).__name__
+    resource = getattr(getattr(instrument, "resource", None), "resource_name", None)
+    if resource:
+        ident += "({})".format(resource)
+    for attr in ("_model", "_serial"):
+        value = getattr(instrument, attr, None)
+        if value:
+            ident += " {}".format(value)
+    return ident
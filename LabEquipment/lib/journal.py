@@ -0,0 +1,149 @@
+#! /usr/bin/env python
+"""Append only journal of the data of a sweep, written as each point or block
+of points is acquired, so that an interrupted sweep can be resumed from the
+points already measured"""
+from __future__ import print_function, division
+
+import os
+import json
+import time
+
+import numpy as np
+
+from LabEquipment.lib import dataFile
+
+# First field of the header line of a journal file
+magic = "LabEquipment sweep journal"
+version = 1
+
+
+class SweepJournal(object):
+    """A journal file of the rows of data of a sweep.
+
+    The file starts with a line of JSON giving the column names, the sweep
+    points and any attributes, such as the config.  Each block of points is
+    then appended as binary records of the point index and the float64 value
+    of each column.  Records are written straight to the file, so that they
+    survive the program being stopped, and are flushed to the disk with fsync
+    after every syncEvery appends, or syncInterval seconds, whichever is first.
+
+    Use create() to start a journal, and open() to continue one.  A partly
+    written record at the end of the file is dropped when it is opened"""
+    def __init__(self, filename, header, offset, syncEvery=10, syncInterval=5.0):
+        self.filename = filename
+        self.header = header
+        self.offset = offset
+        self.syncEvery = syncEvery
+        self.syncInterval = syncInterval
+        self.dtype = np.dtype([("index", "<i8"), ("values", "<f8", (len(self.columns),))])
+
+        self.file = open(filename, "ab", buffering=0)
+        self._unsynced = 0
+        self._lastSync = time.monotonic()
+
+    @classmethod
+    def create(cls, filename, columns, sweepPts, attrs=None, syncEvery=10, syncInterval=5.0):
+        """Start a new journal in filename, replacing any file already there, for
+        the data columns named in columns at each of sweepPts"""
+        header = {
+            "journal":magic,
+            "version":version,
+            "columns":list(columns),
+            "sweep":np.asarray(sweepPts, dtype=float).tolist(),
+            "attrs":attrs or {},
+        }
+        line = (json.dumps(header, default=dataFile.jsonDefault) + "\n").encode("utf-8")
+        with open(filename, "wb") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        return cls(filename, header, len(line), syncEvery, syncInterval)
+
+    @classmethod
+    def open(cls, filename, syncEvery=10, syncInterval=5.0):
+        """Open the existing journal in filename to read it and append to it"""
+        with open(filename, "rb") as f:
+            line = f.readline()
+        try:
+            header = json.loads(line.decode("utf-8"))
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or header.get("journal") != magic:
+            raise ValueError("journal: {:s} is not a sweep journal".format(filename))
+        if header.get("version") != version:
+            raise ValueError("journal: {:s} is version {}, expected {}".format(filename, header.get("version"), version))
+
+        journal = cls(filename, header, len(line), syncEvery, syncInterval)
+        # Drop any partly written record, so that new records line up
+        size = os.path.getsize(filename)
+        complete = journal.offset + journal.records()*journal.dtype.itemsize
+        if complete < size:
+            journal.file.truncate(complete)
+        return journal
+
+    @property
+    def columns(self):
+        """The names of the data columns"""
+        return self.header["columns"]
+
+    @property
+    def sweepPts(self):
+        """The points of the sweep"""
+        return np.array(self.header["sweep"])
+
+    @property
+    def attrs(self):
+        """The attributes stored when the journal was created"""
+        return self.header["attrs"]
+
+    def records(self):
+        """Returns the number of complete records in the journal"""
+        return (os.path.getsize(self.filename) - self.offset)//self.dtype.itemsize
+
+    def append(self, start, rows):
+        """Append rows, an array with a row of column values for each of the
+        points from start on, to the journal"""
+        rows = np.atleast_2d(np.asarray(rows, dtype=float))
+        records = np.empty(len(rows), dtype=self.dtype)
+        records["index"] = np.arange(start, start + len(rows))
+        records["values"] = rows
+        self.file.write(records.tobytes())
+
+        self._unsynced += 1
+        if self._unsynced >= self.syncEvery or time.monotonic() - self._lastSync >= self.syncInterval:
+            self.sync()
+
+    def sync(self):
+        """Flush the records appended so far to the disk"""
+        os.fsync(self.file.fileno())
+        self._unsynced = 0
+        self._lastSync = time.monotonic()
+
+    def read(self):
+        """Returns the indices of the points in the journal, and an array of their
+        rows of column values.  If a point was recorded more than once, the last
+        record of it is returned"""
+        records = np.fromfile(self.filename, dtype=self.dtype, count=self.records(), offset=self.offset)
+        # np.unique finds the first of each index, so search the records backwards
+        indices, last = np.unique(records["index"][::-1], return_index=True)
+        return indices, records["values"][::-1][last]
+
+    def missing(self):
+        """Returns the indices of the sweep points not in the journal"""
+        indices, rows = self.read()
+        return np.setdiff1d(np.arange(len(self.header["sweep"])), indices)
+
+    def firstMissing(self):
+        """Returns the index of the first sweep point not in the journal, or the
+        number of sweep points if they are all there"""
+        missing = self.missing()
+        if len(missing) == 0:
+            return len(self.header["sweep"])
+        return int(missing[0])
+
+    def close(self):
+        """Flush the journal to the disk and close it"""
+        if self.file.closed:
+            return
+        self.sync()
+        self.file.close()
@@ -0,0 +1,406 @@
+#! /usr/bin/env python
+"""Live display of sweeps and maps while they are measured, in a viewer running
+in a separate Python process.
+
+The measuring program keeps the data arrays it is filling in shared memory
+(multiprocessing.shared_memory), or in a MapStore, and the viewer reads them
+directly, redrawing only the data lines and images with blitting, no more than
+fps times a second.  The measuring program does no extra work for each point,
+and never waits for the display.
+
+A MapStore can also be watched from another terminal with
+
+    python -m LabEquipment.lib.liveView --store <map directory>"""
+from __future__ import print_function, division
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+import collections
+from multiprocessing import shared_memory
+from multiprocessing import resource_tracker
+
+import numpy as np
+
+# Alignment of the arrays in the shared memory block
+_align = 64
+# Header of the shared memory block - the viewer's state flags
+_header = np.dtype([("done", "<i8"), ("attached", "<i8")])
+
+
+class SharedArrays(object):
+    """Named numpy arrays laid out in one block of shared memory, after a header
+    of flags used to tell the viewer the measurement is done, and the measuring
+    program that the viewer has attached.
+
+    Use create() in the measuring program and attach() in the viewer"""
+    def __init__(self, shm, layout, owner):
+        self.shm = shm
+        self.layout = layout
+        self.owner = owner
+        self.header = np.ndarray((), dtype=_header, buffer=shm.buf)
+        self.arrays = collections.OrderedDict()
+        for name, dtype, shape, offset in layout:
+            self.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+
+    @classmethod
+    def create(cls, fields):
+        """Create a new block holding a copy of each array in fields, a list of
+        (name, array) pairs"""
+        layout = []
+        offset = _header.itemsize
+        for name, values in fields:
+            values = np.asarray(values)
+            offset = -(-offset//_align)*_align
+            layout.append([name, values.dtype.str, list(values.shape), offset])
+            offset += values.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=offset)
+        shared = cls(shm, layout, owner=True)
+        shared.header[()] = (0, 0)
+        for name, values in fields:
+            shared.arrays[name][...] = values
+        return shared
+
+    @classmethod
+    def attach(cls, name, layout):
+        """Attach to the existing block name, with the arrays in layout"""
+        shm = shared_memory.SharedMemory(name=name)
+        # The block belongs to the measuring program, so don't let this process'
+        # resource tracker remove it when the viewer exits
+        resource_tracker.unregister(shm._name, "shared_memory")
+        shared = cls(shm, layout, owner=False)
+        shared.header["attached"] = 1
+        return shared
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def done(self):
+        return bool(self.header["done"])
+
+    @property
+    def attached(self):
+        return bool(self.header["attached"])
+
+    def setDone(self):
+        self.header["done"] = 1
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def close(self):
+        """Release the block, and remove it if it was created here.  There must
+        be no other references to the arrays"""
+        self.arrays = {}
+        self.header = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class LiveView(object):
+    """A live viewer of data arrays, running in a separate process.
+
+    kind is "lines", to plot the arrays named in panels against the array
+    named x, or "map", to show the amplitude and phase of the complex "trans"
+    array of a map at the positions in the "x" and "y" arrays.  fields is a
+    list of (name, array) pairs of the arrays to show, which are copied into
+    shared memory and should then be filled through this object, as live[name].
+    A map can instead be read from the MapStore in the directory store.
+
+    options are passed on to the viewer:
+
+        title       window title
+        panels      for "lines", a list of lists of the names of the arrays to
+                    plot on each panel
+        labels      dict of axis labels for each array
+        scale       for "map", factor to multiply positions by for display
+
+    Points that haven't been measured should be NaN, or 0 in "trans" arrays"""
+    def __init__(self, kind, fields=(), store=None, fps=10, **options):
+        self.shared = SharedArrays.create(fields)
+        spec = dict(options, kind=kind, shm=self.shared.name, layout=self.shared.layout, store=store, fps=fps)
+        self.process = subprocess.Popen([sys.executable, "-m", "LabEquipment.lib.liveView", "--spec", json.dumps(spec)])
+
+    @property
+    def names(self):
+        return list(self.shared.arrays)
+
+    def __getitem__(self, name):
+        return self.shared[name]
+
+    def close(self, wait=False, timeout=10.0):
+        """Tell the viewer the measurement is done, and release the shared
+        memory.  The viewer keeps showing the final data until its window is
+        closed.  If wait is True, wait for that.
+
+        The arrays must no longer be used.  If the viewer hasn't attached to the
+        shared memory yet, this waits up to timeout seconds for it to"""
+        self.shared.setDone()
+        end = time.monotonic() + timeout
+        while not self.shared.attached and self.process.poll() == None and time.monotonic() < end:
+            time.sleep(0.05)
+        self.shared.close()
+        if wait:
+            self.process.wait()
+
+
+class Display(object):
+    """Blitted display of the arrays of a viewer in a figure.  Subclasses set
+    self.artists, the artists that show the data, and define update()"""
+    def __init__(self, fig):
+        self.fig = fig
+        self.artists = []
+        self.background = None
+        self.last = None
+        fig.canvas.mpl_connect("resize_event", self.invalidate)
+
+    def invalidate(self, event=None):
+        """Redraw the whole figure at the next frame"""
+        self.background = None
+
+    def changed(self, *arrays):
+        """Returns True if the arrays differ from the last time they were drawn"""
+        snapshot = [np.array(a) for a in arrays]
+        if self.last != None and all(np.array_equal(a, b, equal_nan=a.dtype.kind in "fc") for a, b in zip(snapshot, self.last)):
+            return False
+        self.last = snapshot
+        return True
+
+    def draw(self):
+        """Draw the data, blitting them onto the figure if the rest of it hasn't
+        changed since the last frame"""
+        canvas = self.fig.canvas
+        if self.background == None:
+            for artist in self.artists:
+                artist.set_animated(True)
+            canvas.draw()
+            self.background = canvas.copy_from_bbox(self.fig.bbox)
+        else:
+            canvas.restore_region(self.background)
+        for artist in self.artists:
+            self.fig.draw_artist(artist)
+        canvas.blit(self.fig.bbox)
+
+
+class LinesDisplay(Display):
+    """Lines of each array in each panel against the x array"""
+    def __init__(self, fig, arrays, x, panels, labels=None, **options):
+        super().__init__(fig)
+        labels = labels or {}
+        self.arrays = arrays
+        self.x = x
+        self.panels = panels
+        self.axes = fig.subplots(len(panels), 1, sharex=True, squeeze=False)[:,0]
+        self.lines = []
+        for ax, panel in zip(self.axes, panels):
+            for name in panel:
+                line, = ax.plot([], [], '.-', label=labels.get(name, name))
+                self.lines.append((ax, name, line))
+            ax.set(ylabel=labels.get(panel[0], panel[0]) if len(panel) == 1 else None)
+            if len(panel) > 1:
+                ax.legend(loc="best")
+            ax.grid()
+        self.axes[-1].set(xlabel=labels.get(x, x))
+        self.artists = [line for ax, name, line in self.lines]
+        self.xlim = None
+        self.ylims = {}
+
+    def update(self):
+        x = self.arrays[self.x]
+        if not self.changed(x, *[self.arrays[name] for ax, name, line in self.lines]):
+            return
+        xBounds = None
+        yBounds = {}
+        for ax, name, line in self.lines:
+            y = self.arrays[name]
+            ok = np.isfinite(x) & np.isfinite(y)
+            line.set_data(x[ok], y[ok])
+            if np.any(ok):
+                xBounds = _union((x[ok].min(), x[ok].max()), xBounds)
+                yBounds[ax] = _union((y[ok].min(), y[ok].max()), yBounds.get(ax))
+
+        # Only redraw the axes when the data go outside them.  The panels share x
+        if xBounds != None and (self.xlim == None or xBounds[0] < self.xlim[0] or xBounds[1] > self.xlim[1]):
+            self.xlim = _expand(xBounds[0], xBounds[1], self.xlim)
+            self.axes[0].set_xlim(*self.xlim)
+            self.invalidate()
+        for ax, (low, high) in yBounds.items():
+            ylim = self.ylims.get(ax)
+            if ylim == None or low < ylim[0] or high > ylim[1]:
+                self.ylims[ax] = _expand(low, high, ylim)
+                ax.set_ylim(*self.ylims[ax])
+                self.invalidate()
+        self.draw()
+
+
+class MapDisplay(Display):
+    """Images of the amplitude in dB and phase in degrees of a map"""
+    def __init__(self, fig, arrays, done=None, scale=1.0, **options):
+        super().__init__(fig)
+        self.arrays = arrays
+        self.done = done
+        self.scale = scale
+        self.grid = None
+        self.ampLimits = None
+        axAmp, axPhase = fig.subplots(1, 2)
+        self.amp = axAmp.imshow(np.full((2, 2), np.nan), origin="lower", vmin=-1, vmax=0)
+        self.phase = axPhase.imshow(np.full((2, 2), np.nan), origin="lower", vmin=-180, vmax=180, cmap="twilight")
+        fig.colorbar(self.amp, ax=axAmp, label="Amplitude (dB)")
+        fig.colorbar(self.phase, ax=axPhase, label="Phase (deg)")
+        for ax in (axAmp, axPhase):
+            ax.set(xlabel="X Position (mm)", ylabel="Y Position (mm)")
+        self.artists = [self.amp, self.phase]
+
+    def update(self):
+        from LabEquipment.lib import beamMap
+
+        x, y, trans = self.arrays["x"], self.arrays["y"], self.arrays["trans"]
+        done = self.done() if self.done != None else None
+        if not self.changed(trans, y, done if done is not None else 0):
+            return
+        if self.grid == None or not self.grid.matches(x, y):
+            self.grid = beamMap.MapGrid(x, y)
+            # Centre the pixels on the grid points
+            xi, yi = self.grid.xi[0], self.grid.yi[:,0]
+            dx = (xi[-1] - xi[0])/max(len(xi) - 1, 1)/2
+            dy = (yi[-1] - yi[0])/max(len(yi) - 1, 1)/2
+            extent = np.array([xi[0] - dx, xi[-1] + dx, yi[0] - dy, yi[-1] + dy])*self.scale
+            for image in self.artists:
+                image.set_extent(extent)
+                image.axes.set_xlim(extent[:2])
+                image.axes.set_ylim(extent[2:])
+            self.invalidate()
+
+        trans = np.array(trans)
+        measured = trans != 0
+        if done is not None:
+            measured &= done
+        trans[~measured] = np.nan
+        with np.errstate(divide="ignore", invalid="ignore"):
+            amp = self.grid(20*np.log10(np.abs(trans)))
+        phase = self.grid(np.rad2deg(np.angle(trans)))
+        self.amp.set_data(amp)
+        self.phase.set_data(phase)
+
+        # Widen the amplitude scale as needed, redrawing the colorbar
+        if np.any(np.isfinite(amp)):
+            low, high = np.nanmin(amp), np.nanmax(amp)
+            if self.ampLimits == None or low < self.ampLimits[0] or high > self.ampLimits[1]:
+                self.ampLimits = _expand(low, high, self.ampLimits, growth=0.05)
+                self.amp.set_clim(*self.ampLimits)
+                self.invalidate()
+        self.draw()
+
+
+def _union(bounds, other=None):
+    """Returns the (low, high) bounds taking in bounds and other, if it's given"""
+    if other == None:
+        return bounds
+    return min(bounds[0], other[0]), max(bounds[1], other[1])
+
+
+def _expand(low, high, limits=None, margin=0.05, growth=0.5):
+    """Returns the limits of low to high with a margin if limits is None, or
+    otherwise limits widened to take in low to high, with room for the data to
+    grow by a further growth of their span before they need widening again"""
+    if limits == None:
+        span = max(high - low, abs(high)*1e-6, 1e-12)
+        return low - margin*span, high + margin*span
+    span = max(max(high, limits[1]) - min(low, limits[0]), 1e-12)
+    if low < limits[0]:
+        limits = (low - growth*span, limits[1])
+    if high > limits[1]:
+        limits = (limits[0], high + growth*span)
+    return tuple(limits)
+
+
+def run(spec):
+    """Run the viewer described by spec, the dict made by LiveView, until the
+    measurement is done and its window is closed.  Without shared memory, the
+    measurement is done when every cell of the MapStore has been measured"""
+    shared = None
+    store = None
+    arrays = None
+    done = None
+    if spec.get("shm"):
+        shared = SharedArrays.attach(spec["shm"], spec["layout"])
+        arrays = shared.arrays
+    if spec.get("store"):
+        from LabEquipment.lib import mapStore
+        store = mapStore.MapStore.open(spec["store"], mode="r")
+        arrays = store
+        done = lambda: np.array(store.done)
+
+    import matplotlib.pyplot as plt
+
+    options = {k:v for k, v in spec.items() if k not in ("kind", "shm", "layout", "store", "fps", "title")}
+    fig = plt.figure(figsize=(10, 5) if spec["kind"] == "map" else (7, 7), layout="constrained")
+    if spec.get("title"):
+        fig.suptitle(spec["title"])
+        fig.canvas.manager.set_window_title(spec["title"])
+    if spec["kind"] == "map":
+        display = MapDisplay(fig, arrays, done, **options)
+    else:
+        display = LinesDisplay(fig, arrays, **options)
+    interactive = fig.canvas.required_interactive_framework != None
+    if interactive:
+        plt.show(block=False)
+
+    period = 1.0/max(spec.get("fps", 10), 0.1)
+    try:
+        while plt.fignum_exists(fig.number):
+            t0 = time.monotonic()
+            if shared != None:
+                finished = shared.done
+            else:
+                finished = bool(np.all(store.done))
+            display.update()
+            fig.canvas.flush_events()
+            if finished:
+                break
+            time.sleep(max(period - (time.monotonic() - t0), 0.0))
+    finally:
+        display.arrays = None
+        arrays = None
+        if store != None:
+            store.close()
+        if shared != None:
+            shared.close()
+
+    # Keep the final data on the screen until the window is closed
+    if interactive and plt.fignum_exists(fig.number):
+        plt.show()
+
+
+def watchStore(path, fps=10):
+    """Show the map being measured in the MapStore in the directory path, with
+    positions in mm"""
+    from LabEquipment.lib import mapStore
+
+    store = mapStore.MapStore.open(path, mode="r")
+    convFactor = store.attrs.get("config", {}).get("conv_factor") or 1.0
+    store.close()
+    run({"kind":"map", "store":path, "fps":fps, "title":path, "scale":1.0/convFactor})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--spec", help="JSON description of the viewer, made by LiveView")
+    parser.add_argument("--store", help="MapStore directory of a Beamscanner map to watch")
+    parser.add_argument("--fps", type=float, default=10, help="largest number of redraws a second")
+    args = parser.parse_args(argv)
+    if args.spec:
+        run(json.loads(args.spec))
+    elif args.store:
+        watchStore(args.store, args.fps)
+    else:
+        parser.error("one of --spec or --store is needed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#! /usr/bin/env python
+"""Chopped measurements, switching a load or chopper with a DAQ digital
+output while streaming the ADC, and synchronous demodulation of the hot and
+cold load levels from the recorded switching waveform"""
+from __future__ import print_function, division
+
+import time
+
+import numpy as np
+
+
+def choppedScan(daq, channels, rate, bit, hotState, halfPeriod, cycles):
+    """Stream the ADC channels at rate for cycles chopping periods, switching the
+    digital output bit every halfPeriod samples, starting with the hot load.
+
+    The bit is switched as each half period of samples arrives, and the sample
+    at which each switch was made is recorded from the time since the scan
+    started.  Returns (data, reference, switches), where data is an array of
+    shape (samples, len(channels)), reference is an array that is 1 for samples
+    taken with the hot load switched in and -1 for the cold load, and switches
+    is a list of the sample indices of the switches"""
+    low_channel, high_channel = min(channels), max(channels)
+    columns = [c - low_channel for c in channels]
+    blocks = 2*cycles
+    samples = halfPeriod*blocks
+    data = np.empty((samples, len(channels)))
+    reference = np.empty(samples)
+
+    state = int(hotState)
+    daq.DOut(state, channel=bit)
+    switches = [0]
+    levels = [1.0]
+
+    stream = daq.stream(low_channel, high_channel, rate, halfPeriod, max_blocks=blocks)
+    start = None
+    try:
+        for index, block in stream:
+            if start == None:
+                # Estimate the start of the scan from the arrival of the first block
+                start = time.monotonic() - halfPeriod/rate
+            data[index:index+halfPeriod] = block[:, columns]
+            if index + halfPeriod < samples:
+                state = int(not state)
+                daq.DOut(state, channel=bit)
+                switches.append(min(int(round((time.monotonic() - start)*rate)), samples))
+                levels.append(1.0 if state == int(hotState) else -1.0)
+    finally:
+        stream.close()
+        daq.DOut(int(not hotState), channel=bit)
+
+    for s, e, level in zip(switches, switches[1:] + [samples], levels):
+        reference[s:e] = level
+    return data, reference, switches
+
+
+def blankMask(switches, samples, blank):
+    """Return a boolean array that is False for the blank samples after each switch"""
+    keep = np.ones(samples, dtype=bool)
+    for s in switches:
+        keep[s:s+blank] = False
+    return keep
+
+
+def demodulate(signal, reference, keep, rate):
+    """Recover the hot and cold load levels of signal from the reference
+    waveform, using only the samples where keep is True.
+
+    Fits signal = a + b*t + c*reference by least squares, so that a linear
+    drift over the measurement doesn't bias the levels, and returns the levels
+    a + c and a - c at the middle of the measurement, and their standard errors,
+    as (hot, cold, hotErr, coldErr)"""
+    t = np.flatnonzero(keep)/rate
+    t = t - t.mean()
+    A = np.column_stack((np.ones(len(t)), t, reference[keep]))
+    y = signal[keep]
+    coef, residuals, rank, sv = np.linalg.lstsq(A, y, rcond=None)
+    a, b, c = coef
+
+    dof = max(len(y) - 3, 1)
+    cov = np.linalg.pinv(A.T @ A)*np.sum((y - A @ coef)**2)/dof
+    hotErr = np.sqrt(max(cov[0, 0] + cov[2, 2] + 2*cov[0, 2], 0.0))
+    coldErr = np.sqrt(max(cov[0, 0] + cov[2, 2] - 2*cov[0, 2], 0.0))
+    return a + c, a - c, hotErr, coldErr
@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+"""Disk backed storage for maps, keeping each field of the map in a memory
+mapped .npy file, so that maps of any size can be scanned in constant memory,
+and recording which cells have been measured so that a scan can be resumed"""
+from __future__ import print_function, division
+
+import os
+import json
+
+import numpy as np
+
+from LabEquipment.lib import dataFile
+
+# Name of the header file in a map store directory, and its version
+headerName = "map.json"
+version = 1
+
+
+class MapStore(object):
+    """A directory of memory mapped .npy files, one for each field of a map of
+    shape shape, plus a boolean done map of the cells that have been measured.
+
+    The fields are available as memory mapped arrays by name, as store[name],
+    and can be read back with np.load() without this class.  The header file
+    holds the shape, the fields and a dict of attributes such as the scan
+    settings.
+
+    Use create() to start a store, and open() to continue one"""
+    def __init__(self, path, header, mode="r+"):
+        self.path = path
+        self.header = header
+        self.arrays = {}
+        for name, dtype in header["fields"]:
+            self.arrays[name] = np.load(self._file(name), mmap_mode=mode)
+        self.done = np.load(self._file("done"), mmap_mode=mode)
+
+    def _file(self, name):
+        return os.path.join(self.path, "{:s}.npy".format(name))
+
+    @classmethod
+    def create(cls, path, shape, fields, attrs=None):
+        """Create a new store in the directory path, replacing the fields of any
+        store already there, for a map of shape shape.  fields is a list of the
+        (name, dtype) of each field"""
+        os.makedirs(path, exist_ok=True)
+        header = {
+            "version":version,
+            "shape":[int(n) for n in shape],
+            "fields":[[name, np.dtype(dtype).str] for name, dtype in fields],
+            "attrs":attrs or {},
+        }
+        for name, dtype in header["fields"] + [["done", np.dtype(bool).str]]:
+            array = np.lib.format.open_memmap(os.path.join(path, "{:s}.npy".format(name)), mode="w+",
+                                              dtype=dtype, shape=tuple(header["shape"]))
+            del array
+        store = cls(path, header)
+        store.saveHeader()
+        return store
+
+    @classmethod
+    def open(cls, path, mode="r+"):
+        """Open the existing store in the directory path.  mode is "r+" to read
+        and write it, or "r" to read it"""
+        with open(os.path.join(path, headerName), "r") as f:
+            header = json.load(f)
+        if header.get("version") != version:
+            raise ValueError("mapStore: {:s} is version {}, expected {}".format(path, header.get("version"), version))
+        return cls(path, header, mode)
+
+    def saveHeader(self):
+        """Write the header, replacing it atomically"""
+        filename = os.path.join(self.path, headerName)
+        with open(filename + ".tmp", "w") as f:
+            json.dump(self.header, f, indent=2, default=dataFile.jsonDefault)
+        os.replace(filename + ".tmp", filename)
+
+    @property
+    def shape(self):
+        return tuple(self.header["shape"])
+
+    @property
+    def fields(self):
+        """The names of the fields"""
+        return [name for name, dtype in self.header["fields"]]
+
+    @property
+    def attrs(self):
+        return self.header["attrs"]
+
+    def setAttr(self, name, value):
+        """Set the attribute name to value, and save the header"""
+        self.header["attrs"][name] = value
+        self.saveHeader()
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def markDone(self, index):
+        """Mark the cells at index, a flat index, or a tuple of indices or slices
+        into the map, as measured"""
+        if isinstance(index, tuple):
+            self.done[index] = True
+        else:
+            self.done.reshape(-1)[index] = True
+
+    def isDone(self, index):
+        """Returns True if the cells at index, as for markDone(), have all been
+        measured"""
+        if isinstance(index, tuple):
+            return bool(np.all(self.done[index]))
+        return bool(np.all(self.done.reshape(-1)[index]))
+
+    def missing(self):
+        """Returns the flat indices of the cells that haven't been measured"""
+        return np.flatnonzero(~np.asarray(self.done))
+
+    def flush(self):
+        """Flush the fields and the done map to the disk"""
+        for array in self.arrays.values():
+            array.flush()
+        self.done.flush()
+
+    def close(self):
+        """Flush the store to the disk and drop its references to the memory maps"""
+        if self.arrays:
+            self.flush()
+        self.arrays = {}
+        self.done = None
@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+"""Trapezoidal velocity profiles for point to point moves of stepper motor
+stages such as the MDrive motors on the MSL linear slides"""
+from __future__ import print_function, division
+
+import numpy as np
+
+
+class TrapezoidProfile(object):
+    """Velocity profile of a move of <distance> steps, accelerating from velInit
+    to at most velMax steps/s at accel steps/s^2, then decelerating back to
+    velInit at decel steps/s^2.
+
+    Short moves that never reach velMax have a triangular profile."""
+    def __init__(self, distance, velMax, accel, decel=None, velInit=0.0):
+        if decel == None:
+            decel = accel
+        self.distance = distance
+        self.direction = 1.0 if distance >= 0 else -1.0
+        self.velInit = min(abs(velInit), abs(velMax))
+        self.accel = abs(accel)
+        self.decel = abs(decel)
+
+        D = abs(distance)
+        vi = self.velInit
+        vm = abs(velMax)
+
+        # Distance needed to reach velMax and to stop from it
+        dAcc = (vm**2 - vi**2)/(2*self.accel)
+        dDec = (vm**2 - vi**2)/(2*self.decel)
+        if dAcc + dDec > D:
+            # Triangular profile, peaking below velMax
+            vm = np.sqrt(vi**2 + 2*D*self.accel*self.decel/(self.accel + self.decel))
+            dAcc = (vm**2 - vi**2)/(2*self.accel)
+            dDec = D - dAcc
+
+        self.velPeak = vm
+        self.tAccel = (vm - vi)/self.accel
+        self.tDecel = (vm - vi)/self.decel
+        if vm > 0:
+            self.tCruise = (D - dAcc - dDec)/vm
+        else:
+            self.tCruise = 0.0
+        self._dAccel = dAcc
+        self._dCruise = D - dAcc - dDec
+        self.duration = self.tAccel + self.tCruise + self.tDecel
+
+    def position(self, t):
+        """Displacement from the start of the move at time t after the start"""
+        t = np.clip(np.asarray(t, dtype=float), 0.0, self.duration)
+        vi = self.velInit
+        vm = self.velPeak
+
+        t2 = self.tAccel + self.tCruise
+        td = t - t2
+        d = np.where(t < self.tAccel,
+                     vi*t + 0.5*self.accel*t**2,
+                     np.where(t < t2,
+                              self._dAccel + vm*(t - self.tAccel),
+                              self._dAccel + self._dCruise + vm*td - 0.5*self.decel*td**2))
+        return self.direction*d
+
+    def velocity(self, t):
+        """Signed velocity at time t after the start of the move"""
+        t = np.asarray(t, dtype=float)
+        t2 = self.tAccel + self.tCruise
+        v = np.where(t < self.tAccel,
+                     self.velInit + self.accel*t,
+                     np.where(t < t2, self.velPeak, self.velPeak - self.decel*(t - t2)))
+        v = np.where((t < 0) | (t > self.duration), 0.0, v)
+        return self.direction*v
@@ -0,0 +1,147 @@
+#! /usr/bin/env python
+"""Per channel statistics of blocks of ADC samples, used to reduce the samples
+taken at each sweep point to a value and its uncertainty"""
+from __future__ import print_function, division
+
+import numpy as np
+
+# The statistics that can be used as the value of a point
+valueStats = ("mean", "median", "clipped")
+
+
+class PointStats(object):
+    """Statistics of the samples along one axis of a block.
+
+    Each attribute is an array with the shape of the block less the reduced
+    axis, i.e. one element per channel for a (samples, channels) block:
+
+        count       number of samples
+        mean        mean
+        std         sample standard deviation
+        median      median
+        min, max    smallest and largest samples
+        clipped     sigma clipped mean
+        clippedStd  standard deviation of the samples kept by the clipping
+        kept        number of samples kept by the clipping"""
+    def __init__(self, count, mean, std, median, min, max, clipped, clippedStd, kept):
+        self.count = count
+        self.mean = mean
+        self.std = std
+        self.median = median
+        self.min = min
+        self.max = max
+        self.clipped = clipped
+        self.clippedStd = clippedStd
+        self.kept = kept
+
+    @property
+    def stderr(self):
+        """Standard error of the mean"""
+        return self.std/np.sqrt(np.maximum(self.count, 1))
+
+    def value(self, stat="mean"):
+        """Return the statistic named stat, one of valueStats"""
+        if stat not in valueStats:
+            raise ValueError("pointStats: Unknown statistic {}, expected one of {}".format(stat, ", ".join(valueStats)))
+        return getattr(self, stat)
+
+    def error(self, stat="mean"):
+        """Return the standard error of the statistic named stat.
+
+        The standard error of the median is that for normally distributed
+        samples, sqrt(pi/2) times the standard error of the mean"""
+        if stat == "mean":
+            return self.stderr
+        if stat == "median":
+            return np.sqrt(np.pi/2)*self.stderr
+        if stat == "clipped":
+            return self.clippedStd/np.sqrt(np.maximum(self.kept, 1))
+        raise ValueError("pointStats: Unknown statistic {}, expected one of {}".format(stat, ", ".join(valueStats)))
+
+
+def _moments(block, keep, axis):
+    """Return the count, mean and sample standard deviation of the samples in
+    block where keep is True"""
+    n = keep.sum(axis=axis, keepdims=True)
+    mean = np.where(keep, block, 0.0).sum(axis=axis, keepdims=True)/np.maximum(n, 1)
+    dev = np.where(keep, block - mean, 0.0)
+    std = np.sqrt((dev**2).sum(axis=axis, keepdims=True)/np.maximum(n - 1, 1))
+    return n, mean, std
+
+
+def sigmaClip(block, sigma=3.0, iterations=5, axis=0):
+    """Return the (kept, mean, std) of block along axis, after iteratively
+    rejecting samples more than sigma standard deviations from the mean of the
+    samples kept so far"""
+    block = np.asarray(block, dtype=float)
+    keep = np.ones(block.shape, dtype=bool)
+    n, mean, std = _moments(block, keep, axis)
+    for i in range(iterations):
+        newKeep = np.abs(block - mean) <= sigma*std
+        if (newKeep == keep).all():
+            break
+        keep = newKeep
+        n, mean, std = _moments(block, keep, axis)
+    return n.squeeze(axis), mean.squeeze(axis), std.squeeze(axis)
+
+
+def reduce(block, sigma=3.0, iterations=5, axis=0):
+    """Return the PointStats of the samples in block along axis"""
+    block = np.asarray(block, dtype=float)
+    count = np.full(block.shape[:axis] + block.shape[axis+1:], block.shape[axis])
+    kept, clipped, clippedStd = sigmaClip(block, sigma, iterations, axis)
+    return PointStats(count,
+                      block.mean(axis=axis),
+                      block.std(axis=axis, ddof=1) if block.shape[axis] > 1 else np.zeros(count.shape),
+                      np.median(block, axis=axis),
+                      block.min(axis=axis),
+                      block.max(axis=axis),
+                      clipped, clippedStd, kept)
+
+
+def _combine(nA, meanA, stdA, nB, meanB, stdB):
+    """Return the count, mean and standard deviation of the union of two sets of
+    samples, from those of each set"""
+    n = nA + nB
+    delta = meanB - meanA
+    mean = meanA + delta*nB/np.maximum(n, 1)
+    m2 = stdA**2*np.maximum(nA - 1, 0) + stdB**2*np.maximum(nB - 1, 0) + delta**2*nA*nB/np.maximum(n, 1)
+    return n, mean, np.sqrt(m2/np.maximum(n - 1, 1))
+
+
+class StreamingReducer(object):
+    """Accumulates the PointStats of successive blocks of samples, so that
+    the samples never all need to be held at once.
+
+    The count, mean, standard deviation, min and max are exact.  The median is
+    the median of the block medians, and the clipped mean is that of the
+    samples kept by sigma clipping each block, so both approach those of the
+    whole set of samples for large blocks."""
+    def __init__(self, sigma=3.0, iterations=5, axis=0):
+        self.sigma = sigma
+        self.iterations = iterations
+        self.axis = axis
+        self.stats = None
+        self.medians = []
+
+    def add(self, block):
+        """Add the samples in block to the statistics"""
+        s = reduce(block, self.sigma, self.iterations, self.axis)
+        self.medians.append(s.median)
+        if self.stats == None:
+            self.stats = s
+            return
+
+        t = self.stats
+        count, mean, std = _combine(t.count, t.mean, t.std, s.count, s.mean, s.std)
+        kept, clipped, clippedStd = _combine(t.kept, t.clipped, t.clippedStd, s.kept, s.clipped, s.clippedStd)
+        self.stats = PointStats(count, mean, std, None,
+                                np.minimum(t.min, s.min), np.maximum(t.max, s.max),
+                                clipped, clippedStd, kept)
+
+    def result(self):
+        """Return the PointStats of all of the samples added"""
+        if self.stats == None:
+            raise ValueError("pointStats: No samples have been added to the StreamingReducer")
+        self.stats.median = np.median(self.medians, axis=0)
+        return self.stats
@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+"""Detection of the settling of readback signals after an output change, and
+a model of the time taken to settle after steps of different sizes, learnt
+over a sweep"""
+from __future__ import print_function, division
+
+import collections
+
+import numpy as np
+
+
+def blocksAgree(a, b, tolerances, nSigma=3.0):
+    """Return True if the means of the PointStats a and b of two successive
+    blocks of samples agree on every channel.
+
+    The means of a channel agree if they differ by less than its tolerance, or
+    by less than nSigma times the standard error of the difference, so that
+    noise alone doesn't stop a channel from settling.  A channel with a
+    tolerance of None is only tested against the noise"""
+    diff = np.abs(a.mean - b.mean)
+    limit = nSigma*np.hypot(a.stderr, b.stderr)
+    for d, l, t in zip(diff, limit, tolerances):
+        if t != None:
+            l = max(l, t)
+        if d > l:
+            return False
+    return True
+
+
+class SettleModel(object):
+    """Model of the time taken for an output to settle after a step, learnt from
+    the last history settle times measured.
+
+    Fits t = a + b*log(|step|), the form for an output settling exponentially to
+    within a fixed tolerance, by least squares.  Predictions are limited to
+    between minTime and maxTime"""
+    def __init__(self, minTime=0.0, maxTime=1.0, history=50):
+        self.minTime = minTime
+        self.maxTime = maxTime
+        self.observations = collections.deque(maxlen=history)
+
+    def add(self, step, settleTime):
+        """Record that the output took settleTime seconds to settle after a step of
+        size step.  Steps of unknown (None) or zero size are ignored"""
+        if step == None or step == 0:
+            return
+        self.observations.append((np.log(abs(step)), settleTime))
+
+    def predict(self, step):
+        """Return the predicted settle time after a step of size step, or None if
+        it can't be predicted yet"""
+        if step == None or step == 0 or len(self.observations) < 3:
+            return None
+        x, t = np.array(self.observations).T
+        if np.ptp(x) < 1e-6:
+            # All of the steps are the same size, as in a fixed step sweep
+            predicted = np.mean(t)
+        else:
+            b, a = np.polyfit(x, t, 1)
+            predicted = a + b*np.log(abs(step))
+        return float(np.clip(predicted, self.minTime, self.maxTime))
+
+    def clear(self):
+        """Forget the settle times measured so far"""
+        self.observations.clear()
@@ -0,0 +1,40 @@
+#! /usr/bin/env python
+#
+# This code runs the sweep and scan throughput benchmarks against the
+# simulated DAQ and VISA instruments, and saves the results as JSON.
+#
+# Usage: Benchmark.py [--quick] [--case <name>] [--output <results.json>] [--compare <baseline.json>]
+
+from LabEquipment.benchmarks import sweeps
+import sys
+import argparse
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sweep and scan throughput against simulated instruments")
+    parser.add_argument("--case", action="append", choices=[c.name for c in sweeps.cases],
+                        help="Case to run, may be repeated.  Runs all cases by default")
+    parser.add_argument("--quick", action="store_true", help="Run only the smaller sizes of each case")
+    parser.add_argument("--repeats", type=int, default=1, help="Number of timed runs at each size")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced run measuring peak memory")
+    parser.add_argument("--output", default="benchmark.json", help="File to save the JSON results to")
+    parser.add_argument("--compare", default=None, help="Baseline JSON results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Fractional slow down counted as a regression")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the output of the applications")
+    args = parser.parse_args()
+
+    results = sweeps.runBenchmarks(args.case, quick=args.quick, repeats=args.repeats,
+                                   memory=not args.no_memory, verbose=args.verbose)
+    sweeps.printSummary(results)
+    sweeps.save(results, args.output)
+    print("\nResults saved to {:s}".format(args.output))
+
+    if args.compare:
+        regressions = sweeps.compare(results, sweeps.load(args.compare), args.tolerance)
+        for name, size, old, new in regressions:
+            print("REGRESSION: {:s} size {:d}: {:.2f} points/s, baseline {:.2f} points/s".format(name, size, new, old))
+        if regressions:
+            sys.exit(1)
+        print("No regressions against {:s}".format(args.compare))
+
+if __name__ == "__main__":
+    main()
@@ -29,7 +29,8 @@ setup(name='LabEquipment',
                 'LabEquipment/scripts/IVY.py',
                 'LabEquipment/scripts/IFP.py',
                 'LabEquipment/scripts/IFY.py',
-                'LabEquipment/scripts/LoadMover.py'],
+                'LabEquipment/scripts/LoadMover.py',
+                'LabEquipment/scripts/Benchmark.py'],
       entry_points = {
         'console_scripts': ['IV=LabEquipment.scripts.IV:main',
                             'IVP=LabEquipment.scripts.IVP:main',
@@ -37,7 +38,8 @@ setup(name='LabEquipment',
                             'IVY=LabEquipment.scripts.IVY:main',
                             'IFP=LabEquipment.scripts.IFP:main',
                             'IFY=LabEquipment.scripts.IFY:main',
-                            'LoadMover=LabEquipment.scripts.LoadMover:main']
+                            'LoadMover=LabEquipment.scripts.LoadMover:main',
+                            'Benchmark=LabEquipment.scripts.Benchmark:main']
       },
       #test_suite='nose.collector',
       #tests_require=['nose'],